@@ -0,0 +1,202 @@
+#!/bin/env python
+"""
+Benchmark txsplain against a local stand-in for rippled and id.ripple.com.
+
+    bench.py                                # synthetic fixtures
+    bench.py --fixtures recorded.json       # replay a recording
+    bench.py --record recorded.json "SPEC" ...   # record from the live servers
+
+Each scenario is explained --iterations times, with all caches cleared first
+(unless --warm). For each one this reports the median wall time, split into
+time waiting on rippled, time resolving Ripple Names, and everything else
+(rendering); how many RPCs and name lookups it took; and, with
+--allocations, the peak and retained memory of one explanation.
+"""
+
+from __future__ import print_function
+import argparse, json, os, sys, tempfile, threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import txsplain
+import standin, synthetic
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+clock = txsplain.clock
+
+class PhaseTimer(object):
+    """
+    Tracer callback that adds up the wall time spent in each phase, from
+    txsplain's "rpc.*" and "names.*" spans. Only spans on the thread running
+    the benchmark count, so parallel name lookups count once, as the time
+    the explanation spent waiting for them.
+    """
+    PHASES = ("rpc", "names")
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.reset()
+
+    def reset(self):
+        self.totals = dict((phase, 0.0) for phase in self.PHASES)
+
+    def __call__(self, span):
+        if threading.current_thread() is not self.thread:
+            return
+        phase = span.name.split(".")[0]
+        if phase not in self.totals:
+            return
+        parent = span.parent
+        while parent is not None:
+            if parent.name.split(".")[0] == phase:
+                return # already counted as part of its parent
+            parent = parent.parent
+        self.totals[phase] += span.duration
+
+    def install(self):
+        txsplain.set_tracer(txsplain.Tracer(callback=self))
+
+    def uninstall(self):
+        txsplain.set_tracer(txsplain.NullTracer())
+
+def reset_caches():
+    txsplain.known_acts.clear()
+    txsplain.ledger_headers.clear()
+    txsplain.tx_cache.clear()
+    txsplain.explanation_cache.clear()
+    txsplain.invalidate_reserve_constants()
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid-1] + values[mid]) / 2.0
+
+def run_scenario(server, timer, spec, iterations, warm=False):
+    samples = []
+    if warm:
+        txsplain.explain_spec(spec, ctx=txsplain.SplainContext())
+    for i in range(iterations):
+        if not warm:
+            reset_caches()
+        server.reset_stats()
+        timer.reset()
+        start = clock()
+        txsplain.explain_spec(spec, ctx=txsplain.SplainContext())
+        total = clock() - start
+        samples.append({
+            "total": total,
+            "rpc": timer.totals["rpc"],
+            "names": timer.totals["names"],
+            "render": total - timer.totals["rpc"] - timer.totals["names"],
+            "rpc_calls": server.stats["rpc"],
+            "name_lookups": server.stats["names"],
+        })
+    return dict((key, median([sample[key] for sample in samples]))
+                for key in samples[0])
+
+def measure_allocations(spec, warm=False):
+    """
+    Peak and retained traced memory (bytes) of one explanation.
+    """
+    if not warm:
+        reset_caches()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    txsplain.explain_spec(spec, ctx=txsplain.SplainContext())
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"peak_bytes": peak - before, "retained_bytes": current - before}
+
+def record(path, specs):
+    backend = standin.RecordingBackend()
+    standin.start(backend)
+    scenarios = []
+    for spec in specs:
+        args = spec.split()
+        print("Recording %s" % spec, file=sys.stderr)
+        reset_caches()
+        txsplain.explain_spec(args, ctx=txsplain.SplainContext())
+        scenarios.append((spec, args))
+    with open(path, "w") as f:
+        json.dump(backend.fixture(scenarios), f, indent=1)
+    print("Recorded %d RPC responses and %d name lookups to %s" % (
+          len(backend.rpc_calls), len(backend.users), path), file=sys.stderr)
+
+def print_table(results):
+    columns = ["total", "rpc", "names", "render"]
+    print("%-28s %9s %9s %9s %9s %6s %6s %10s" % ("scenario", "total ms",
+          "rpc ms", "names ms", "render ms", "rpcs", "names", "peak KiB"))
+    for name, result in results:
+        if len(name) > 28:
+            name = name[:25] + "..."
+        peak = result.get("peak_bytes")
+        print("%-28s %9.2f %9.2f %9.2f %9.2f %6d %6d %10s" % ((name,) +
+              tuple(result[column]*1000 for column in columns) +
+              (result["rpc_calls"], result["name_lookups"],
+               "-" if peak is None else "%.1f" % (peak / 1024.0))))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark txsplain against a local stand-in server.")
+    parser.add_argument("specs", nargs="*",
+                        help="with --record, what to record (quote each spec)")
+    parser.add_argument("--fixtures", metavar="FILE",
+                        help="replay a recording instead of synthetic fixtures")
+    parser.add_argument("--record", metavar="FILE",
+                        help="record the live servers' responses for specs to FILE")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warm", action="store_true",
+                        help="keep caches between iterations")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="milliseconds the stand-in waits before each response")
+    parser.add_argument("--path-nodes", type=int, default=120,
+                        help="affected nodes in the synthetic path payment")
+    parser.add_argument("--allocations", action="store_true",
+                        help="also measure memory with tracemalloc")
+    parser.add_argument("--json", action="store_true",
+                        help="print results as JSON")
+    args = parser.parse_args()
+
+    if args.record:
+        if not args.specs:
+            exit("Nothing to record.")
+        record(args.record, args.specs)
+        exit()
+
+    if args.fixtures:
+        with open(args.fixtures) as f:
+            fixture = json.load(f)
+        backend = standin.RecordedBackend(fixture)
+        scenarios = fixture["specs"]
+    else:
+        records, names, scenarios = synthetic.generate(path_nodes=args.path_nodes)
+        dump = tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False)
+        dump.close()
+        synthetic.write_dump(records, dump.name)
+        backend = standin.SourceBackend(txsplain.DumpFileSource([dump.name]), names)
+
+    server = standin.start(backend, latency=args.latency / 1000.0)
+    timer = PhaseTimer()
+    timer.install()
+    results = []
+    try:
+        for name, spec in scenarios:
+            result = run_scenario(server, timer, spec, args.iterations, args.warm)
+            if args.allocations:
+                if tracemalloc is None:
+                    exit("tracemalloc isn't available in this Python.")
+                result.update(measure_allocations(spec, args.warm))
+            results.append((name, result))
+    finally:
+        timer.uninstall()
+        if not args.fixtures:
+            os.unlink(dump.name)
+
+    if args.json:
+        print(json.dumps(dict(results), indent=1, sort_keys=True))
+    else:
+        print_table(results)
@@ -0,0 +1,183 @@
+#!/bin/env python
+"""
+Local stand-in for rippled's JSON-RPC API and id.ripple.com, for
+benchmarking txsplain without the network. It answers from one of:
+- a DumpFileSource plus a dict of Ripple Names (synthetic fixtures)
+- a fixture file recorded earlier with --record
+- the real servers, recording everything it forwards (--record)
+
+Both APIs are served on the same port over plain HTTP, so point
+RIPPLED_HOST/RIPPLED_PORT and RIPPLE_ID_HOST/RIPPLE_ID_PORT at it and set
+RIPPLE_ID_HTTPS = False.
+"""
+
+from __future__ import print_function
+import json, sys, os, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import txsplain
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+def rpc_key(method, params):
+    return method + " " + json.dumps(params, sort_keys=True)
+
+# backends ------------------------------
+class SourceBackend(object):
+    """
+    Answers from a txsplain data source and a dict of address -> username
+    (without tilde).
+    """
+    def __init__(self, source, names):
+        self.source = source
+        self.names = names
+        self.addresses = dict((name.lower(), address)
+                              for address, name in names.items())
+
+    def rpc(self, method, params):
+        return self.source.call(method, params)
+
+    def user(self, name_or_address):
+        if name_or_address in self.names:
+            return {"exists": True, "address": name_or_address,
+                    "username": self.names[name_or_address]}
+        address = self.addresses.get(name_or_address.lower())
+        if address:
+            return {"exists": True, "address": address,
+                    "username": self.names[address]}
+        return {"exists": False}
+
+class RecordedBackend(object):
+    """
+    Replays responses recorded by RecordingBackend.
+    """
+    def __init__(self, fixture):
+        self.rpc_results = dict((rpc_key(call["method"], call["params"]),
+                                 call["result"]) for call in fixture["rpc"])
+        self.users = fixture["users"]
+
+    def rpc(self, method, params):
+        key = rpc_key(method, params)
+        if key not in self.rpc_results:
+            print("No recorded response for %s" % key, file=sys.stderr)
+            return {"error": "notRecorded", "status": "error"}
+        return self.rpc_results[key]
+
+    def user(self, name_or_address):
+        return self.users.get(name_or_address, {"exists": False})
+
+class RecordingBackend(object):
+    """
+    Forwards everything to the real rippled and id.ripple.com, and keeps the
+    responses so they can be saved as a fixture.
+    """
+    def __init__(self):
+        self.rpc_calls = {}
+        self.users = {}
+        # remember the real servers before start() points txsplain at us
+        self.source = txsplain.RPCSource(txsplain.RIPPLED_HOST,
+                                         txsplain.RIPPLED_PORT)
+        self.id_host = txsplain.RIPPLE_ID_HOST
+        self.id_port = txsplain.RIPPLE_ID_PORT
+        self.lock = threading.Lock()
+
+    def rpc(self, method, params):
+        result = self.source.call(method, params)
+        with self.lock:
+            self.rpc_calls[rpc_key(method, params)] = {
+                "method": method, "params": params, "result": result}
+        return result
+
+    def user(self, name_or_address):
+        pool = txsplain.get_connection_pool(self.id_host, self.id_port,
+                                            https=True)
+        status, s = pool.request("GET", "/v1/user/%s" % name_or_address)
+        response_json = json.loads(s.decode("utf-8"))
+        with self.lock:
+            self.users[name_or_address] = response_json
+        return response_json
+
+    def fixture(self, specs):
+        return {"specs": specs, "rpc": list(self.rpc_calls.values()),
+                "users": self.users}
+
+# server -------------------------------
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real servers
+    # headers and body go out in separate writes; without this, Nagle's
+    # algorithm and delayed ACKs add ~40ms to every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        command = json.loads(self.rfile.read(
+            int(self.headers["Content-Length"])).decode("utf-8"))
+        method = command["method"]
+        params = command.get("params", [{}])[0]
+        self.server.count("rpc", method)
+        self.server.delay()
+        self.send_json({"result": self.server.backend.rpc(method, params)})
+
+    def do_GET(self):
+        prefix = "/v1/user/"
+        if not self.path.startswith(prefix):
+            self.send_error(404)
+            return
+        self.server.count("names", "user")
+        self.server.delay()
+        self.send_json(self.server.backend.user(self.path[len(prefix):]))
+
+class StandinServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, backend, latency=0, port=0):
+        HTTPServer.__init__(self, ("127.0.0.1", port), StandinHandler)
+        self.backend = backend
+        self.latency = latency # seconds added to every response
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def count(self, kind, name):
+        with self.stats_lock:
+            self.stats[kind] += 1
+            self.stats["methods"][name] = self.stats["methods"].get(name, 0) + 1
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {"rpc": 0, "names": 0, "methods": {}}
+
+def start(backend, latency=0, port=0):
+    """
+    Start a stand-in server on a background thread and point txsplain at it.
+    """
+    server = StandinServer(backend, latency, port)
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+
+    port = server.server_address[1]
+    txsplain.RIPPLED_HOST = txsplain.RIPPLE_ID_HOST = "127.0.0.1"
+    txsplain.RIPPLED_PORT = txsplain.RIPPLE_ID_PORT = port
+    txsplain.RIPPLE_ID_HTTPS = False
+    # id.ripple.com's rate limit doesn't apply to us
+    txsplain.name_service = txsplain.NameServiceClient(rate=1e9, burst=1e9)
+    return server
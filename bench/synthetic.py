@@ -0,0 +1,217 @@
+"""
+Synthetic benchmark fixtures: a small made-up ledger with a plain XRP
+payment, a cross-currency path payment that touches well over 100 nodes, and
+the accounts, trust lines and offers they refer to. Everything is generated
+from a fixed seed, so runs are comparable.
+"""
+
+import json, random, os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import ripple_binary
+
+LEDGER_INDEX = 30000000
+CLOSE_TIME = 550000000
+ACCOUNT_ONE = "rrrrrrrrrrrrrrrrrrrrBZbvji"
+
+class World(object):
+    """
+    Generates consistent random accounts, amounts and ledger objects.
+    """
+    def __init__(self, seed=1):
+        self.rng = random.Random(seed)
+
+    def address(self):
+        account_id = bytearray(self.rng.getrandbits(8) for i in range(20))
+        return ripple_binary.encode_account_id(memoryview(account_id))
+
+    def hash256(self):
+        return "%064X" % self.rng.getrandbits(256)
+
+    def drops(self):
+        return str(self.rng.randint(20000000, 10**12))
+
+    def value(self):
+        return "%d.%03d" % (self.rng.randint(0, 100000), self.rng.randint(0, 999))
+
+    def iou(self, currency, issuer):
+        return {"currency": currency, "issuer": issuer, "value": self.value()}
+
+    def account_root(self, address):
+        return {
+            "LedgerEntryType": "AccountRoot",
+            "index": self.hash256(),
+            "Account": address,
+            "Balance": self.drops(),
+            "Flags": 0x00800000,
+            "OwnerCount": self.rng.randint(0, 20),
+            "Sequence": self.rng.randint(1, 5000),
+            "PreviousTxnID": self.hash256(),
+            "PreviousTxnLgrSeq": LEDGER_INDEX - 1,
+            "Domain": "6578616d706c652e636f6d",
+            "TransferRate": 1002000000
+        }
+
+    def trust_line(self, holder, issuer, currency):
+        low, high = sorted([holder, issuer])
+        return {
+            "LedgerEntryType": "RippleState",
+            "index": self.hash256(),
+            "Balance": {"currency": currency, "issuer": ACCOUNT_ONE,
+                        "value": self.value() if low == holder else "-" + self.value()},
+            "LowLimit": {"currency": currency, "issuer": low,
+                         "value": "1000000" if low == holder else "0"},
+            "HighLimit": {"currency": currency, "issuer": high,
+                          "value": "1000000" if high == holder else "0"},
+            "Flags": 0x00010000 | 0x00020000 | 0x00100000,
+            "LowNode": "0000000000000000",
+            "HighNode": "0000000000000000"
+        }
+
+    def offer(self, owner, sequence, gets, pays):
+        return {
+            "LedgerEntryType": "Offer",
+            "index": self.hash256(),
+            "Account": owner,
+            "Sequence": sequence,
+            "Flags": 0,
+            "TakerGets": gets,
+            "TakerPays": pays,
+            "BookDirectory": self.hash256(),
+            "BookNode": "0000000000000000",
+            "OwnerNode": "0000000000000000"
+        }
+
+    def payment(self, sender, receiver, amount, nodes, send_max=None, paths=None):
+        tx_json = {
+            "TransactionType": "Payment",
+            "Account": sender,
+            "Destination": receiver,
+            "Amount": amount,
+            "Fee": "12",
+            "Flags": 0x80000000,
+            "Sequence": self.rng.randint(1, 5000),
+            "hash": self.hash256(),
+            "ledger_index": LEDGER_INDEX,
+            "validated": True,
+            "meta": {
+                "TransactionIndex": 0,
+                "TransactionResult": "tesSUCCESS",
+                "AffectedNodes": nodes,
+                "delivered_amount": amount
+            }
+        }
+        if send_max:
+            tx_json["SendMax"] = send_max
+        if paths:
+            tx_json["Paths"] = paths
+        return tx_json
+
+def modified(entry, **previous):
+    fields = dict((k, v) for k, v in entry.items() if k != "index")
+    return {"ModifiedNode": {"LedgerEntryType": entry["LedgerEntryType"],
+                             "LedgerIndex": entry["index"],
+                             "FinalFields": fields,
+                             "PreviousFields": previous}}
+
+def deleted(entry, **previous):
+    node = modified(entry, **previous)["ModifiedNode"]
+    return {"DeletedNode": node}
+
+def generate(seed=1, path_nodes=120, named_fraction=0.5):
+    """
+    Returns (records, names, scenarios): dump records for a DumpFileSource,
+    a dict of address -> Ripple Name, and a list of (scenario name, spec).
+    """
+    world = World(seed)
+    records = []
+    gateways = [world.address() for i in range(3)]
+    users = [world.address() for i in range(60)]
+    accounts = dict((address, world.account_root(address))
+                    for address in gateways + users)
+    names = {}
+    for i, address in enumerate(gateways + users):
+        if world.rng.random() < named_fraction:
+            names[address] = "bench%d" % i
+
+    # small XRP payment
+    sender, receiver = users[0], users[1]
+    small_nodes = [
+        modified(accounts[sender], Balance=str(int(accounts[sender]["Balance"]) + 1000012),
+                 Sequence=accounts[sender]["Sequence"] - 1),
+        modified(accounts[receiver], Balance=str(int(accounts[receiver]["Balance"]) - 1000000)),
+    ]
+    small = world.payment(sender, receiver, "1000000", small_nodes)
+
+    # path payment: USD -> XRP -> EUR through lots of offers and trust lines
+    nodes = []
+    trust_lines = []
+    while len(nodes) < path_nodes:
+        kind = len(nodes) % 4
+        holder = world.rng.choice(users)
+        gateway = world.rng.choice(gateways)
+        currency = world.rng.choice(["USD", "EUR"])
+        if kind == 0:
+            line = world.trust_line(holder, gateway, currency)
+            trust_lines.append(line)
+            nodes.append(modified(line, Balance=dict(line["Balance"], value=world.value())))
+        elif kind == 1:
+            offer = world.offer(holder, world.rng.randint(1, 5000), world.drops(),
+                                world.iou(currency, gateway))
+            nodes.append(deleted(offer, TakerGets=world.drops(),
+                                 TakerPays=world.iou(currency, gateway)))
+        elif kind == 2:
+            offer = world.offer(holder, world.rng.randint(1, 5000),
+                                world.iou(currency, gateway), world.drops())
+            nodes.append(modified(offer, TakerGets=world.iou(currency, gateway),
+                                  TakerPays=world.drops()))
+        else:
+            nodes.append(modified(accounts[holder], Balance=world.drops()))
+            nodes.append({"ModifiedNode": {"LedgerEntryType": "DirectoryNode",
+                                           "LedgerIndex": world.hash256(),
+                                           "FinalFields": {"Owner": holder,
+                                                           "RootIndex": world.hash256()}}})
+    paths = [[{"currency": "XRP", "type": 16, "type_hex": "0000000000000010"},
+              {"currency": "EUR", "issuer": gateways[1], "type": 48,
+               "type_hex": "0000000000000030"}],
+             [{"account": gateways[0], "type": 1, "type_hex": "0000000000000001"},
+              {"account": gateways[1], "type": 1, "type_hex": "0000000000000001"}]]
+    big = world.payment(users[2], users[3], world.iou("EUR", gateways[1]), nodes,
+                        send_max=world.iou("USD", gateways[0]), paths=paths)
+    big["meta"]["TransactionIndex"] = 1
+
+    ledger = {
+        "ledger_index": str(LEDGER_INDEX),
+        "ledger_hash": world.hash256(),
+        "close_time": CLOSE_TIME,
+        "close_time_human": "2017-Jun-05 15:33:20",
+        "closed": True,
+        "transactions": [small["hash"], big["hash"]]
+    }
+    previous_ledger = dict(ledger, ledger_index=str(LEDGER_INDEX - 1),
+                           ledger_hash=world.hash256(), transactions=[])
+    fee_settings = {"LedgerEntryType": "FeeSettings", "index": world.hash256(),
+                    "BaseFee": "000000000000000A", "ReferenceFeeUnits": 10,
+                    "ReserveBase": 20000000, "ReserveIncrement": 5000000}
+
+    records.extend([small, big, ledger, previous_ledger, fee_settings])
+    records.extend(accounts.values())
+    records.extend(trust_lines)
+    offer = world.offer(users[4], 77, world.drops(), world.iou("USD", gateways[0]))
+    records.append(offer)
+
+    line = trust_lines[0]
+    scenarios = [
+        ("small_payment", [small["hash"]]),
+        ("path_payment_%d_nodes" % len(nodes), [big["hash"]]),
+        ("account", [users[0]]),
+        ("trust_line", [line["LowLimit"]["issuer"], line["HighLimit"]["issuer"],
+                        line["Balance"]["currency"]]),
+        ("offer", [users[4], "77"]),
+    ]
+    return records, names, scenarios
+
+def write_dump(records, path):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
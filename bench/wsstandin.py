@@ -0,0 +1,223 @@
+#!/bin/env python
+"""
+Local stand-in for rippled's WebSocket subscription streams, for testing
+and benchmarking subscriber.py without the network. It replays the ledgers
+in dump files (see txsplain.DumpFileSource) or synthetic fixtures: for each
+ledger, a ledgerClosed message on the ledger stream, then each of its
+transactions on the transactions and accounts streams.
+
+    wsstandin.py [--interval SECONDS] [DUMPFILE ...]
+    subscriber.py --url ws://127.0.0.1:PORT/
+
+Only enough of the WebSocket protocol (RFC 6455) for that is implemented:
+unfragmented text frames, ping and close.
+"""
+
+from __future__ import print_function
+import argparse, base64, hashlib, json, os, struct, sys, tempfile, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import txsplain
+import synthetic
+
+try:
+    from socketserver import ThreadingMixIn, TCPServer, StreamRequestHandler
+except ImportError:
+    from SocketServer import ThreadingMixIn, TCPServer, StreamRequestHandler
+
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+def ledger_messages(source, ledger_index):
+    """
+    The stream messages rippled would publish when ledger_index is
+    validated: (streams, accounts, message) for each, where a message goes
+    to subscribers of any of streams, or of any of accounts.
+    """
+    result = source.call("ledger", {"ledger_index": ledger_index,
+                                    "transactions": True, "expand": True})
+    ledger = result["ledger"]
+    transactions = sorted(ledger.get("transactions", []),
+                          key=lambda tx_json: tx_json["metaData"]["TransactionIndex"])
+    fees = source.call("server_info", {}).get("info", {}).get("validated_ledger", {})
+    ledger_msg = {
+        "type": "ledgerClosed",
+        "ledger_index": ledger_index,
+        "ledger_hash": ledger.get("ledger_hash", ""),
+        "ledger_time": ledger.get("close_time", 0),
+        "txn_count": len(transactions),
+        "validated_ledgers": "%d" % ledger_index
+    }
+    if fees:
+        ledger_msg["reserve_base"] = int(fees["reserve_base_xrp"] * 1000000)
+        ledger_msg["reserve_inc"] = int(fees["reserve_inc_xrp"] * 1000000)
+    messages = [(["ledger"], (), ledger_msg)]
+
+    for tx_json in transactions:
+        meta = tx_json.pop("metaData")
+        tx_json.pop("ledger_index", None)
+        tx_json.pop("validated", None)
+        messages.append((["transactions"], txsplain.tx_addresses(tx_json), {
+            "type": "transaction",
+            "engine_result": meta["TransactionResult"],
+            "ledger_index": ledger_index,
+            "ledger_hash": ledger.get("ledger_hash", ""),
+            "meta": meta,
+            "transaction": tx_json,
+            "status": "closed",
+            "validated": True
+        }))
+    return messages
+
+class StreamHandler(StreamRequestHandler):
+    def handshake(self):
+        request_line = self.rfile.readline()
+        headers = {}
+        while True:
+            line = self.rfile.readline().decode("latin-1").strip()
+            if not line:
+                break
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+        if "sec-websocket-key" not in headers:
+            self.wfile.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return False
+        accept = base64.b64encode(hashlib.sha1(
+            headers["sec-websocket-key"].encode("latin-1") + WEBSOCKET_GUID).digest())
+        self.wfile.write(b"HTTP/1.1 101 Switching Protocols\r\n"
+                         b"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                         b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        return True
+
+    def read_frame(self):
+        """
+        Returns (opcode, payload), or (None, None) if the client hung up.
+        """
+        header = self.rfile.read(2)
+        if len(header) < 2:
+            return None, None
+        first, second = bytearray(header)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", self.rfile.read(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self.rfile.read(8))[0]
+        mask = bytearray(self.rfile.read(4)) # clients always mask
+        payload = bytearray(self.rfile.read(length))
+        for i in range(length):
+            payload[i] ^= mask[i % 4]
+        return opcode, bytes(payload)
+
+    def send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        with self.send_lock:
+            self.wfile.write(header + payload)
+
+    def send_json(self, obj):
+        self.send_frame(OP_TEXT, json.dumps(obj).encode("utf-8"))
+
+    def handle(self):
+        if not self.handshake():
+            return
+        self.send_lock = threading.Lock()
+        while True:
+            opcode, payload = self.read_frame()
+            if opcode is None or opcode == OP_CLOSE:
+                return
+            if opcode == OP_PING:
+                self.send_frame(OP_PONG, payload)
+            elif opcode == OP_TEXT:
+                command = json.loads(payload.decode("utf-8"))
+                if command.get("command") != "subscribe":
+                    self.send_json({"id": command.get("id"), "type": "response",
+                                    "status": "error", "error": "unknownCmd"})
+                    continue
+                self.send_json({"id": command.get("id"), "type": "response",
+                                "status": "success", "result": {}})
+                t = threading.Thread(target=self.replay,
+                                     args=(command.get("streams", []),
+                                           command.get("accounts", [])))
+                t.daemon = True
+                t.start()
+
+    def replay(self, streams, accounts):
+        accounts = set(accounts)
+        try:
+            for ledger_index in self.server.source.ledger_indexes():
+                for msg_streams, msg_accounts, msg in ledger_messages(
+                        self.server.source, ledger_index):
+                    if set(msg_streams) & set(streams) or \
+                            (msg["type"] == "transaction" and accounts & msg_accounts):
+                        self.send_json(msg)
+                        self.server.count()
+                time.sleep(self.server.interval)
+        except (IOError, OSError):
+            pass # client went away
+
+class StreamServer(ThreadingMixIn, TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, source, interval=0, port=0):
+        TCPServer.__init__(self, ("127.0.0.1", port), StreamHandler)
+        self.source = source
+        self.interval = interval # seconds between ledgers
+        self.sent = 0
+        self.lock = threading.Lock()
+
+    def count(self):
+        with self.lock:
+            self.sent += 1
+
+    @property
+    def url(self):
+        return "ws://127.0.0.1:%d/" % self.server_address[1]
+
+def start(source, interval=0, port=0):
+    """
+    Start a stand-in stream server on a background thread. Its URL is
+    server.url.
+    """
+    server = StreamServer(source, interval, port)
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay ledgers over a stand-in rippled WebSocket stream.")
+    parser.add_argument("dumps", nargs="*", metavar="DUMPFILE",
+                        help="ledgers to replay (default: synthetic fixtures)")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="seconds between ledgers")
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.dumps:
+        source = txsplain.DumpFileSource(args.dumps)
+    else:
+        records, names, scenarios = synthetic.generate()
+        dump = tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False)
+        dump.close()
+        synthetic.write_dump(records, dump.name)
+        source = txsplain.DumpFileSource([dump.name])
+    server = start(source, args.interval, args.port)
+    print("Replaying %d ledgers at %s" % (len(source.ledger_indexes()), server.url))
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if not args.dumps:
+            os.unlink(dump.name)
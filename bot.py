@@ -1,10 +1,23 @@
 #!/bin/env python
 
-import time, re, os
+import re, os, select, threading
+from collections import deque
 from slackclient import SlackClient
 import txsplain
 
 token = os.getenv("TXSPLAIN_SLACK_TOKEN")
+MAX_CONCURRENT_LOOKUPS = int(os.getenv("TXSPLAIN_MAX_LOOKUPS", "4"))
+MAX_NODES = int(os.getenv("TXSPLAIN_MAX_NODES", "40")) # more affected nodes than this get summarized
+
+txsplain.open_explanation_store(os.getenv("TXSPLAIN_CACHE_FILE"))
+if os.getenv("TXSPLAIN_TRACE") or os.getenv("TXSPLAIN_METRICS_PORT"):
+    # log replies slower than TXSPLAIN_TRACE seconds, with where the time went
+    callback = None
+    if os.getenv("TXSPLAIN_TRACE"):
+        callback = txsplain.span_logger(min_seconds=float(os.getenv("TXSPLAIN_TRACE")))
+    txsplain.set_tracer(txsplain.Tracer(callback=callback))
+if os.getenv("TXSPLAIN_METRICS_PORT"):
+    txsplain.serve_metrics(int(os.getenv("TXSPLAIN_METRICS_PORT")))
 
 sc = SlackClient(token)
 if not sc.rtm_connect():
@@ -21,15 +34,71 @@ def activates_bot(msg):
 
 def tx_lookup(tx_hash, verbose):
     try:
-        tx_json = txsplain.tx(tx_hash)
         s = "https://api.ripple.com/v1/transactions/"+tx_hash+"\n"
-        s += txsplain.splain(tx_json, verbose)
+        with txsplain.tracer.span("reply", tx=tx_hash):
+            # list the affected nodes one by one, unless there are lots
+            s += txsplain.explain_tx(tx_hash, verbose, max_nodes=MAX_NODES,
+                                     summarize_over=MAX_NODES)
     except KeyError:
         s = "Couldn't find transaction %s." % tx_hash
 
     return s
 
+class ChannelScheduler(object):
+    """
+    Queue of pending lookups that hands them out round-robin by channel, so
+    a burst of hashes in one channel doesn't hold up the others.
+    """
+    def __init__(self):
+        self._queues = {} # channel id -> deque of jobs
+        self._turns = deque() # channels with pending jobs, in serving order
+        self._cond = threading.Condition()
+
+    def put(self, channel, job):
+        with self._cond:
+            if channel not in self._queues:
+                self._queues[channel] = deque()
+                self._turns.append(channel)
+            self._queues[channel].append(job)
+            self._cond.notify()
+
+    def get(self):
+        with self._cond:
+            while not self._turns:
+                self._cond.wait()
+            channel = self._turns.popleft()
+            jobs = self._queues[channel]
+            job = jobs.popleft()
+            if jobs:
+                self._turns.append(channel) # back of the line
+            else:
+                del self._queues[channel]
+            return channel, job
+
+scheduler = ChannelScheduler()
+send_lock = threading.Lock()
+
+def lookup_worker():
+    while True:
+        channel, (tx_hash, verbose) = scheduler.get()
+        try:
+            reply = tx_lookup(tx_hash, verbose)
+        except Exception as e:
+            print("Lookup of %s failed: %s" % (tx_hash, e))
+            reply = "Sorry, something went wrong looking up %s." % tx_hash
+        chan = sc.server.channels.find(channel)
+        if chan:
+            with send_lock:
+                chan.send_message(reply)
+
+for i in range(MAX_CONCURRENT_LOOKUPS):
+    t = threading.Thread(target=lookup_worker)
+    t.daemon = True
+    t.start()
+
 while True:
+    # Sleep until Slack sends something, instead of polling on a timer
+    select.select([sc.server.websocket.sock], [], [], 5)
     new_evts = sc.rtm_read()
     for evt in new_evts:
         print(evt)
@@ -38,8 +107,5 @@ while True:
         if evt["type"] == "message" and "text" in evt:
             tx_hash,verbose = activates_bot(evt["text"])
             if tx_hash:
-                chan = sc.server.channels.find(evt["channel"])
-                if chan:
-                    chan.send_message(tx_lookup(tx_hash, verbose))
+                scheduler.put(evt["channel"], (tx_hash, verbose))
                 #print(tx_lookup(tx_hash))
-    time.sleep(1)
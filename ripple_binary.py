@@ -0,0 +1,576 @@
+"""
+Decoder for rippled's binary (STObject) serialization, so transactions and
+metadata can be fetched with "binary": true and turned into the same JSON
+structures rippled would have sent, without rippled serializing (and us
+parsing) the much bigger JSON.
+
+The decoder reads straight out of a memoryview over the blob; the only copies
+made are the output values themselves.
+"""
+
+import struct, hashlib, binascii
+
+# field definitions ----------------------------
+# type code -> type name
+TYPES = {
+    1: "UInt16",
+    2: "UInt32",
+    3: "UInt64",
+    4: "Hash128",
+    5: "Hash256",
+    6: "Amount",
+    7: "Blob",
+    8: "AccountID",
+    14: "STObject",
+    15: "STArray",
+    16: "UInt8",
+    17: "Hash160",
+    18: "PathSet",
+    19: "Vector256",
+}
+
+# (type code, field code) -> field name
+FIELDS = {
+    (16, 1): "CloseResolution",
+    (16, 2): "Method",
+    (16, 3): "TransactionResult",
+    (16, 16): "TickSize",
+
+    (1, 1): "LedgerEntryType",
+    (1, 2): "TransactionType",
+    (1, 3): "SignerWeight",
+
+    (2, 2): "Flags",
+    (2, 3): "SourceTag",
+    (2, 4): "Sequence",
+    (2, 5): "PreviousTxnLgrSeq",
+    (2, 6): "LedgerSequence",
+    (2, 7): "CloseTime",
+    (2, 8): "ParentCloseTime",
+    (2, 9): "SigningTime",
+    (2, 10): "Expiration",
+    (2, 11): "TransferRate",
+    (2, 12): "WalletSize",
+    (2, 13): "OwnerCount",
+    (2, 14): "DestinationTag",
+    (2, 16): "HighQualityIn",
+    (2, 17): "HighQualityOut",
+    (2, 18): "LowQualityIn",
+    (2, 19): "LowQualityOut",
+    (2, 20): "QualityIn",
+    (2, 21): "QualityOut",
+    (2, 22): "StampEscrow",
+    (2, 23): "BondAmount",
+    (2, 24): "LoadFee",
+    (2, 25): "OfferSequence",
+    (2, 26): "FirstLedgerSequence",
+    (2, 27): "LastLedgerSequence",
+    (2, 28): "TransactionIndex",
+    (2, 29): "OperationLimit",
+    (2, 30): "ReferenceFeeUnits",
+    (2, 31): "ReserveBase",
+    (2, 32): "ReserveIncrement",
+    (2, 33): "SetFlag",
+    (2, 34): "ClearFlag",
+    (2, 35): "SignerQuorum",
+    (2, 36): "CancelAfter",
+    (2, 37): "FinishAfter",
+    (2, 38): "SignerListID",
+    (2, 39): "SettleDelay",
+
+    (3, 1): "IndexNext",
+    (3, 2): "IndexPrevious",
+    (3, 3): "BookNode",
+    (3, 4): "OwnerNode",
+    (3, 5): "BaseFee",
+    (3, 6): "ExchangeRate",
+    (3, 7): "LowNode",
+    (3, 8): "HighNode",
+    (3, 9): "DestinationNode",
+
+    (4, 1): "EmailHash",
+
+    (17, 1): "TakerPaysCurrency",
+    (17, 2): "TakerPaysIssuer",
+    (17, 3): "TakerGetsCurrency",
+    (17, 4): "TakerGetsIssuer",
+
+    (5, 1): "LedgerHash",
+    (5, 2): "ParentHash",
+    (5, 3): "TransactionHash",
+    (5, 4): "AccountHash",
+    (5, 5): "PreviousTxnID",
+    (5, 6): "LedgerIndex",
+    (5, 7): "WalletLocator",
+    (5, 8): "RootIndex",
+    (5, 9): "AccountTxnID",
+    (5, 16): "BookDirectory",
+    (5, 17): "InvoiceID",
+    (5, 18): "Nickname",
+    (5, 19): "Amendment",
+    (5, 20): "TicketID",
+    (5, 21): "Digest",
+    (5, 22): "Channel",
+
+    (6, 1): "Amount",
+    (6, 2): "Balance",
+    (6, 3): "LimitAmount",
+    (6, 4): "TakerPays",
+    (6, 5): "TakerGets",
+    (6, 6): "LowLimit",
+    (6, 7): "HighLimit",
+    (6, 8): "Fee",
+    (6, 9): "SendMax",
+    (6, 10): "DeliverMin",
+    (6, 16): "MinimumOffer",
+    (6, 17): "RippleEscrow",
+    (6, 18): "DeliveredAmount",
+
+    (7, 1): "PublicKey",
+    (7, 2): "MessageKey",
+    (7, 3): "SigningPubKey",
+    (7, 4): "TxnSignature",
+    (7, 5): "Generator",
+    (7, 6): "Signature",
+    (7, 7): "Domain",
+    (7, 8): "FundCode",
+    (7, 9): "RemoveCode",
+    (7, 10): "ExpireCode",
+    (7, 11): "CreateCode",
+    (7, 12): "MemoType",
+    (7, 13): "MemoData",
+    (7, 14): "MemoFormat",
+    (7, 16): "Fulfillment",
+    (7, 17): "Condition",
+    (7, 18): "MasterSignature",
+
+    (8, 1): "Account",
+    (8, 2): "Owner",
+    (8, 3): "Destination",
+    (8, 4): "Issuer",
+    (8, 5): "Authorize",
+    (8, 6): "Unauthorize",
+    (8, 7): "Target",
+    (8, 8): "RegularKey",
+
+    (14, 1): "ObjectEndMarker",
+    (14, 2): "TransactionMetaData",
+    (14, 3): "CreatedNode",
+    (14, 4): "DeletedNode",
+    (14, 5): "ModifiedNode",
+    (14, 6): "PreviousFields",
+    (14, 7): "FinalFields",
+    (14, 8): "NewFields",
+    (14, 9): "TemplateEntry",
+    (14, 10): "Memo",
+    (14, 11): "SignerEntry",
+    (14, 16): "Signer",
+    (14, 18): "Majority",
+
+    (15, 1): "ArrayEndMarker",
+    (15, 3): "Signers",
+    (15, 4): "SignerEntries",
+    (15, 5): "Template",
+    (15, 6): "Necessary",
+    (15, 7): "Sufficient",
+    (15, 8): "AffectedNodes",
+    (15, 9): "Memos",
+    (15, 16): "Majorities",
+
+    (18, 1): "Paths",
+
+    (19, 1): "Indexes",
+    (19, 2): "Hashes",
+    (19, 3): "Amendments",
+}
+
+# Most fields have a one-byte header (type and field code both < 16), so
+# those are looked up directly: header byte -> (type code, field code, name)
+SHORT_FIELDS = [None]*256
+for (type_code, field_code), field_name in FIELDS.items():
+    if type_code < 16 and field_code < 16:
+        SHORT_FIELDS[type_code << 4 | field_code] = (type_code, field_code, field_name)
+
+TRANSACTION_TYPES = {
+    0: "Payment",
+    1: "EscrowCreate",
+    2: "EscrowFinish",
+    3: "AccountSet",
+    4: "EscrowCancel",
+    5: "SetRegularKey",
+    6: "NickNameSet",
+    7: "OfferCreate",
+    8: "OfferCancel",
+    9: "Contract",
+    10: "TicketCreate",
+    11: "TicketCancel",
+    12: "SignerListSet",
+    13: "PaymentChannelCreate",
+    14: "PaymentChannelFund",
+    15: "PaymentChannelClaim",
+    20: "TrustSet",
+    100: "EnableAmendment",
+    101: "SetFee",
+}
+
+LEDGER_ENTRY_TYPES = {
+    0x0061: "AccountRoot",
+    0x0064: "DirectoryNode",
+    0x0066: "Amendments",
+    0x0068: "LedgerHashes",
+    0x006f: "Offer",
+    0x0072: "RippleState",
+    0x0073: "FeeSettings",
+    0x0075: "Escrow",
+    0x0078: "PayChannel",
+    0x0053: "SignerList",
+    0x0054: "Ticket",
+}
+
+# Only tes and tec results make it into a ledger
+TRANSACTION_RESULTS = {
+    0: "tesSUCCESS",
+    100: "tecCLAIM",
+    101: "tecPATH_PARTIAL",
+    102: "tecUNFUNDED_ADD",
+    103: "tecUNFUNDED_OFFER",
+    104: "tecUNFUNDED_PAYMENT",
+    105: "tecFAILED_PROCESSING",
+    121: "tecDIR_FULL",
+    122: "tecINSUF_RESERVE_LINE",
+    123: "tecINSUF_RESERVE_OFFER",
+    124: "tecNO_DST",
+    125: "tecNO_DST_INSUF_XRP",
+    126: "tecNO_LINE_INSUF_RESERVE",
+    127: "tecNO_LINE_REDUNDANT",
+    128: "tecPATH_DRY",
+    129: "tecUNFUNDED",
+    130: "tecNO_ALTERNATIVE_KEY",
+    131: "tecNO_REGULAR_KEY",
+    132: "tecOWNERS",
+    133: "tecNO_ISSUER",
+    134: "tecNO_AUTH",
+    135: "tecNO_LINE",
+    136: "tecINSUFF_FEE",
+    137: "tecFROZEN",
+    138: "tecNO_TARGET",
+    139: "tecNO_PERMISSION",
+    140: "tecNO_ENTRY",
+    141: "tecINSUFFICIENT_RESERVE",
+    142: "tecNEED_MASTER_KEY",
+    143: "tecDST_TAG_NEEDED",
+    144: "tecINTERNAL",
+    145: "tecOVERSIZE",
+    146: "tecCRYPTOCONDITION_ERROR",
+}
+
+# Since this ledger, Payments that deliver less than their Amount always
+# record a DeliveredAmount in their metadata
+DELIVERED_AMOUNT_SINCE = 4594095
+
+# basic utils ------------------------
+class BinaryError(ValueError):
+    pass
+
+U8 = struct.Struct(">B")
+U16 = struct.Struct(">H")
+U32 = struct.Struct(">I")
+U64 = struct.Struct(">Q")
+
+def to_hex(buf):
+    return binascii.hexlify(buf).decode("ascii").upper()
+
+RIPPLE_ALPHABET = "rpshnaf39wBUDNEGHJKLM4PQRST7VWXYZ2bcdeCg65jkm8oFqi1tuvAxyz"
+account_ids = {} # 20-byte AccountID -> address; there aren't that many
+def encode_account_id(account_id):
+    """
+    Base58Check-encode a 20-byte AccountID as an r... address.
+    """
+    account_id = account_id.tobytes()
+    try:
+        return account_ids[account_id]
+    except KeyError:
+        pass
+    payload = b"\x00" + account_id
+    checksum = hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+    payload += checksum
+    n = int(binascii.hexlify(payload), 16)
+    chars = []
+    while n:
+        n, rem = divmod(n, 58)
+        chars.append(RIPPLE_ALPHABET[rem])
+    # Each leading zero byte (the version byte, at least) is an "r"
+    for i in range(len(payload)):
+        if payload[i:i+1] != b"\x00":
+            break
+        chars.append(RIPPLE_ALPHABET[0])
+    address = "".join(reversed(chars))
+    if len(account_ids) > 100000:
+        account_ids.clear()
+    account_ids[account_id] = address
+    return address
+
+def decode_currency(buf):
+    """
+    20-byte currency code: XRP, a 3-letter ISO-style code, or 40 hex digits.
+    """
+    raw = buf.tobytes()
+    if raw == b"\x00"*20:
+        return "XRP"
+    if raw[:12] == b"\x00"*12 and raw[15:] == b"\x00"*5:
+        return raw[12:15].decode("ascii")
+    return to_hex(buf)
+
+def iou_value_text(negative, mantissa, exponent):
+    """
+    Same text rippled uses for an issued currency value.
+    """
+    if mantissa == 0:
+        return "0"
+    sign = "-" if negative else ""
+    if exponent != 0 and (exponent < -25 or exponent > -5):
+        return "%s%de%d" % (sign, mantissa, exponent)
+    digits = str(mantissa)
+    if exponent >= 0:
+        return sign + digits + "0"*exponent
+    digits = digits.rjust(-exponent+1, "0")
+    whole, frac = digits[:exponent], digits[exponent:].rstrip("0")
+    if frac:
+        return "%s%s.%s" % (sign, whole, frac)
+    return sign + whole
+
+def tx_hash(tx_blob):
+    """
+    A transaction's hash (ID), from its binary form.
+    """
+    return to_hex(hashlib.sha512(b"TXN\x00" + bytes(tx_blob)).digest()[:32])
+
+# decoding ---------------------------
+class Decoder(object):
+    """
+    Reads fields out of a serialized object, starting at pos. Integers are
+    unpacked straight from the buffer; only hashes, blobs and AccountIDs are
+    sliced out (as memoryviews, so still without copying).
+    """
+    def __init__(self, blob, pos=0):
+        self.buf = memoryview(blob)
+        self.pos = pos
+        self._readers = {
+            16: self.read_u8_field,
+            1: self.read_u16_field,
+            2: self.read_u32,
+            3: self.read_hex(8),
+            4: self.read_hex(16),
+            5: self.read_hex(32),
+            17: self.read_hex(20),
+            6: self.read_amount,
+            7: self.read_blob,
+            8: self.read_account_id,
+            14: self.read_object,
+            15: self.read_array,
+            18: self.read_pathset,
+            19: self.read_vector256,
+        }
+
+    def read(self, n):
+        start = self.pos
+        end = start + n
+        if end > len(self.buf):
+            raise BinaryError("Unexpected end of data at byte %d" % start)
+        self.pos = end
+        return self.buf[start:end]
+
+    def read_u8(self):
+        value = U8.unpack_from(self.buf, self.pos)[0]
+        self.pos += 1
+        return value
+
+    def read_u32(self, name=None):
+        value = U32.unpack_from(self.buf, self.pos)[0]
+        self.pos += 4
+        return value
+
+    def read_u8_field(self, name):
+        value = self.read_u8()
+        if name == "TransactionResult":
+            return TRANSACTION_RESULTS.get(value, "ter%d" % value)
+        return value
+
+    def read_u16_field(self, name):
+        value = U16.unpack_from(self.buf, self.pos)[0]
+        self.pos += 2
+        if name == "TransactionType":
+            return TRANSACTION_TYPES.get(value, value)
+        if name == "LedgerEntryType":
+            return LEDGER_ENTRY_TYPES.get(value, value)
+        return value
+
+    def read_hex(self, n):
+        def read_fixed(name=None):
+            return to_hex(self.read(n))
+        return read_fixed
+
+    def read_vl_length(self):
+        b1 = self.read_u8()
+        if b1 <= 192:
+            return b1
+        if b1 <= 240:
+            return 193 + ((b1 - 193) << 8) + self.read_u8()
+        if b1 <= 254:
+            b2 = self.read_u8()
+            return 12481 + ((b1 - 241) << 16) + (b2 << 8) + self.read_u8()
+        raise BinaryError("Bad length prefix at byte %d" % (self.pos-1))
+
+    def read_blob(self, name=None):
+        return to_hex(self.read(self.read_vl_length()))
+
+    def read_account_id(self, name=None):
+        length = self.read_vl_length()
+        if length != 20:
+            raise BinaryError("AccountID of length %d" % length)
+        return encode_account_id(self.read(20))
+
+    def read_vector256(self, name=None):
+        data = self.read(self.read_vl_length())
+        return [to_hex(data[i:i+32]) for i in range(0, len(data), 32)]
+
+    def read_field_id(self):
+        b = self.read_u8()
+        type_code = b >> 4
+        field_code = b & 0x0f
+        if type_code == 0:
+            type_code = self.read_u8()
+        if field_code == 0:
+            field_code = self.read_u8()
+        return type_code, field_code
+
+    def read_amount(self, name=None):
+        raw = U64.unpack_from(self.buf, self.pos)[0]
+        self.pos += 8
+        if not raw & 0x8000000000000000:
+            # XRP, in drops
+            drops = raw & 0x3fffffffffffffff
+            if raw & 0x4000000000000000 or drops == 0:
+                return str(drops)
+            return "-%d" % drops
+        mantissa = raw & 0x003fffffffffffff
+        exponent = ((raw >> 54) & 0xff) - 97
+        negative = not raw & 0x4000000000000000
+        return {
+            "value": iou_value_text(negative, mantissa, exponent),
+            "currency": decode_currency(self.read(20)),
+            "issuer": encode_account_id(self.read(20)),
+        }
+
+    def read_pathset(self, name=None):
+        paths = []
+        path = []
+        while True:
+            step_type = self.read_u8()
+            if step_type in (0x00, 0xff):
+                paths.append(path)
+                if step_type == 0x00:
+                    return paths
+                path = []
+                continue
+            step = {"type": step_type, "type_hex": "%016X" % step_type}
+            if step_type & 0x01:
+                step["account"] = encode_account_id(self.read(20))
+            if step_type & 0x10:
+                step["currency"] = decode_currency(self.read(20))
+            if step_type & 0x20:
+                step["issuer"] = encode_account_id(self.read(20))
+            path.append(step)
+
+    def read_field(self):
+        """
+        Returns (type code, field code, field name) of the next field.
+        """
+        field = SHORT_FIELDS[U8.unpack_from(self.buf, self.pos)[0]]
+        if field is not None:
+            self.pos += 1
+            return field
+        field_id = self.read_field_id()
+        try:
+            return field_id + (FIELDS[field_id],)
+        except KeyError:
+            raise BinaryError("Unknown field %s at byte %d" % (field_id, self.pos))
+
+    def read_value(self, type_code, name):
+        try:
+            reader = self._readers[type_code]
+        except KeyError:
+            raise BinaryError("Unknown type %d at byte %d" % (type_code, self.pos))
+        return reader(name)
+
+    def read_object(self, name=None, top_level=False):
+        """
+        Read fields into a dict until the end-of-object marker (or the end of
+        the data, for a top-level object).
+        """
+        obj = {}
+        end = len(self.buf)
+        readers = self._readers
+        while not (top_level and self.pos >= end):
+            type_code, field_code, field_name = self.read_field()
+            if type_code == 14 and field_code == 1:
+                break
+            if type_code not in readers:
+                raise BinaryError("Unknown type %d at byte %d" % (type_code, self.pos))
+            obj[field_name] = readers[type_code](field_name)
+        return obj
+
+    def read_array(self, name=None):
+        """
+        Read wrapped objects like {"ModifiedNode": {...}} until the
+        end-of-array marker.
+        """
+        array = []
+        while True:
+            type_code, field_code, field_name = self.read_field()
+            if type_code == 15 and field_code == 1:
+                return array
+            array.append({field_name: self.read_value(type_code, field_name)})
+
+def decode(blob):
+    """
+    Decode one serialized STObject (a transaction, metadata, or ledger entry)
+    into JSON-style dicts. blob can be bytes, or a hex string as rippled
+    sends it.
+    """
+    if not isinstance(blob, (bytes, bytearray, memoryview)):
+        blob = binascii.unhexlify(blob)
+    try:
+        return Decoder(blob).read_object(top_level=True)
+    except struct.error:
+        raise BinaryError("Unexpected end of data")
+
+def synthesize_delivered_amount(tx_json):
+    """
+    Add the delivered_amount field rippled adds to Payment metadata in JSON
+    responses, which isn't part of the binary metadata. Where a ledger is
+    too old to say for sure, it's "unavailable", like rippled does.
+    """
+    meta = tx_json["meta"]
+    if tx_json.get("TransactionType") != "Payment" or \
+            meta.get("TransactionResult") != "tesSUCCESS":
+        return
+    if "DeliveredAmount" in meta:
+        meta["delivered_amount"] = meta["DeliveredAmount"]
+    elif tx_json.get("ledger_index", 0) >= DELIVERED_AMOUNT_SINCE:
+        meta["delivered_amount"] = tx_json["Amount"]
+    else:
+        meta["delivered_amount"] = "unavailable"
+
+def decode_tx(tx_blob, meta_blob):
+    """
+    Decode a binary transaction and its metadata into the shape of the tx
+    command's JSON output (minus fields that aren't part of the blobs, like
+    ledger_index and validated, which the caller fills in).
+    """
+    if not isinstance(tx_blob, (bytes, bytearray, memoryview)):
+        tx_blob = binascii.unhexlify(tx_blob)
+    tx_json = decode(tx_blob)
+    tx_json["hash"] = tx_hash(tx_blob)
+    tx_json["meta"] = decode(meta_blob)
+    return tx_json
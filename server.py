@@ -0,0 +1,214 @@
+#!/bin/env python
+"""
+Long-running HTTP service for txsplain explanations, so each one doesn't
+pay for starting Python and opening the caches. Requests share the name
+and ledger caches, the explanation cache and the pooled rippled connections.
+
+    GET /explain/TX_HASH
+    GET /explain/ACCOUNT                      (address or ~name)
+    GET /explain/ADDRESS1/ADDRESS2/CURRENCY   (trust line)
+    GET /explain/ACCOUNT/SEQUENCE             (offer)
+
+i.e. the same forms the commandline accepts, one argument per path
+segment. Query parameters: format=json for a JSON record instead of prose
+(or send Accept: application/json), format=msgpack for the same record in
+MessagePack (or Accept: application/msgpack; a 406 if msgpack isn't
+installed), and, for transactions, summary=1 and max_nodes=N. Arguments
+that don't fit any of those forms get a 400,
+things that don't exist a 404, bad answers from rippled a 502, and
+anything else a 500. Responses have an ETag. Validated transactions can
+also be cached for EXPLANATION_TTL seconds; everything else can change
+at any time, so it's marked no-cache. GET /metrics has tracing totals,
+with --trace.
+"""
+
+from __future__ import print_function
+import argparse, hashlib, json, sys, threading, traceback
+import txsplain
+
+try:
+    from urllib.parse import urlsplit, parse_qs, unquote
+except ImportError:
+    from urlparse import urlsplit, parse_qs
+    from urllib import unquote
+
+SERVER_PORT = 8080
+MAX_CONCURRENT_EXPLANATIONS = 16 # more requests than this wait their turn
+
+RENDERERS = {
+    "json": txsplain.render_json,
+    "msgpack": txsplain.render_msgpack,
+}
+
+CONTENT_TYPES = {
+    "text": "text/plain; charset=utf-8",
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+}
+
+def request_format(query, accept):
+    """
+    "json", "msgpack" or "text", from the format query parameter or else
+    the Accept header.
+    """
+    fmt = query.get("format", [""])[0]
+    if fmt in RENDERERS:
+        return fmt
+    for fmt in sorted(RENDERERS):
+        if "application/" + fmt in accept:
+            return fmt
+    return "text"
+
+def explain_request(args, fmt="text", max_nodes=None, summarize=False):
+    """
+    Explain args (see txsplain.lookup_spec), as prose or as a record
+    rendered in fmt ("json" or "msgpack"). Returns (body, cacheable),
+    where cacheable is True if the result is for a validated transaction
+    and all its Ripple Names were resolved.
+    """
+    ctx = txsplain.SplainContext()
+    if len(args) != 1 or not txsplain.is_hash256(args[0]):
+        if fmt in RENDERERS:
+            return RENDERERS[fmt](txsplain.record_spec(args, ctx=ctx)), False
+        return txsplain.explain_spec(args, ctx=ctx, max_nodes=max_nodes,
+                                     summarize=summarize), False
+
+    with txsplain.tracer.span("explain", spec=args[0]):
+        tx_json = txsplain.cached_tx(args[0])
+        validated = bool(tx_json.get("validated"))
+        if fmt in RENDERERS:
+            body = RENDERERS[fmt](txsplain.tx_record(tx_json, ctx=ctx))
+            return body, validated and not ctx.names_missing
+        if validated:
+            # through the explanation cache
+            text = txsplain.explain_tx(args[0], ctx=ctx, max_nodes=max_nodes,
+                                       summarize=summarize)
+            return text, not ctx.names_missing
+        return txsplain.splain(tx_json, ctx=ctx, dump_json=False,
+                               max_nodes=max_nodes, summarize=summarize), False
+
+class ExplanationHandler(txsplain.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, for the proxy in front of us
+    disable_nagle_algorithm = True
+
+    def send_body(self, status, body, content_type, headers={}):
+        if not isinstance(body, bytes):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def send_error_body(self, status, message, as_json):
+        if as_json:
+            self.send_body(status, json.dumps({"error": message}),
+                           "application/json")
+        else:
+            self.send_body(status, message + "\n", "text/plain; charset=utf-8")
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/metrics":
+            text = txsplain.tracer.prometheus_text() \
+                    if txsplain.tracer.enabled else ""
+            self.send_body(200, text, "text/plain; version=0.0.4")
+            return
+        if not url.path.startswith("/explain/"):
+            self.send_error_body(404, "Not found. Try /explain/TX_HASH", False)
+            return
+
+        fmt = request_format(query, self.headers.get("Accept", ""))
+        as_json = fmt != "text" # errors come back as JSON for records
+        args = [unquote(arg) for arg in url.path[len("/explain/"):].split("/") if arg]
+        try:
+            max_nodes = int(query["max_nodes"][0]) if "max_nodes" in query else None
+        except ValueError:
+            self.send_error_body(400, "max_nodes must be a number", as_json)
+            return
+        summarize = query.get("summary", ["0"])[0] not in ("0", "")
+        if txsplain.spec_kind(args) is None:
+            self.send_error_body(400, "Can't explain %s" % " ".join(args), as_json)
+            return
+        if fmt == "msgpack" and txsplain.msgpack is None:
+            self.send_error_body(406, "msgpack isn't installed", as_json)
+            return
+
+        with self.server.slots:
+            try:
+                body, cacheable = explain_request(args, fmt=fmt,
+                                                  max_nodes=max_nodes,
+                                                  summarize=summarize)
+            except KeyError as e:
+                self.send_error_body(404, e.args[0] if e.args else
+                                     "Couldn't find %s" % " ".join(args), as_json)
+                return
+            except (IOError, ValueError, txsplain.httplib.HTTPException) as e:
+                # rippled (or a dump file) didn't give us what we needed
+                self.send_error_body(502, "Couldn't explain %s: %s" %
+                                     (" ".join(args), e), as_json)
+                return
+            except Exception as e:
+                traceback.print_exc()
+                self.send_error_body(500, "Couldn't explain %s: %s" %
+                                     (" ".join(args), e), as_json)
+                return
+
+        if fmt == "json":
+            body += "\n"
+        if not isinstance(body, bytes):
+            body = body.encode("utf-8")
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        headers = {"ETag": etag}
+        if cacheable:
+            headers["Cache-Control"] = "public, max-age=%d" % txsplain.EXPLANATION_TTL
+        else:
+            headers["Cache-Control"] = "no-cache"
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_body(200, body, CONTENT_TYPES[fmt], headers)
+
+    do_HEAD = do_GET
+
+class ExplanationServer(txsplain.ThreadingMixIn, txsplain.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, max_concurrent=MAX_CONCURRENT_EXPLANATIONS):
+        txsplain.HTTPServer.__init__(self, address, ExplanationHandler)
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve txsplain explanations over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--max-concurrent", type=int,
+                        default=MAX_CONCURRENT_EXPLANATIONS,
+                        help="explanations worked on at once")
+    parser.add_argument("--cache-file", default=txsplain.EXPLANATION_CACHE_FILE,
+                        help="keep validated transactions and explanations in this file")
+    parser.add_argument("--trace", action="store_true",
+                        help="record timings, served at /metrics")
+    args = parser.parse_args()
+
+    if args.trace:
+        txsplain.set_tracer(txsplain.Tracer())
+    txsplain.load_known_names()
+    txsplain.open_explanation_store(args.cache_file)
+    txsplain.start_reserve_refresher()
+
+    server = ExplanationServer((args.host, args.port), args.max_concurrent)
+    print("Serving explanations at http://%s:%d/explain/" % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    txsplain.save_known_names()
@@ -0,0 +1,205 @@
+#!/bin/env python
+"""
+Explain transactions as they're validated, from rippled's WebSocket
+subscription streams.
+
+    subscriber.py                           # every transaction
+    subscriber.py rAddress ~name ...        # just these accounts' transactions
+
+Transactions arrive with their metadata, and each ledger's header arrives
+(on the ledger stream) before its transactions, so explaining them takes no
+tx or ledger requests, only Ripple Name lookups.
+"""
+
+from __future__ import print_function
+import argparse, json, sys, threading, time
+from warnings import warn
+import websocket
+import txsplain
+
+RIPPLED_WS_URL = "wss://s2.ripple.com:443"
+QUEUE_SIZE = 2000 # transactions received but not explained yet
+WORKERS = 4 # transactions explained at once
+RECONNECT_DELAY = 5 # seconds to wait before reconnecting after an error
+
+def stream_tx_json(msg):
+    """
+    Turn a transaction stream message into the format the tx command
+    returns.
+    """
+    tx_json = msg.get("transaction") or msg["tx_json"]
+    if "hash" in msg:
+        tx_json["hash"] = msg["hash"]
+    tx_json["meta"] = msg["meta"]
+    tx_json["ledger_index"] = msg["ledger_index"]
+    tx_json["validated"] = msg.get("validated", False)
+    if "delivered_amount" not in tx_json["meta"]:
+        txsplain.ripple_binary.synthesize_delivered_amount(tx_json)
+    return tx_json
+
+def note_ledger_closed(msg):
+    """
+    Cache the header of a ledger from the ledger stream, so explaining its
+    transactions doesn't have to fetch it, and keep the reserve cache up
+    to date while we're at it.
+    """
+    ledger_index = msg["ledger_index"]
+    txsplain.ledger_headers.put(ledger_index, {
+        "ledger_index": ledger_index,
+        "ledger_hash": msg["ledger_hash"],
+        "close_time": msg["ledger_time"],
+        "close_time_human": txsplain.ripple_time_to_human(msg["ledger_time"]),
+        "transaction_count": msg["txn_count"]
+    })
+    if "reserve_base" in msg and "reserve_inc" in msg:
+        txsplain.set_reserve_constants(txsplain.drops_to_xrp(msg["reserve_base"]),
+                                       txsplain.drops_to_xrp(msg["reserve_inc"]),
+                                       ledger_index)
+
+class Subscriber(object):
+    """
+    Reads validated transactions from rippled's transactions stream (or,
+    if accounts are given, the accounts stream) on a background thread, into
+    a queue of at most queue_size transactions. When the queue is full the
+    reader stops reading until there's room again, so a burst waits in
+    the socket buffers instead of in memory. explanations() explains them
+    on a pool of worker threads. If the connection drops, it reconnects;
+    transactions validated in the meantime are missed.
+    """
+    def __init__(self, url=RIPPLED_WS_URL, accounts=(), queue_size=QUEUE_SIZE):
+        self.url = url
+        self.accounts = list(accounts)
+        self.pending = txsplain.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self.error = None # why rippled refused the subscription, if it did
+        self.ws = None
+
+    def subscribe_command(self):
+        command = {"id": 1, "command": "subscribe", "streams": ["ledger"]}
+        if self.accounts:
+            command["accounts"] = self.accounts
+        else:
+            command["streams"].append("transactions")
+        return command
+
+    def read(self):
+        """
+        Receive messages until stopped, reconnecting after errors.
+        """
+        while not self.stopped.is_set():
+            try:
+                self.ws = websocket.create_connection(self.url,
+                        timeout=txsplain.RIPPLED_TIMEOUT)
+                self.ws.send(json.dumps(self.subscribe_command()))
+                while not self.stopped.is_set():
+                    self.handle(json.loads(self.ws.recv()))
+            except Exception as e:
+                if self.stopped.is_set():
+                    break
+                warn("Lost connection to %s: %s" % (self.url, e))
+                time.sleep(RECONNECT_DELAY)
+            finally:
+                if self.ws is not None:
+                    self.ws.close()
+        self.pending.put(None)
+
+    def handle(self, msg):
+        msg_type = msg.get("type")
+        if msg_type == "ledgerClosed":
+            note_ledger_closed(msg)
+        elif msg_type == "transaction" and msg.get("validated"):
+            if self.pending.full():
+                txsplain.tracer.count("subscriber.queue_full")
+            self.pending.put(stream_tx_json(msg))
+            txsplain.tracer.count("subscriber.transactions")
+        elif msg_type == "response" and msg.get("status") != "success":
+            self.error = KeyError("Couldn't subscribe: %s" % msg.get("error"))
+            self.stopped.set()
+
+    def transactions(self):
+        while True:
+            tx_json = self.pending.get()
+            if tx_json is None:
+                return
+            yield tx_json
+
+    def explanations(self, workers=WORKERS, verbose=True, max_nodes=None,
+                     summarize=False, as_json=False):
+        """
+        Start reading, and yield (ledger index, tx hash, text) for each
+        transaction, in the order they were validated, until stop() is
+        called. Raises KeyError if rippled refuses the subscription.
+        """
+        def explain(tx_json):
+            if as_json:
+                return txsplain.render_json(txsplain.tx_record(tx_json))
+            return txsplain.splain(tx_json, verbose=verbose,
+                                   ctx=txsplain.SplainContext(),
+                                   dump_json=False, max_nodes=max_nodes,
+                                   summarize=summarize)
+
+        t = threading.Thread(target=self.read)
+        t.daemon = True
+        t.start()
+        for tx_json, text, error in txsplain.imap_threaded(explain,
+                self.transactions(), workers=workers):
+            if error is not None:
+                if as_json:
+                    text = txsplain.render_json({"hash": tx_json["hash"],
+                                                 "error": str(error)})
+                else:
+                    text = "Couldn't explain %s: %s\n" % (tx_json["hash"], error)
+            yield tx_json["ledger_index"], tx_json["hash"], text
+        if self.error is not None:
+            raise self.error
+
+    def stop(self):
+        self.stopped.set()
+        if self.ws is not None:
+            self.ws.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Explain transactions as rippled validates them.")
+    parser.add_argument("accounts", nargs="*", metavar="ACCOUNT",
+                        help="only explain these accounts' transactions (addresses or Ripple Names)")
+    parser.add_argument("--url", default=RIPPLED_WS_URL,
+                        help="rippled's WebSocket API")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="transactions to buffer before reading more from rippled")
+    parser.add_argument("--max-nodes", type=int,
+                        help="describe at most this many affected nodes per transaction")
+    parser.add_argument("--summary", action="store_true",
+                        help="summarize affected nodes instead of listing each one")
+    parser.add_argument("--json", action="store_true",
+                        help="print structured records (one JSON object per line) instead of prose")
+    args = parser.parse_args()
+
+    txsplain.load_known_names()
+    accounts = []
+    for account in args.accounts:
+        if txsplain.is_ripple_name(account):
+            try:
+                account = txsplain.lookup_ripple_address(account)
+            except KeyError:
+                exit("Couldn't find %s." % account)
+        elif not txsplain.is_account_address(account):
+            exit("%s isn't an address or Ripple Name." % account)
+        accounts.append(account)
+
+    subscriber = Subscriber(args.url, accounts, queue_size=args.queue_size)
+    try:
+        for ledger_index, tx_hash, text in subscriber.explanations(
+                workers=args.workers, max_nodes=args.max_nodes,
+                summarize=args.summary, as_json=args.json):
+            if args.json:
+                print(text)
+            else:
+                print("=== %s (ledger %d) ===" % (tx_hash, ledger_index))
+                print(text)
+            sys.stdout.flush()
+    except KeyError as e:
+        print(e.args[0])
+    except KeyboardInterrupt:
+        subscriber.stop()
+    txsplain.save_known_names()
@@ -0,0 +1,72 @@
+"""
+DumpFileSource should read each dump file format the same way.
+"""
+
+import json, os, shutil, sys, tempfile, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import txsplain
+
+def fake_tx(n):
+    return {
+        "hash": "%064X" % n,
+        "TransactionType": "AccountSet",
+        "Account": "rf1BiGeXwwQoi8Z2ueFYTEXSwuJYfV2Jpn",
+        "ledger_index": 1000 + n,
+        "meta": {"TransactionIndex": 0, "TransactionResult": "tesSUCCESS",
+                 "AffectedNodes": []}
+    }
+
+class DumpFormatTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.txs = [fake_tx(n) for n in range(1, 4)]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, text):
+        path = os.path.join(self.dir, "dump")
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def assert_has_txs(self, path, txs):
+        source = txsplain.DumpFileSource([path])
+        for tx_json in txs:
+            found = source.call("tx", {"transaction": tx_json["hash"]})
+            self.assertEqual(found["ledger_index"], tx_json["ledger_index"])
+        for f in source._files:
+            f.close()
+
+    def test_json_lines(self):
+        path = self.write("".join(json.dumps(tx) + "\n" for tx in self.txs))
+        self.assert_has_txs(path, self.txs)
+
+    def test_json_lines_with_blank_lines(self):
+        path = self.write("\n" + "\n\n".join(json.dumps(tx) for tx in self.txs))
+        self.assert_has_txs(path, self.txs)
+
+    def test_one_line_list(self):
+        path = self.write(json.dumps(self.txs))
+        self.assert_has_txs(path, self.txs)
+
+    def test_one_line_record(self):
+        path = self.write(json.dumps(self.txs[0]) + "\n")
+        self.assert_has_txs(path, self.txs[:1])
+
+    def test_indented_list(self):
+        path = self.write(json.dumps(self.txs, indent=1))
+        self.assert_has_txs(path, self.txs)
+
+    def test_rippled_response(self):
+        path = self.write(json.dumps({"result": self.txs[0]}, indent=1))
+        self.assert_has_txs(path, self.txs[:1])
+
+    def test_empty_file(self):
+        for text in ("", "\n \n"):
+            path = self.write(text)
+            self.assertRaises(ValueError, txsplain.DumpFileSource, [path])
+
+if __name__ == "__main__":
+    unittest.main()
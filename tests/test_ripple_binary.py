@@ -0,0 +1,104 @@
+"""
+ripple_binary should decode rippled's binary transactions and metadata into
+the same JSON rippled sends.
+"""
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import ripple_binary
+
+# An OfferCreate as rippled serializes it (the example in the XRP Ledger
+# docs' serialization format page), and rippled's JSON for it. The blob's
+# hash is the transaction's hash, so it's rippled's exact serialization.
+# The blobs are text, as they come in rippled's JSON.
+TX_BLOB = (
+    u"120007220008000024001ABED82A2380BF2C2019001ABED764D55920AC939140000000"
+    "0000000000000000000055534400000000000A20B3C85F482532A9578DBB3950B85CA0"
+    "6594D165400000037E11D60068400000000000000A732103EE83BB432547885C219634"
+    "A1BC407A9DB0474145D69737D09CCDC63E1DEE7FE3744630440220143759437C04F7B6"
+    "1F012563AFE90D8DAFC46E86035E1D965A9CED282C97D4CE02204CFD241E86F17E0112"
+    "98FC1A39B63386C74306A5DE047E213B0F29EFA4571C2C8114DD76483FACDEE26E60D8"
+    "A586BB58D09F27045C46")
+TX_JSON = {
+    "Account": "rMBzp8CgpE441cp5PVyA9rpVV7oT8hP3ys",
+    "Expiration": 595640108,
+    "Fee": "10",
+    "Flags": 524288,
+    "OfferSequence": 1752791,
+    "Sequence": 1752792,
+    "SigningPubKey": "03EE83BB432547885C219634A1BC407A9DB0474145D69737D09CCDC63E1DEE7FE3",
+    "TakerGets": "15000000000",
+    "TakerPays": {
+        "currency": "USD",
+        "issuer": "rvYAfWj5gh67oV6fW32ZzP3Aw4Eubs59B",
+        "value": "7072.8"
+    },
+    "TransactionType": "OfferCreate",
+    "TxnSignature": "30440220143759437C04F7B61F012563AFE90D8DAFC46E86035E1D965A9CED282C97D4CE02204CFD241E86F17E011298FC1A39B63386C74306A5DE047E213B0F29EFA4571C2C",
+    "hash": "73734B611DDA23D3F5F62E20A173B78AB8406AC5015094DA53F53D39B9EDB06C"
+}
+
+# Metadata for it that debits the fee, field by field in canonical order
+META_BLOB = (
+    u"201C00000003"                         # TransactionIndex
+    "F8"                                    # AffectedNodes
+    "E5"                                    # . ModifiedNode
+    "110061"                                # .. LedgerEntryType AccountRoot
+    "2500A0C1B2"                            # .. PreviousTxnLgrSeq
+    "55" + "B" * 64 +                       # .. PreviousTxnID
+    "56" + "A" * 64 +                       # .. LedgerIndex
+    "E6"                                    # .. PreviousFields
+    "24001ABED8"                            # ... Sequence
+    "624000000005F5E10A"                    # ... Balance
+    "E1"
+    "E7"                                    # .. FinalFields
+    "2200000000"                            # ... Flags
+    "24001ABED9"                            # ... Sequence
+    "2D00000005"                            # ... OwnerCount
+    "624000000005F5E100"                    # ... Balance
+    "8114DD76483FACDEE26E60D8A586BB58D09F27045C46" # ... Account
+    "E1"
+    "E1"
+    "F1"
+    "031000")                               # TransactionResult tesSUCCESS
+META_JSON = {
+    "TransactionIndex": 3,
+    "AffectedNodes": [{
+        "ModifiedNode": {
+            "LedgerEntryType": "AccountRoot",
+            "PreviousTxnLgrSeq": 10535346,
+            "PreviousTxnID": "B" * 64,
+            "LedgerIndex": "A" * 64,
+            "PreviousFields": {
+                "Sequence": 1752792,
+                "Balance": "100000010"
+            },
+            "FinalFields": {
+                "Flags": 0,
+                "Sequence": 1752793,
+                "OwnerCount": 5,
+                "Balance": "100000000",
+                "Account": "rMBzp8CgpE441cp5PVyA9rpVV7oT8hP3ys"
+            }
+        }
+    }],
+    "TransactionResult": "tesSUCCESS"
+}
+
+class DecodeTest(unittest.TestCase):
+    def test_transaction(self):
+        tx_json = dict(TX_JSON)
+        del tx_json["hash"]
+        self.assertEqual(ripple_binary.decode(TX_BLOB), tx_json)
+
+    def test_transaction_with_meta(self):
+        expected = dict(TX_JSON, meta=META_JSON)
+        self.assertEqual(ripple_binary.decode_tx(TX_BLOB, META_BLOB), expected)
+
+    def test_truncated(self):
+        self.assertRaises(ripple_binary.BinaryError, ripple_binary.decode,
+                          TX_BLOB[:-8])
+
+if __name__ == "__main__":
+    unittest.main()
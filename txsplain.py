@@ -1,7 +1,11 @@
 #!/bin/env python
 
 from __future__ import print_function
-import json, sys, pickle, struct, re
+import json, sys, pickle, struct, re, socket, threading, time, sqlite3, os, argparse
+import mmap, copy, bisect, random, errno
+from collections import OrderedDict
+from decimal import Decimal, Context
+import ripple_binary
 from warnings import warn
 from datetime import datetime
 
@@ -12,7 +16,33 @@ RIPPLED_HOST = "s2.ripple.com"
 RIPPLED_PORT = 51234
 RIPPLE_ID_HOST = "id.ripple.com"
 RIPPLE_ID_PORT = 443
-PICKLE_FILE = "ripnames.pkl"
+RIPPLE_ID_HTTPS = True # False to talk to a local stand-in over plain HTTP
+RIPPLE_ID_TIMEOUT = 5 # socket timeout in seconds for id.ripple.com requests
+RIPPLE_ID_RATE = 20 # id.ripple.com requests per second, on average...
+RIPPLE_ID_BURST = 40 # ...with bursts of up to this many
+RIPPLE_ID_RETRIES = 2 # times a failed id.ripple.com request is retried
+RIPPLE_ID_BACKOFF = 0.25 # seconds before the first retry; doubles after that
+RIPPLE_ID_MAX_FAILURES = 5 # failed requests in a row before we stop asking...
+RIPPLE_ID_COOLDOWN = 30 # ...for this many seconds, and show addresses instead
+NAME_DEADLINE = 3 # seconds an explanation waits for Ripple Names (None: no limit)
+RIPPLED_POOL_SIZE = 8 # max simultaneous connections per rippled endpoint
+RIPPLED_POOL_IDLE_TIMEOUT = 30 # seconds before an idle connection is dropped
+RIPPLED_TIMEOUT = 30 # socket timeout in seconds
+NAME_LOOKUP_WORKERS = 8 # parallel Ripple Name lookups per transaction
+LEDGER_CACHE_SIZE = 1000 # validated ledger headers kept in memory
+RESERVE_CACHE_TTL = 60*60 # seconds before reserve settings are fetched again
+BATCH_WORKERS = 4 # explanations run at once in batch mode
+ACCOUNT_TX_PAGE_SIZE = 200 # transactions per account_tx request in history mode
+PICKLE_FILE = "ripnames.pkl" # legacy name cache, imported into NAMES_DB_FILE
+NAMES_DB_FILE = "ripnames.db"
+NAME_TTL = 30*24*60*60 # seconds before a known Ripple Name is looked up again
+UNKNOWN_NAME_TTL = 24*60*60 # same, for addresses with no Ripple Name
+EXPLANATION_CACHE_SIZE = 1000 # validated transactions/explanations kept in memory
+EXPLANATION_CACHE_FILE = None # set to e.g. "explanations.db" to also cache them on disk
+EXPLANATION_TTL = UNKNOWN_NAME_TTL # explanations include names, which can change
+FETCH_BINARY = False # fetch transactions as binary and decode them locally
+NAME_LOOKUPS = True # set to False to only use names that are already cached
+DUMP_PARSE_CACHE_SIZE = 16 # records from dump files kept parsed in memory
 
 # rippled constants ----------------------------
 TX_FLAGS = {
@@ -115,11 +145,28 @@ PATHSTEP_ISSUER = 0x20
 
 RIPPLE_EPOCH = 946684800#2000-01-01T00:00:00 UTC
 
+# optional dependencies -------------------
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 # Python 2/3-agnostic stuff ----------------
 if sys.version_info[:2] <= (2,7):
     import httplib
+    from Queue import Queue, Empty, Full
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
 else:
     import http.client as httplib
+    from queue import Queue, Empty, Full
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
 
 def decode_hex(s):
     if sys.version_info.major < 3:
@@ -150,17 +197,411 @@ def is_uint(s):
 def dumpjson(j):
     return json.dumps(j, sort_keys=True, indent=4, separators=(',', ': '))
 
+class LRUCache(object):
+    """
+    Thread-safe dictionary that holds at most max_size items, evicting
+    the least recently used one when it's full.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return default
+            self._items[key] = value # move to the most recently used end
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+class InFlightCall(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class InFlightTimeout(Exception):
+    """
+    A caller gave up waiting for someone else's call at its time due.
+    """
+    def __init__(self, due):
+        Exception.__init__(self, "Gave up waiting for a call in flight")
+        self.due = due
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls with the same key: the first caller runs
+    the function, and anyone asking for the same key before it finishes
+    waits and gets the same result (or exception) instead of making the
+    same request again. Nothing is kept once the call finishes; that's
+    what the caches are for. Callers share the result, so they mustn't
+    change it.
+    """
+    def __init__(self):
+        self._calls = {} # key -> InFlightCall
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        return self.do_by(None, key, func, *args, **kwargs)
+
+    def do_by(self, due, key, func, *args, **kwargs):
+        """
+        Like do, but if someone else's call is already running, only wait
+        for it until the time due (time.time(), or None for no limit), and
+        raise InFlightTimeout then. A caller that runs func itself isn't
+        limited; pass due to func too if it should be.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = InFlightCall()
+
+        if not leader:
+            tracer.count("coalesced.%s" % key[0])
+            timeout = None if due is None else max(due - time.time(), 0)
+            if not call.done.wait(timeout):
+                raise InFlightTimeout(due)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+class SQLiteStore(object):
+    """
+    Base for on-disk caches. Subclasses list their CREATE statements in
+    SCHEMA. Each thread gets its own connection, since sqlite connections
+    can't be shared across threads, and the database uses WAL mode so
+    several processes can read it while one writes.
+    """
+    SCHEMA = []
+
+    def __init__(self, fname):
+        self.fname = fname
+        self._local = threading.local()
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        for statement in self.SCHEMA:
+            db.execute(statement)
+        db.commit()
+
+    def _db(self):
+        if not hasattr(self._local, "db"):
+            self._local.db = sqlite3.connect(self.fname, timeout=30)
+            self._local.db.execute("PRAGMA synchronous=NORMAL")
+        return self._local.db
+
+    def close(self):
+        if hasattr(self._local, "db"):
+            self._local.db.close()
+            del self._local.db
+
+# tracing -----------------
+class Span(object):
+    """
+    One timed operation, e.g. an RPC or a name lookup. Spans opened while
+    another is open on the same thread are nested in it, and their times
+    add up in the breakdown of the outermost (root) span, so you can see
+    where a whole request's time went. Use with a with statement.
+    """
+    __slots__ = ("tracer", "name", "tags", "parent", "root", "breakdown",
+                 "start", "duration", "error")
+
+    def __init__(self, tracer, name, tags):
+        self.tracer = tracer
+        self.name = name
+        self.tags = tags
+        self.parent = self.root = self.breakdown = None
+        self.start = self.duration = self.error = None
+
+    def set(self, key, value):
+        self.tags[key] = value
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        if stack:
+            self.parent = stack[-1]
+            self.root = self.parent.root
+        else:
+            self.root = self
+            self.breakdown = {} # span name -> [count, seconds]
+        stack.append(self)
+        self.start = clock()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = clock() - self.start
+        if exc_type is not None:
+            self.error = "%s: %s" % (exc_type.__name__, exc)
+        self.tracer._stack().pop()
+        self.tracer._finish(self)
+        return False
+
+class NullSpan(object):
+    """
+    Span that does nothing, for when tracing is off.
+    """
+    __slots__ = ()
+
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class SpanContinuation(object):
+    """
+    Nests the spans a thread opens in a span from another thread (e.g. the
+    one that started it), for as long as it's in effect.
+    """
+    def __init__(self, tracer, span):
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self):
+        self.tracer._stack().append(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer._stack().pop()
+        return False
+
+class NullTracer(object):
+    """
+    The default tracer, which records nothing. Its methods do no work, so
+    instrumented code costs next to nothing unless tracing is turned on
+    with set_tracer.
+    """
+    enabled = False
+
+    def span(self, name, **tags):
+        return NULL_SPAN
+
+    def continued(self, span):
+        return NULL_SPAN
+
+    def count(self, name, value=1):
+        pass
+
+class Tracer(object):
+    """
+    Records spans and counters, and keeps running totals of them that can
+    be read with stats() or exported with prometheus_text(). Counters named
+    "cache.NAME.hit" and "cache.NAME.miss" also get a hit ratio.
+    - callback: called with each finished Span (from whichever thread ran
+        it), e.g. span_logger() to log them.
+    Safe to share between threads.
+    """
+    enabled = True
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._spans = {} # span name -> {"count", "seconds", "max_seconds", "errors"}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def span(self, name, **tags):
+        return Span(self, name, tags)
+
+    def continued(self, span):
+        """
+        Use in a worker thread to count its spans as part of span. E.g.:
+            with tracer.span("work") as span:
+                start threads that run: with tracer.continued(span): ...
+        """
+        return SpanContinuation(self, span)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def _finish(self, span):
+        with self._lock:
+            totals = self._spans.get(span.name)
+            if totals is None:
+                totals = self._spans[span.name] = {"count": 0, "seconds": 0.0,
+                                                   "max_seconds": 0.0, "errors": 0}
+            totals["count"] += 1
+            totals["seconds"] += span.duration
+            totals["max_seconds"] = max(totals["max_seconds"], span.duration)
+            if span.error is not None:
+                totals["errors"] += 1
+            if span.root is not span:
+                part = span.root.breakdown.setdefault(span.name, [0, 0.0])
+                part[0] += 1
+                part[1] += span.duration
+        if self.callback is not None:
+            self.callback(span)
+
+    def stats(self):
+        """
+        Totals so far: {"spans": {name: {"count", "seconds", "max_seconds",
+        "errors"}}, "counters": {name: value}, "cache_hit_ratios": {cache:
+        hits / lookups}}.
+        """
+        with self._lock:
+            spans = dict((name, dict(totals)) for name, totals in self._spans.items())
+            counters = dict(self._counters)
+        lookups = {}
+        for name, value in counters.items():
+            if name.startswith("cache.") and name.endswith((".hit", ".miss")):
+                cache, outcome = name[len("cache."):].rsplit(".", 1)
+                hits, total = lookups.get(cache, (0, 0))
+                if outcome == "hit":
+                    hits += value
+                lookups[cache] = (hits, total + value)
+        ratios = dict((cache, hits / float(total) if total else 0.0)
+                      for cache, (hits, total) in lookups.items())
+        return {"spans": spans, "counters": counters, "cache_hit_ratios": ratios}
+
+    def prometheus_text(self, prefix="txsplain"):
+        """
+        The totals so far, in Prometheus' text exposition format.
+        """
+        stats = self.stats()
+        lines = []
+        def metric(name, kind, samples):
+            lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+            for suffix, labels, value in samples:
+                lines.append("%s_%s%s%s %r" % (prefix, name, suffix, labels, value))
+
+        spans = sorted(stats["spans"].items())
+        metric("span_seconds", "summary",
+               [("_sum", '{span="%s"}' % name, totals["seconds"])
+                for name, totals in spans] +
+               [("_count", '{span="%s"}' % name, totals["count"])
+                for name, totals in spans])
+        metric("span_errors_total", "counter",
+               [("", '{span="%s"}' % name, totals["errors"])
+                for name, totals in spans])
+        for name, value in sorted(stats["counters"].items()):
+            metric(re.sub("[^a-zA-Z0-9_]", "_", name) + "_total", "counter",
+                   [("", "", value)])
+        metric("cache_hit_ratio", "gauge",
+               [("", '{cache="%s"}' % cache, ratio)
+                for cache, ratio in sorted(stats["cache_hit_ratios"].items())])
+        return "\n".join(lines) + "\n"
+
+def span_logger(stream=None, min_seconds=0):
+    """
+    Tracer callback that writes a line to stream (default: stderr) for
+    each root span that took at least min_seconds, with the breakdown of
+    the spans inside it, and for each span that failed. E.g.:
+    trace: explain 812.31ms | names.prefetch 1x 650.02ms, rpc.tx 1x 120.50ms
+    """
+    def log(span):
+        if span.root is span and span.duration >= min_seconds:
+            line = "trace: %s %.2fms" % (span.name, span.duration*1000)
+            for key, value in sorted(span.tags.items()):
+                line += " %s=%s" % (key, value)
+            if span.breakdown:
+                line += " | " + ", ".join("%s %dx %.2fms" % (name, count, seconds*1000)
+                        for name, (count, seconds) in sorted(span.breakdown.items()))
+        elif span.error is not None:
+            line = "trace: %s" % span.name
+        else:
+            return
+        if span.error is not None:
+            line += " failed: %s" % span.error
+        (stream or sys.stderr).write(line + "\n")
+    return log
+
+tracer = NullTracer()
+def set_tracer(new_tracer):
+    """
+    Trace everything from now on with new_tracer (e.g. a Tracer), or turn
+    tracing off again with NullTracer().
+    """
+    global tracer
+    tracer = new_tracer
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = tracer.prometheus_text().encode("utf-8") if tracer.enabled else b""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def serve_metrics(port, host="127.0.0.1"):
+    """
+    Serve the current tracer's totals for Prometheus to scrape, at
+    http://host:port/metrics, from a background thread.
+    """
+    server = MetricsServer((host, port), MetricsHandler)
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server
+
 # ripple utils ------------
-def amount_to_string(amount, any_if=None):
+def amount_to_string(amount, any_if=None, ctx=None):
+    """
+    Describe an amount, either as rippled gives it or as an amount_record.
+    """
     if is_string(amount):
-        return "%f XRP" % drops_to_xrp(amount)
+        return "%s XRP" % format_drops(amount)
+    elif "drops" in amount:
+        return "%s XRP" % amount["value"]
     else:
         if any_if == amount["issuer"]:
             # If SendMax issuer == source account, special case "use any"
             # If Amount issuer == destination account, same
             return "%s %s" % (amount["value"], amount["currency"])
         else:
-            return "%s %s.%s" % (amount["value"], amount["currency"], lookup_rippleid(amount["issuer"], tilde=False))
+            return "%s %s.%s" % (amount["value"], amount["currency"], lookup_rippleid(amount["issuer"], tilde=False, ctx=ctx))
 
 
 def is_account_address(s):
@@ -180,6 +621,92 @@ def is_currency_code(s):
 def drops_to_xrp(drops):
     return int(drops) / 1000000.0
 
+# Amounts are kept exact: XRP as an int number of drops, and issued currency
+# values as Decimals. Issued currency values have a 54-bit mantissa and
+# exponents from -96 to 80, so adding or subtracting two of them can need
+# ~190 significant digits; AMOUNT_CONTEXT does that arithmetic without
+# rounding. (Parsing with Decimal() is always exact.)
+AMOUNT_CONTEXT = Context(prec=200)
+
+def format_drops(drops):
+    """
+    Exact XRP amount for a number of drops (int or string), e.g. "-0.000012".
+    """
+    drops = int(drops)
+    sign = "-" if drops < 0 else ""
+    return "%s%d.%06d" % ((sign,) + divmod(abs(drops), 1000000))
+
+def format_value(value):
+    """
+    Exact issued currency value (a Decimal), without an exponent.
+    """
+    return format(value, "f")
+
+class FlagTable(object):
+    """
+    Decoder for one or more sets of flag definitions (e.g. TX_FLAGS["*"] and
+    TX_FLAGS["Payment"]). The names for every combination of named bits are
+    worked out when the table is built (at import, for the tables below), so
+    decoding a Flags value is one dict lookup, and the table is never
+    modified after that. Bits in ignored_mask are known but never named
+    (e.g. reserve flags).
+    """
+    def __init__(self, *flag_defs, **kwargs):
+        defs = [flag for defs in flag_defs for flag in sorted(defs.items())]
+        self._named_mask = 0
+        self._names = {0: ()} # flags & _named_mask -> tuple of names
+        for flag_bit,flag_name in defs:
+            self._named_mask |= flag_bit
+            for key, names in list(self._names.items()):
+                self._names[key | flag_bit] = names + (flag_name,)
+        self.mask = self._named_mask | kwargs.get("ignored_mask", 0)
+
+    def names(self, flags):
+        """
+        Names of the known flags that are enabled, in definition order.
+        """
+        return self._names[flags & self._named_mask]
+
+    def unknown(self, flags):
+        """
+        Enabled bits that this table has no definition for.
+        """
+        return flags & ~self.mask & 0xFFFFFFFF
+
+    def decode(self, flags):
+        """
+        Names of the enabled flags, followed by any unknown bits as a hex
+        mask, e.g. ("tfPartialPayment", "0x00001000 (unknown)").
+        """
+        unknown = self.unknown(flags)
+        if unknown:
+            return self.names(flags) + ("0x%08X (unknown)" % unknown,)
+        return self.names(flags)
+
+TX_FLAG_TABLES = dict((tx_type, FlagTable(TX_FLAGS["*"], defs))
+                      for tx_type, defs in TX_FLAGS.items() if tx_type != "*")
+# also applies to transaction types we don't know about
+TX_COMMON_FLAGS = FlagTable(TX_FLAGS["*"])
+
+lsfLowReserve = 0x00010000
+lsfHighReserve = 0x00020000
+LEDGER_FLAG_TABLES = {
+    "AccountRoot": FlagTable(LEDGER_FLAGS["AccountRoot"]),
+    "RippleState": FlagTable(LEDGER_FLAGS["RippleState"],
+                             ignored_mask=lsfLowReserve|lsfHighReserve),
+    "Offer": FlagTable(LEDGER_FLAGS["Offer"]),
+}
+# entry types without any flags defined
+LEDGER_NO_FLAGS = FlagTable({})
+
+# Each RippleState flag belongs to either the low or the high account
+RIPPLE_STATE_LOW_FLAGS = FlagTable(dict((flag_bit, flag_name)
+    for flag_bit,flag_name in LEDGER_FLAGS["RippleState"].items()
+    if "Low" in flag_name))
+RIPPLE_STATE_HIGH_FLAGS = FlagTable(dict((flag_bit, flag_name)
+    for flag_bit,flag_name in LEDGER_FLAGS["RippleState"].items()
+    if "High" in flag_name))
+
 def quality_to_percent(quality):
     return quality / 10000000.0
 
@@ -188,54 +715,555 @@ def ripple_time_to_human(seconds):
     # Don't try this in 32-bit ints --------^
 
 
+# connection pooling ------
+class ConnectionPool(object):
+    """
+    Thread-safe pool of HTTP/1.1 keep-alive connections to one endpoint.
+    - max_size: at most this many requests are in flight at once; more
+        callers block until a connection frees up.
+    - idle_timeout: connections unused for this many seconds are closed
+        instead of reused, since the server has probably dropped them.
+    """
+    def __init__(self, host, port, max_size=RIPPLED_POOL_SIZE,
+                 idle_timeout=RIPPLED_POOL_IDLE_TIMEOUT,
+                 timeout=RIPPLED_TIMEOUT, https=False):
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.https = https
+        self._idle = [] # (connection, time last used)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _connect(self):
+        if self.https:
+            return httplib.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        else:
+            return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _checkout(self):
+        now = time.time()
+        with self._lock:
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                if now - last_used < self.idle_timeout:
+                    return conn
+                conn.close()
+        return self._connect()
+
+    def _checkin(self, conn):
+        with self._lock:
+            self._idle.append( (conn, time.time()) )
+
+    def request(self, method, url, body=None, headers={}):
+        """
+        Send a request over a pooled connection and return (status, body).
+        If a reused connection turns out to have been closed or reset by the
+        server, the request is retried once on a fresh connection. Timeouts
+        aren't retried.
+        """
+        self._slots.acquire()
+        try:
+            conn = self._checkout()
+            reused = conn.sock is not None
+            try:
+                response, data = self._send(conn, method, url, body, headers)
+            except (httplib.HTTPException, socket.error) as e:
+                if not reused or not connection_dropped(e):
+                    raise
+                conn = self._connect()
+                response, data = self._send(conn, method, url, body, headers)
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._checkin(conn)
+            return response.status, data
+        finally:
+            self._slots.release()
+
+    def _send(self, conn, method, url, body, headers):
+        try:
+            conn.request(method, url, body, headers)
+            response = conn.getresponse()
+            return response, response.read()
+        except Exception:
+            conn.close()
+            raise
+
+    def close(self):
+        with self._lock:
+            for conn, last_used in self._idle:
+                conn.close()
+            self._idle = []
+
+def connection_dropped(e):
+    """
+    True if e means the server closed or reset the connection, as servers
+    do with keep-alive connections they've given up on.
+    """
+    if isinstance(e, socket.timeout):
+        return False
+    if isinstance(e, httplib.BadStatusLine):
+        return True # includes RemoteDisconnected
+    return getattr(e, "errno", None) in (errno.ECONNRESET, errno.EPIPE,
+                                         errno.ECONNABORTED)
+
+connection_pools = {}
+pools_lock = threading.Lock()
+def get_connection_pool(host, port, https=False, timeout=RIPPLED_TIMEOUT):
+    """
+    Get the shared connection pool for an endpoint, creating it if necessary.
+    """
+    with pools_lock:
+        key = (host, port, https, timeout)
+        if key not in connection_pools:
+            connection_pools[key] = ConnectionPool(host, port, https=https,
+                                                   timeout=timeout)
+        return connection_pools[key]
+
+
+# data sources ------------------------------------
+class RPCSource(object):
+    """
+    Sends commands to rippled's JSON-RPC API, over the shared connection
+    pool. The server is RIPPLED_HOST:RIPPLED_PORT unless given.
+    """
+    def __init__(self, host=None, port=None):
+        self.host = host
+        self.port = port
+
+    def call(self, method, params):
+        command = {
+            "method": method,
+            "params": [params]
+        }
+
+        pool = get_connection_pool(self.host or RIPPLED_HOST,
+                                   self.port or RIPPLED_PORT)
+        body = json.dumps(command)
+        status, s = pool.request("POST", "/", body,
+                                 {"Content-Type": "application/json"})
+        tracer.count("rpc.bytes_sent", len(body))
+        tracer.count("rpc.bytes_received", len(s))
+
+        response_json = json.loads(s.decode("utf-8"))
+        if "result" in response_json:
+            return response_json["result"]
+        else:
+            warn(response_json)
+            raise KeyError("Response from rippled doesn't have result as expected")
+
+class DumpFileSource(object):
+    """
+    Answers rippled commands (tx, ledger, ledger_entry, account_info,
+    account_tx and server_info) from dump files instead of a server, so archives can be
+    explained with no network, and the same way every time.
+
+    Each file is either JSON lines or one JSON document holding a record or
+    a list of records. A record is a transaction (as from tx), a ledger (as
+    from ledger, optionally with expanded transactions and accountState), or
+    a ledger entry (anything with a LedgerEntryType). Whole rippled
+    responses are fine too; they're unwrapped. JSON lines files are
+    memory-mapped, and only their index is kept in memory.
+
+    Ledgers are assumed to be validated unless they say otherwise. Ledger
+    entries aren't versioned: ledger_entry and account_info answer with the
+    last version of an entry in the files, whatever ledger is asked for.
+    account_tx counts a transaction as affecting every account that appears
+    in it or its metadata.
+    """
+    def __init__(self, paths):
+        self._records = [] # (mmap, start, end) for JSON lines, else the record
+        self._parsed = LRUCache(DUMP_PARSE_CACHE_SIZE)
+        self._txs = {} # tx hash -> (record #, position in ledger or None)
+        self._ledgers = {} # ledger index -> record #
+        self._ledger_hashes = {} # ledger hash -> ledger index
+        self._ledger_txs = {} # ledger index -> tx hashes, from tx records
+        self._account_txs = {} # address -> [(ledger index, tx index, tx hash)]
+        self._account_txs_sorted = True
+        self._entries = {} # entry index -> (record #, position or None)
+        self._entry_keys = {} # see entry_key -> (record #, position or None)
+        self._reserves = None # (ledger index, base drops, owner drops)
+        self._files = []
+        for path in paths:
+            self.load(path)
+
+    def load(self, path):
+        f = open(path, "rb")
+        first_line = b""
+        while not first_line.strip():
+            first_line = f.readline()
+            if not first_line:
+                f.close()
+                raise ValueError("Dump file %s is empty" % path)
+        try:
+            json.loads(first_line.decode("utf-8"))
+            # one record per line, unless that line was the whole file
+            is_jsonl = any(line.strip() for line in f)
+        except ValueError:
+            is_jsonl = False
+        f.seek(0)
+        self._files.append(f)
+
+        if not is_jsonl:
+            doc = json.loads(f.read().decode("utf-8"))
+            for record in (doc if isinstance(doc, list) else [doc]):
+                self._records.append(unwrap_dump_record(record))
+                self._index(len(self._records)-1, self._records[-1])
+            return
+
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = 0
+        while start < len(mm):
+            end = mm.find(b"\n", start)
+            if end == -1:
+                end = len(mm)
+            line = mm[start:end].strip()
+            if line:
+                self._records.append((mm, start, end))
+                record = unwrap_dump_record(json.loads(line.decode("utf-8")))
+                self._index(len(self._records)-1, record)
+            start = end + 1
+
+    def _index(self, record_no, record):
+        kind = dump_record_kind(record)
+        if kind == "transaction":
+            self._index_tx(record, (record_no, None))
+        elif kind == "entry":
+            self._index_entry(record, (record_no, None))
+        elif kind == "ledger":
+            ledger_index = int(record["ledger_index"])
+            self._ledgers[ledger_index] = record_no
+            if "ledger_hash" in record:
+                self._ledger_hashes[record["ledger_hash"].upper()] = ledger_index
+            for i, tx_json in enumerate(record.get("transactions", [])):
+                if not is_string(tx_json):
+                    tx_json.setdefault("ledger_index", ledger_index)
+                    self._index_tx(tx_json, (record_no, ("transactions", i)))
+            for i, entry in enumerate(record.get("accountState", [])):
+                if not is_string(entry):
+                    self._index_entry(entry, (record_no, ("accountState", i)))
+        else:
+            warn("Don't know what to do with dump record %d" % record_no)
+
+    def _index_tx(self, tx_json, locator):
+        tx_hash = tx_json["hash"].upper()
+        self._txs[tx_hash] = locator
+        if "ledger_index" in tx_json:
+            ledger_index = int(tx_json["ledger_index"])
+            self._ledger_txs.setdefault(ledger_index, []).append(tx_hash)
+            if tx_json["TransactionType"] == "SetFee":
+                self._note_reserves(ledger_index, tx_json)
+        else:
+            ledger_index = 0
+        meta = tx_json.get("meta", tx_json.get("metaData", {}))
+        key = (ledger_index, meta.get("TransactionIndex", 0), tx_hash)
+        for address in tx_addresses(tx_json):
+            self._account_txs.setdefault(address, []).append(key)
+        self._account_txs_sorted = False
+
+    def _index_entry(self, entry, locator):
+        if "index" in entry:
+            self._entries[entry["index"].upper()] = locator
+        key = entry_key(entry)
+        if key:
+            self._entry_keys[key] = locator
+        if entry["LedgerEntryType"] == "FeeSettings":
+            self._note_reserves(0, entry)
+
+    def _note_reserves(self, ledger_index, fields):
+        if self._reserves and self._reserves[0] > ledger_index:
+            return
+        if "ReserveBase" in fields and "ReserveIncrement" in fields:
+            self._reserves = (ledger_index, fields["ReserveBase"],
+                              fields["ReserveIncrement"])
+
+    def _record(self, record_no):
+        record = self._records[record_no]
+        if not isinstance(record, tuple):
+            return record
+        parsed = self._parsed.get(record_no)
+        if parsed is None:
+            mm, start, end = record
+            parsed = unwrap_dump_record(json.loads(mm[start:end].decode("utf-8")))
+            self._parsed.put(record_no, parsed)
+        return parsed
+
+    def _lookup(self, locator):
+        """
+        A copy of the record (or part of a record) at locator, which callers
+        are free to change.
+        """
+        record_no, position = locator
+        record = self._record(record_no)
+        if position is not None:
+            field, i = position
+            record = record[field][i]
+        return copy.deepcopy(record)
+
+    def ledger_indexes(self):
+        """
+        Indexes of the ledgers in the files, in order.
+        """
+        return sorted(self._ledgers)
+
+    def call(self, method, params):
+        handler = getattr(self, "do_" + method, None)
+        if handler is None:
+            return {"error": "unknownCmd", "status": "error"}
+        return handler(params)
+
+    def do_tx(self, params):
+        locator = self._txs.get(params["transaction"].upper())
+        if locator is None:
+            return {"error": "txnNotFound", "status": "error"}
+        tx_json = self._lookup(locator)
+        if locator[1] is not None:
+            # part of a ledger
+            ledger = self._record(locator[0])
+            tx_json.setdefault("ledger_index", int(ledger["ledger_index"]))
+        if "metaData" in tx_json:
+            tx_json["meta"] = tx_json.pop("metaData")
+        tx_json.setdefault("validated", True)
+        return tx_json
+
+    def _ledger_index(self, params):
+        if params.get("ledger_hash"):
+            return self._ledger_hashes.get(params["ledger_hash"].upper())
+        ledger_index = params.get("ledger_index", "validated")
+        if ledger_index in ("validated", "closed", "current"):
+            return max(self._ledgers) if self._ledgers else None
+        return int(ledger_index)
+
+    def do_ledger(self, params):
+        ledger_index = self._ledger_index(params)
+        if ledger_index not in self._ledgers:
+            return {"error": "lgrNotFound", "status": "error"}
+        record = self._record(self._ledgers[ledger_index])
+        header = dict((field, copy.deepcopy(value)) for field, value
+                      in record.items()
+                      if field not in ("transactions", "accountState"))
+        validated = header.pop("validated", True)
+
+        if params.get("transactions"):
+            tx_hashes = []
+            for tx_json in record.get("transactions",
+                                      self._ledger_txs.get(ledger_index, [])):
+                tx_hashes.append(tx_json if is_string(tx_json) else tx_json["hash"])
+            if params.get("expand"):
+                header["transactions"] = []
+                for tx_hash in tx_hashes:
+                    tx_json = self.do_tx({"transaction": tx_hash})
+                    if "error" in tx_json:
+                        return {"error": "lgrNotFound", "status": "error"}
+                    # expanded ledgers call it metaData
+                    tx_json["metaData"] = tx_json.pop("meta")
+                    header["transactions"].append(tx_json)
+            else:
+                header["transactions"] = tx_hashes
+        return {"ledger": header, "ledger_index": ledger_index,
+                "validated": validated}
+
+    def do_ledger_entry(self, params):
+        if "index" in params:
+            locator = self._entries.get(params["index"].upper())
+        elif "account_root" in params:
+            locator = self._entry_keys.get(("account_root", params["account_root"]))
+        elif "ripple_state" in params:
+            locator = self._entry_keys.get(("ripple_state",
+                tuple(sorted(params["ripple_state"]["accounts"])),
+                params["ripple_state"]["currency"]))
+        elif "offer" in params and not is_string(params["offer"]):
+            locator = self._entry_keys.get(("offer", params["offer"]["account"],
+                                            int(params["offer"]["seq"])))
+        elif "offer" in params:
+            locator = self._entries.get(params["offer"].upper())
+        else:
+            return {"error": "invalidParams", "status": "error"}
+        if locator is None:
+            return {"error": "entryNotFound", "status": "error"}
+        node = self._lookup(locator)
+        return {"index": node.get("index"), "node": node, "validated": True}
+
+    def do_account_info(self, params):
+        locator = self._entry_keys.get(("account_root", params["account"]))
+        if locator is None:
+            return {"error": "actNotFound", "status": "error"}
+        return {"account_data": self._lookup(locator), "validated": True}
+
+    def do_account_tx(self, params):
+        address = params["account"]
+        if address not in self._account_txs and \
+                ("account_root", address) not in self._entry_keys:
+            return {"error": "actNotFound", "status": "error"}
+        if not self._account_txs_sorted:
+            for keys in self._account_txs.values():
+                keys[:] = sorted(set(keys)) # a tx can be in a ledger and on its own
+            self._account_txs_sorted = True
+        keys = self._account_txs.get(address, [])
+
+        ledger_min = int(params.get("ledger_index_min", -1))
+        ledger_max = int(params.get("ledger_index_max", -1))
+        low = max(ledger_min, 0)
+        high = ledger_max if ledger_max >= 0 else float("inf")
+        limit = int(params.get("limit", ACCOUNT_TX_PAGE_SIZE))
+        marker = params.get("marker")
+        # (ledger, seq) sorts before any key in that ledger with that index
+        if params.get("forward"):
+            start = (marker["ledger"], marker["seq"]) if marker else (low, 0)
+            i = bisect.bisect_left(keys, start)
+            page = [key for key in keys[i:i+limit+1] if key[0] <= high]
+        else:
+            if marker:
+                end = (marker["ledger"], marker["seq"] + 1)
+            else:
+                end = (high + 1, 0)
+            i = bisect.bisect_left(keys, end)
+            page = [key for key in reversed(keys[max(i-limit-1, 0):i])
+                    if key[0] >= low]
+
+        result = {"account": address, "ledger_index_min": ledger_min,
+                  "ledger_index_max": ledger_max, "limit": limit,
+                  "transactions": [], "validated": True}
+        if len(page) > limit:
+            result["marker"] = {"ledger": page[limit][0], "seq": page[limit][1]}
+        for ledger_index, tx_index, tx_hash in page[:limit]:
+            tx_json = self.do_tx({"transaction": tx_hash})
+            result["transactions"].append({"meta": tx_json.pop("meta"),
+                                           "tx": tx_json,
+                                           "validated": tx_json.pop("validated")})
+        return result
+
+    def do_server_info(self, params):
+        if self._reserves is None:
+            return {"error": "noNetwork", "status": "error"}
+        ledger_index, reserve_base, reserve_owner = self._reserves
+        return {"info": {"validated_ledger": {
+            "seq": ledger_index,
+            "reserve_base_xrp": drops_to_xrp(reserve_base),
+            "reserve_inc_xrp": drops_to_xrp(reserve_owner)
+        }}}
+
+def unwrap_dump_record(record):
+    """
+    Get the transaction, ledger or ledger entry out of a rippled response
+    that was dumped as-is.
+    """
+    if "result" in record:
+        record = record["result"]
+    if isinstance(record.get("ledger"), dict):
+        validated = record.get("validated")
+        record = record["ledger"]
+        if validated is not None:
+            record["validated"] = validated
+    for field in ("node", "account_data"):
+        if field in record:
+            entry = record[field]
+            if "index" in record and "index" not in entry:
+                entry["index"] = record["index"]
+            record = entry
+    return record
+
+def dump_record_kind(record):
+    if "TransactionType" in record:
+        return "transaction"
+    if "LedgerEntryType" in record:
+        return "entry"
+    if "ledger_index" in record:
+        return "ledger"
+    return None
+
+def entry_key(entry):
+    """
+    What ledger_entry would look a ledger entry up by, other than its index.
+    """
+    entry_type = entry["LedgerEntryType"]
+    if entry_type == "AccountRoot":
+        return ("account_root", entry["Account"])
+    if entry_type == "RippleState":
+        return ("ripple_state", tuple(sorted([entry["LowLimit"]["issuer"],
+                                              entry["HighLimit"]["issuer"]])),
+                entry["Balance"]["currency"])
+    if entry_type == "Offer":
+        return ("offer", entry["Account"], entry["Sequence"])
+    return None
+
+data_source = RPCSource()
+def set_data_source(source):
+    """
+    Use something other than rippled (e.g. a DumpFileSource) to answer
+    json_rpc_call.
+    """
+    global data_source
+    data_source = source
+
 def json_rpc_call(method, params={}):
     """
-    Connect to rippled's JSON-RPC API.
+    Run a rippled command, against the current data source (rippled's
+    JSON-RPC API, by default).
     - method: string, e.g. "account_info"
     - params: dictionary (JSON object),
         e.g. {"account": "rvYAfWj5gh67oV6fW32ZzP3Aw4Eubs59B",
               "ledger" : "current"}
     """
-    command = {
-        "method": method,
-        "params": [params]
-    }
-
-    conn = httplib.HTTPConnection(RIPPLED_HOST, RIPPLED_PORT)
-    conn.request("POST", "/", json.dumps(command))
-    response = conn.getresponse()
+    with tracer.span("rpc." + method):
+        return data_source.call(method, params)
 
-    s = response.read()
-
-    response_json = json.loads(s.decode("utf-8"))
-    if "result" in response_json:
-        return response_json["result"]
-    else:
-        warn(response_json)
-        raise KeyError("Response from rippled doesn't have result as expected")
+# Concurrent requests for the same thing (e.g. a transaction several people
+# asked about at once) share one round trip.
+inflight = SingleFlight()
 
-def tx(tx_hash):
+def tx(tx_hash, binary=None):
     """
-    rippled tx command
+    rippled tx command. If binary (default: FETCH_BINARY), the transaction
+    and metadata are fetched in binary and decoded here, which makes for a
+    much smaller response.
     """
+    if binary is None:
+        binary = FETCH_BINARY
+    return inflight.do(("tx", tx_hash.upper(), binary), fetch_tx, tx_hash, binary)
+
+def fetch_tx(tx_hash, binary):
     params = {
         "transaction": tx_hash,
-        "binary": False
+        "binary": binary
     }
     tx = json_rpc_call("tx", params)
 
     if "status" in tx and tx["status"]=="error":
         raise KeyError("tx not found")
+    if binary and is_string(tx.get("meta")):
+        tx = decode_binary_tx(tx, tx["tx"], tx["meta"])
     return tx
 
+def decode_binary_tx(result, tx_blob, meta_blob):
+    """
+    Build a transaction's JSON from its binary form, plus the fields of
+    result (a tx response or ledger entry) that aren't part of the blobs.
+    """
+    tx_json = ripple_binary.decode_tx(tx_blob, meta_blob)
+    for field in ("hash", "inLedger", "ledger_index", "validated", "date"):
+        if field in result:
+            tx_json[field] = result[field]
+    if "ledger_index" in tx_json:
+        ripple_binary.synthesize_delivered_amount(tx_json)
+    return tx_json
 
-def lookup_ledger(ledger_index=0, ledger_hash="", expand=False):
+
+def lookup_ledger(ledger_index=0, ledger_hash="", expand=False, transactions=True):
     assert ledger_index or ledger_hash
+    return inflight.do(("ledger", ledger_index, ledger_hash, expand, transactions),
+                       fetch_ledger, ledger_index, ledger_hash, expand,
+                       transactions)
+
+def fetch_ledger(ledger_index, ledger_hash, expand, transactions):
 
     #You should probably not pass both, but this'll let
     # rippled decide what to do in that case.
     params = {
-        "transactions": True,
+        "transactions": transactions,
         "expand": expand
     }
     if ledger_index:
@@ -250,8 +1278,87 @@ def lookup_ledger(ledger_index=0, ledger_hash="", expand=False):
     else:
         raise KeyError("Response from rippled doesn't have a ledger as expected")
 
+ledger_headers = LRUCache(LEDGER_CACHE_SIZE)
+def lookup_ledger_header(ledger_index, tx_count=False):
+    """
+    Get a ledger's header without its list of transactions. If tx_count is
+    True, the header also has a "transaction_count" field (which takes
+    fetching the transaction hashes once). Headers of validated ledgers
+    never change, so they're kept in the ledger_headers cache.
+    """
+    header = ledger_headers.get(ledger_index)
+    if header and (not tx_count or "transaction_count" in header):
+        tracer.count("cache.ledger_headers.hit")
+        return header
+    tracer.count("cache.ledger_headers.miss")
+    return inflight.do(("ledger_header", ledger_index, tx_count),
+                       fetch_ledger_header, ledger_index, tx_count)
+
+def fetch_ledger_header(ledger_index, tx_count):
+    params = {
+        "ledger_index": ledger_index,
+        "transactions": tx_count,
+        "expand": False
+    }
+    result = json_rpc_call("ledger", params)
+    if "ledger" not in result:
+        raise KeyError("Response from rippled doesn't have a ledger as expected")
+
+    header = result["ledger"]
+    if tx_count:
+        header["transaction_count"] = len(header.pop("transactions", []))
+    if result.get("validated") and is_uint(ledger_index):
+        ledger_headers.put(ledger_index, header)
+    return header
+
+def lookup_ledger_transactions(ledger_index, binary=None):
+    """
+    Fetch a ledger along with all its transactions and their metadata, in
+    one request. Returns (header, transactions), where the header is as
+    from lookup_ledger_header(tx_count=True) and the transactions are in
+    the same format as the tx command returns, in order of execution.
+    If binary (default: FETCH_BINARY), the transactions are fetched in
+    binary and decoded here.
+    """
+    if binary is None:
+        binary = FETCH_BINARY
+    params = {
+        "ledger_index": ledger_index,
+        "transactions": True,
+        "expand": True,
+        "binary": binary
+    }
+    result = json_rpc_call("ledger", params)
+    if "ledger" not in result:
+        raise KeyError("Response from rippled doesn't have a ledger as expected")
+
+    header = result["ledger"]
+    validated = result.get("validated", False)
+    transactions = header.pop("transactions", [])
+    header["transaction_count"] = len(transactions)
+    if validated:
+        ledger_headers.put(int(header["ledger_index"]), header)
+
+    for i, tx_json in enumerate(transactions):
+        if "tx_blob" in tx_json:
+            tx_json = transactions[i] = decode_binary_tx({}, tx_json["tx_blob"],
+                                                         tx_json["meta"])
+        else:
+            # "expand" puts metadata in a differently-named field than tx does
+            tx_json["meta"] = tx_json.pop("metaData")
+        tx_json["ledger_index"] = int(header["ledger_index"])
+        tx_json["validated"] = validated
+        if "delivered_amount" not in tx_json["meta"]:
+            ripple_binary.synthesize_delivered_amount(tx_json)
+    transactions.sort(key=lambda t: t["meta"]["TransactionIndex"])
+    return header, transactions
+
 
 def account_info(address, ledger_index="validated"):
+    return inflight.do(("account_info", address, ledger_index),
+                       fetch_account_info, address, ledger_index)
+
+def fetch_account_info(address, ledger_index):
     params = {
         "account": address,
         "ledger_index": ledger_index
@@ -264,13 +1371,168 @@ def account_info(address, ledger_index="validated"):
         warn(str(result))
         raise KeyError("Response from rippled doesn't have account_data as expected")
 
-def get_reserve_constants():
+def account_tx(address, ledger_index_min=-1, ledger_index_max=-1,
+               limit=ACCOUNT_TX_PAGE_SIZE, forward=False, marker=None,
+               binary=None):
+    """
+    rippled account_tx command: one page of the transactions that affected
+    an account, newest first unless forward. Returns (transactions, marker),
+    where the transactions are in the same format as the tx command returns
+    and marker is what to pass to get the next page, or None after the last
+    one. If binary (default: FETCH_BINARY), the transactions are fetched in
+    binary and decoded here.
+    """
+    if binary is None:
+        binary = FETCH_BINARY
+    params = {
+        "account": address,
+        "ledger_index_min": ledger_index_min,
+        "ledger_index_max": ledger_index_max,
+        "limit": limit,
+        "forward": forward,
+        "binary": binary
+    }
+    if marker is not None:
+        params["marker"] = marker
+    result = json_rpc_call("account_tx", params)
+    if "transactions" not in result:
+        raise KeyError("Response from rippled doesn't have transactions as expected")
+
+    transactions = []
+    for entry in result["transactions"]:
+        if "tx_blob" in entry:
+            tx_json = decode_binary_tx(entry, entry["tx_blob"], entry["meta"])
+        else:
+            tx_json = entry["tx"]
+            tx_json["meta"] = entry["meta"]
+            tx_json["validated"] = entry.get("validated", False)
+            if "delivered_amount" not in tx_json["meta"]:
+                ripple_binary.synthesize_delivered_amount(tx_json)
+        transactions.append(tx_json)
+    return transactions, result.get("marker")
+
+def account_tx_pages(address, ledger_index_min=-1, ledger_index_max=-1,
+                     forward=False, limit=ACCOUNT_TX_PAGE_SIZE):
+    """
+    Yields an account's whole history (or the part between the given
+    ledgers) a page (list of transactions, see account_tx) at a time,
+    following account_tx's markers. While the caller works on one page, the
+    next is fetched on a background thread, so at most three pages are held
+    in memory however long the history is.
+    """
+    pages = Queue(maxsize=1)
+    stop = threading.Event()
+
+    def put(item):
+        # give up if the caller stopped reading
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=1)
+                return
+            except Full:
+                pass
+
+    def fetch():
+        marker = None
+        try:
+            while True:
+                transactions, marker = account_tx(address, ledger_index_min,
+                        ledger_index_max, limit=limit, forward=forward,
+                        marker=marker)
+                put( (transactions, None) )
+                if marker is None or stop.is_set():
+                    break
+        except Exception as e:
+            put( (None, e) )
+        put(None)
+
+    t = threading.Thread(target=fetch)
+    t.daemon = True
+    t.start()
+    try:
+        while True:
+            item = pages.get()
+            if item is None:
+                return
+            transactions, error = item
+            if error is not None:
+                raise error
+            yield transactions
+    finally:
+        stop.set()
+
+# Reserves only change when validators vote in a new fee, so they're cached.
+reserve_cache = {
+    "constants": None, # (reserve_base, reserve_owner) in XRP
+    "ledger_index": 0, # ledger the constants were taken from
+    "fetched": 0
+}
+reserve_lock = threading.Lock()
+
+def get_reserve_constants(max_age=RESERVE_CACHE_TTL):
+    """
+    Returns (base reserve, owner reserve) in XRP, from the cache if it's
+    less than max_age seconds old, or else from server_info.
+    """
+    with reserve_lock:
+        if reserve_cache["constants"] and \
+                time.time() - reserve_cache["fetched"] < max_age:
+            return reserve_cache["constants"]
+    return refresh_reserve_constants()
+
+def refresh_reserve_constants():
     result = json_rpc_call("server_info")
     vl = result["info"]["validated_ledger"]
     reserve_base = vl["reserve_base_xrp"]
     reserve_owner = vl["reserve_inc_xrp"]
+    set_reserve_constants(reserve_base, reserve_owner, vl.get("seq", 0))
     return reserve_base, reserve_owner
 
+def set_reserve_constants(reserve_base, reserve_owner, ledger_index):
+    with reserve_lock:
+        if ledger_index < reserve_cache["ledger_index"]:
+            return # we already know about something newer
+        reserve_cache["constants"] = (reserve_base, reserve_owner)
+        reserve_cache["ledger_index"] = ledger_index
+        reserve_cache["fetched"] = time.time()
+
+def invalidate_reserve_constants():
+    with reserve_lock:
+        reserve_cache["constants"] = None
+
+def note_fee_change(tx_json):
+    """
+    Update the reserve cache from a validated SetFee pseudo-transaction, if
+    it's newer than what the cache has. Old SetFees (e.g. when explaining
+    history) are ignored.
+    """
+    if not tx_json.get("validated"):
+        return
+    if "ReserveBase" in tx_json and "ReserveIncrement" in tx_json:
+        set_reserve_constants(drops_to_xrp(tx_json["ReserveBase"]),
+                              drops_to_xrp(tx_json["ReserveIncrement"]),
+                              tx_json["ledger_index"])
+    elif tx_json["ledger_index"] > reserve_cache["ledger_index"]:
+        invalidate_reserve_constants()
+
+def start_reserve_refresher(interval=RESERVE_CACHE_TTL/2):
+    """
+    Keep the reserve cache warm from a background thread, so
+    get_reserve_constants never has to wait on server_info.
+    """
+    def refresh_loop():
+        while True:
+            try:
+                refresh_reserve_constants()
+            except Exception as e:
+                warn("Couldn't refresh reserve settings: %s" % e)
+            time.sleep(interval)
+
+    t = threading.Thread(target=refresh_loop)
+    t.daemon = True
+    t.start()
+    return t
+
 def lookup_trustline(address1, address2, currency, ledger_index="validated"):
     params = {
         "ripple_state": {
@@ -301,186 +1563,230 @@ def lookup_offer(address, seq, ledger_index="validated"):
     else:
         raise KeyError("Response from rippled doesn't have the node as expected")
 
+# explanation context ---------------------
+class SplainContext(object):
+    """
+    Per-explanation state: the parties mentioned so far, and the name cache
+    to look them up in (the shared known_acts unless you pass another).
+    Use one context per explanation; the name cache can be shared by any
+    number of contexts in different threads.
+
+    Names are looked up for at most name_deadline seconds (default:
+    NAME_DEADLINE) from the first lookup; after that, or while
+    id.ripple.com is unavailable, addresses are shown instead, and
+    names_missing is set so the explanation isn't cached.
+    """
+    def __init__(self, names=None, name_deadline=NAME_DEADLINE):
+        self.parties = OrderedDict()
+        if names is None:
+            names = known_acts
+        self.names = names
+        self.name_deadline = name_deadline
+        self.names_missing = False
+        self._names_due = None
+
+    def names_due(self):
+        """
+        time.time() by which names have to be resolved, or None if there's
+        no limit. The clock starts the first time this is called.
+        """
+        if self._names_due is None and self.name_deadline is not None:
+            self._names_due = time.time() + self.name_deadline
+        return self._names_due
+
+    def add_party(self, address, username):
+        if "~" in username:
+            self.parties[address] = username
+        else:
+            self.parties[address] = "Unknown Account"
+
 # transaction splaining ------------------
-tx_parties = {}
-def splain(tx_json, verbose=True):
-    global tx_parties
-    tx_parties = {} # reset this once per splain
+def splain(tx_json, verbose=True, ctx=None, dump_json=True, ledger=None,
+           max_nodes=None, summarize=False):
+    """
+    Explain a transaction, in the format returned by the tx command.
+    If you already have the header of the ledger it's in (with a
+    transaction_count), pass it as ledger to skip looking it up.
+    """
+    if ctx is None:
+        ctx = SplainContext()
 
     msg = ""
 
-    print(dumpjson(tx_json))
-    msg += "\n\n"
+    if dump_json:
+        print(dumpjson(tx_json))
+        msg += "\n\n"
 
-    try:
-        ledger = lookup_ledger(ledger_index=tx_json["ledger_index"])
-    except KeyError:
-        ledger = None
-    tx_type = tx_json["TransactionType"]
+    with tracer.span("splain.transaction"):
+        msg += "".join(splain_iter(tx_json, verbose=verbose, ctx=ctx,
+                                   ledger=ledger, max_nodes=max_nodes,
+                                   summarize=summarize))
+    msg = parties(ctx) + msg
 
-    #lookup flags now so we can phrase things accordingly
-    enabled_flags = []
-    if "Flags" in tx_json:
-        for flag_bit,flag_name in TX_FLAGS["*"].items():
-            if tx_json["Flags"] & flag_bit:
-                enabled_flags.append(flag_name)
-        for flag_bit,flag_name in TX_FLAGS[tx_type].items():
-            if tx_json["Flags"] & flag_bit:
-                enabled_flags.append(flag_name)
+    return msg
+
+def splain_iter(tx_json, verbose=True, ctx=None, ledger=None, max_nodes=None,
+                summarize=False):
+    """
+    Generator version of splain: yields the explanation a sentence (or
+    a section) at a time, as soon as each is ready, so callers can stream
+    it out. The parties header isn't included; get it from parties(ctx)
+    once the generator is exhausted. If max_nodes is set, at most that
+    many AffectedNodes are described individually. If summarize is True,
+    AffectedNodes are described in aggregate instead (see summarize_nodes).
+    The text is rendered from tx_record, the same record --json prints.
+    """
+    if ctx is None:
+        ctx = SplainContext()
+
+    # resolve the names we'll show up front, in parallel, so the text
+    # below doesn't wait on one id.ripple.com round trip at a time. Paths
+    # and AffectedNodes are only shown if verbose (and summarize_nodes
+    # looks up the few names a summary needs itself)
+    prefetch_rippleids(tx_addresses(tx_json, paths=verbose,
+                                    meta=verbose and not summarize,
+                                    max_nodes=max_nodes),
+                       names=ctx.names, due=ctx.names_due())
+
+    record = tx_record(tx_json, ctx=ctx, ledger=ledger, parties=False)
+    tx_type = record["transaction_type"]
+    enabled_flags = record["flags"]
 
     if tx_type == "Payment":
-        msg += "This is a Payment from %s to %s.\n" % (lookup_rippleid(tx_json["Account"]),
-                lookup_rippleid(tx_json["Destination"]))
+        yield "This is a Payment from %s to %s.\n" % (lookup_rippleid(record["account"], ctx=ctx),
+                lookup_rippleid(record["Destination"], ctx=ctx))
     elif tx_type == "OfferCreate":
         if "tfSell" in enabled_flags:
-            msg += "This is an OfferCreate, where %s offered to pay %s in order to receive at least %s.\n" % (
-                    lookup_rippleid(tx_json["Account"]), amount_to_string(tx_json["TakerGets"]),
-                    amount_to_string(tx_json["TakerPays"]) )
-        else:
-            msg += "This is an OfferCreate, where %s offered to pay up to %s in order to receive %s.\n" % (
-                    lookup_rippleid(tx_json["Account"]), amount_to_string(tx_json["TakerGets"]),
-                    amount_to_string(tx_json["TakerPays"]) )
-        if "OfferSequence" in tx_json:
-            msg += "Additionally, it was intended to cancel a previous offer with sequence #%d.\n" % tx_json["OfferSequence"]
+            yield "This is an OfferCreate, where %s offered to pay %s in order to receive at least %s.\n" % (
+                    lookup_rippleid(record["account"], ctx=ctx), amount_to_string(record["TakerGets"], ctx=ctx),
+                    amount_to_string(record["TakerPays"], ctx=ctx) )
+        else:
+            yield "This is an OfferCreate, where %s offered to pay up to %s in order to receive %s.\n" % (
+                    lookup_rippleid(record["account"], ctx=ctx), amount_to_string(record["TakerGets"], ctx=ctx),
+                    amount_to_string(record["TakerPays"], ctx=ctx) )
+        if "OfferSequence" in record:
+            yield "Additionally, it was intended to cancel a previous offer with sequence #%d.\n" % record["OfferSequence"]
     elif tx_type == "EscrowCreate":
-        msg += "This is an EscrowCreate transaction, where %s attempted to create a held payment of %s to %s.\n" % (
-                lookup_rippleid(tx_json["Account"]),
-                amount_to_string(tx_json["Amount"]),
-                lookup_rippleid(tx_json["Destination"]), )
-        if "CancelAfter" in tx_json:
-            msg += "The held payment expires at %s.\n" % (
-                    ripple_time_to_human(tx_json["CancelAfter"]))
-        if "FinishAfter" in tx_json:
-            msg += "The payment is held until %s.\n" % (
-                    ripple_time_to_human(tx_json["FinishAfter"]))
-        if "Condition" in tx_json:
-            msg += "The held payment is contingent on a crypto-condition.\n"
+        yield "This is an EscrowCreate transaction, where %s attempted to create a held payment of %s to %s.\n" % (
+                lookup_rippleid(record["account"], ctx=ctx),
+                amount_to_string(record["Amount"], ctx=ctx),
+                lookup_rippleid(record["Destination"], ctx=ctx), )
+        if "CancelAfter" in record:
+            yield "The held payment expires at %s.\n" % (
+                    ripple_time_to_human(record["CancelAfter"]))
+        if "FinishAfter" in record:
+            yield "The payment is held until %s.\n" % (
+                    ripple_time_to_human(record["FinishAfter"]))
+        if "Condition" in record:
+            yield "The held payment is contingent on a crypto-condition.\n"
     elif tx_type == "PaymentChannelCreate":
-        msg += "This is an PaymentChannelCreate transaction, where %s attempted to create a payment channel to %s with %s.\n" % (
-                lookup_rippleid(tx_json["Account"]),
-                lookup_rippleid(tx_json["Destination"]),
-                lookup_rippleid(tx_json["Amount"]))
-        msg += "The SettleDelay before this channel be closed is %s seconds." % (
-                tx_json["SettleDelay"])
-        if "CancelAfter" in tx_json:
-            msg += "The channel expires at %s.\n" % (
-                    ripple_time_to_human(tx_json["CancelAfter"]))
+        yield "This is an PaymentChannelCreate transaction, where %s attempted to create a payment channel to %s with %s.\n" % (
+                lookup_rippleid(record["account"], ctx=ctx),
+                lookup_rippleid(record["Destination"], ctx=ctx),
+                amount_to_string(record["Amount"], ctx=ctx))
+        yield "The SettleDelay before this channel be closed is %s seconds.\n" % (
+                record["SettleDelay"])
+        if "CancelAfter" in record:
+            yield "The channel expires at %s.\n" % (
+                    ripple_time_to_human(record["CancelAfter"]))
     elif tx_type == "SetFee":
-        msg += "This is a SetFee pseudo-transaction.\n"
+        yield "This is a SetFee pseudo-transaction.\n"
+        note_fee_change(tx_json)
     elif tx_type == "EnableAmendment":
-        msg += "This is an EnableAmendment pseudo-transaction for %s.\n" % (
-                    AMENDMENTS.get(tx_json["Amendment"], "an unknown Amendment"))
+        yield "This is an EnableAmendment pseudo-transaction for %s.\n" % (
+                    record["amendment_name"] or "an unknown Amendment")
     elif tx_type == "EscrowFinish":
-        msg += ("This is an EscrowFinish transaction, sent by %s, to execute "+ 
+        yield ("This is an EscrowFinish transaction, sent by %s, to execute "+ 
                 "the held payment created by %s's transaction with sequence "+
-                "number %s.\n") % (lookup_rippleid(tx_json["Account"]),
-                    lookup_rippleid(tx_json["Owner"]),
-                    tx_json["OfferSequence"] )
-        if "Fulfillment" in tx_json:
-            msg += "It specified the fulfillment %s.\n" % tx_json["Fulfillment"]
+                "number %s.\n") % (lookup_rippleid(record["account"], ctx=ctx),
+                    lookup_rippleid(record["Owner"], ctx=ctx),
+                    record["OfferSequence"] )
+        if "Fulfillment" in record:
+            yield "It specified the fulfillment %s.\n" % record["Fulfillment"]
     else:
-        msg += "This is a %s transaction.\n" % tx_type
-        msg += "The transaction was sent by %s.\n" % lookup_rippleid(tx_json["Account"])
-
-    if "DestinationTag" in tx_json:
-        msg += "The transaction specified the Destination Tag %s.\n" % tx_json["DestinationTag"]
+        yield "This is a %s transaction.\n" % tx_type
+        yield "The transaction was sent by %s.\n" % lookup_rippleid(record["account"], ctx=ctx)
 
-    if "SourceTag" in tx_json:
-        msg += "The transaction specified the Source Tag %s.\n" % tx_json["SourceTag"]
+    if "DestinationTag" in record:
+        yield "The transaction specified the Destination Tag %s.\n" % record["DestinationTag"]
 
-    tx_meta = tx_json["meta"]#"tx-command" format
+    if "SourceTag" in record:
+        yield "The transaction specified the Source Tag %s.\n" % record["SourceTag"]
 
     if enabled_flags:
-        msg += "The transaction specified the following flags: %s.\n" % ", ".join(enabled_flags)
+        yield "The transaction specified the following flags: %s.\n" % ", ".join(enabled_flags)
     else:
-        msg += "The transaction used no flags.\n"
+        yield "The transaction used no flags.\n"
 
-    msg += "Sending this transaction consumed %f XRP.\n" % drops_to_xrp(tx_json["Fee"])
+    yield "Sending this transaction consumed %s XRP.\n" % record["fee"]["value"]
 
-    if tx_meta["TransactionResult"] == "tesSUCCESS":
-        msg += "The transaction was successful.\n"
+    if record["result"] == "tesSUCCESS":
+        yield "The transaction was successful.\n"
     else:
-        msg += "The transaction failed with the code %s.\n" % tx_meta["TransactionResult"]
+        yield "The transaction failed with the code %s.\n" % record["result"]
 
-    if "validated" in tx_json:
-        validated = tx_json["validated"]
-    else:
-        validated = False
-    if validated and ledger:
-        msg += "This result has been validated by consensus, in ledger %d, at %s.\n" % (
-                tx_json["ledger_index"], ledger["close_time_human"])
-    elif validated:
-        msg += "This result has been validated by consensus, in ledger %d.\n" % (tx_json["ledger_index"])
+    if record["validated"] and "close_time_human" in record:
+        yield "This result has been validated by consensus, in ledger %d, at %s.\n" % (
+                record["ledger_index"], record["close_time_human"])
+    elif record["validated"]:
+        yield "This result has been validated by consensus, in ledger %d.\n" % (record["ledger_index"])
     else:
-        msg += "This result is provisionally part of ledger %d.\n" % tx_json["ledger_index"]
+        yield "This result is provisionally part of ledger %d.\n" % record["ledger_index"]
 
     if tx_type == "Payment":
-        if "SendMax" in tx_json:
-            msg += "It was instructed to deliver %s by spending up to %s.\n" % (
-                    amount_to_string(tx_json["Amount"],any_if=tx_json["Destination"]),
-                    amount_to_string(tx_json["SendMax"],any_if=tx_json["Account"]))
+        if "SendMax" in record:
+            yield "It was instructed to deliver %s by spending up to %s.\n" % (
+                    amount_to_string(record["Amount"],any_if=record["Destination"], ctx=ctx),
+                    amount_to_string(record["SendMax"],any_if=record["account"], ctx=ctx))
         else:
-            msg += "It was instructed to deliver %s.\n" % amount_to_string(tx_json["Amount"], any_if=tx_json["Destination"])
-        if "delivered_amount" in tx_meta and tx_meta["delivered_amount"] != "unavailable":
-            msg += "It actually delivered %s.\n" % amount_to_string(tx_meta["delivered_amount"])
-
-    if "Memos" in tx_json:
-        for wrapper in tx_json["Memos"]:
-            memo = wrapper["Memo"]
-            if "MemoType" in memo and "MemoFormat" in memo:
-                memotype = decode_hex(memo["MemoType"])
-                memoformat = decode_hex(memo["MemoFormat"])
-                if memotype == "client":
-                    msg += "A memo indicates it was sent with the client '%s'.\n" % memoformat
-
-    if verbose and "Paths" in tx_json:
-        msg += describe_paths(tx_json["Paths"])
-
-    if verbose and "AffectedNodes" in tx_meta:
-        msg += "It affected %d nodes in the global ledger, including:\n" % len(
-                tx_meta["AffectedNodes"])
-        for wrapper in tx_meta["AffectedNodes"]:
-            if "DeletedNode" in wrapper:
-                node = wrapper["DeletedNode"]
-                if node["LedgerEntryType"] == "Offer" and "PreviousFields" in node:
-                    #If the offer is deleted for being unfunded or canceled, there are no PreviousFields
-                    msg += "..  It consumed %s.\n" % describe_node(node)
+            yield "It was instructed to deliver %s.\n" % amount_to_string(record["Amount"], any_if=record["Destination"], ctx=ctx)
+        if "delivered_amount" in record:
+            yield "It actually delivered %s.\n" % amount_to_string(record["delivered_amount"], ctx=ctx)
+
+    for memo in record.get("memos", ()):
+        if memo["type"] == "client" and memo["format"] is not None:
+            yield "A memo indicates it was sent with the client '%s'.\n" % memo["format"]
+
+    if verbose and "paths" in record:
+        yield describe_paths(record["paths"], ctx=ctx)
+
+    if verbose and "nodes" in record:
+        nodes = record["nodes"]
+        yield "It affected %d nodes in the global ledger, including:\n" % len(nodes)
+        if summarize:
+            for sentence in summarize_nodes(nodes, ctx=ctx):
+                yield sentence
+        else:
+            for node_count, node in enumerate(nodes):
+                if max_nodes is not None and node_count >= max_nodes:
+                    yield "..  (and %d more)\n" % (len(nodes) - node_count)
+                    break
+                if node["action"] == "modified":
+                    yield "..  It modified %s%s.\n" % (describe_node(node, ctx=ctx),
+                            describe_node_changes(node, ctx=ctx))
                 else:
-                    msg += "..  It deleted %s.\n" % describe_node(node)
-            elif "CreatedNode" in wrapper:
-                node = wrapper["CreatedNode"]
-                msg += "..  It created %s.\n" % describe_node(node)
-            if "ModifiedNode" in wrapper:
-                node = wrapper["ModifiedNode"]
-                msg += "..  It modified %s%s.\n" % (describe_node(node),
-                        describe_node_changes(node))
-
-    if "TransactionIndex" in tx_meta:
-        if ledger:
-            msg += "It was transaction #%d of %d total transactions in ledger %s.\n" % (
-                tx_meta["TransactionIndex"]+1, len(ledger["transactions"]) ,
+                    yield "..  It %s %s.\n" % (node["action"], describe_node(node, ctx=ctx))
+
+    if record["transaction_index"] is not None:
+        if "ledger_transaction_count" in record:
+            yield "It was transaction #%d of %d total transactions in ledger %s.\n" % (
+                record["transaction_index"]+1, record["ledger_transaction_count"],
                 #                          ^-- convert 0-based to 1-based
-                ledger["ledger_index"])
+                record["ledger_index"])
         else:
-            msg += "It was transaction #%d in ledger %s.\n" % ( tx_meta["TransactionIndex"]+1, tx_json["ledger_index"] )
-
-    msg = parties() + msg
+            yield "It was transaction #%d in ledger %s.\n" % ( record["transaction_index"]+1, record["ledger_index"] )
 
-    return msg
-
-
-def parties():
-    global tx_parties
 
+def parties(ctx):
     s = "Parties: \n"
-    for addr,alias in tx_parties.items():
+    for addr,alias in ctx.parties.items():
         if addr != alias:
             s += ".. %s: %s\n" % (addr, alias)
         else:
             s += ".. %s\n"
     return s
 
-def describe_paths(pathset):
+def describe_paths(pathset, ctx=None):
     msg = "It specified %d paths other than the default one:\n" % len(pathset)
     for path in pathset:
         ptext = "Source - "
@@ -488,118 +1794,90 @@ def describe_paths(pathset):
             if step["type"] & PATHSTEP_ORDERBOOK:
                 if step["type"] & PATHSTEP_ISSUER:
                     currency = "%s.%s" % (step["currency"],
-                            lookup_rippleid(step["issuer"], tilde=False))
+                            lookup_rippleid(step["issuer"], tilde=False, ctx=ctx))
                 else:
                     currency = step["currency"]
                 ptext += "Orderbook:%s - " % step["currency"]
             if step["type"] & PATHSTEP_RIPPLING:
-                ptext += "%s - " % lookup_rippleid(step["account"])
+                ptext += "%s - " % lookup_rippleid(step["account"], ctx=ctx)
         ptext += "Destination"
         msg += "..  %s\n" % ptext
 
     return msg
 
 
-def describe_node(node):
-    nodetype = node["LedgerEntryType"]
-    # DeletedNode/ModifiedNode have FinalFields; CreateNode has NewFields
-    new_fields = {}
-    prev_fields = {}
-    final_fields = {}
-    node_fields = {}
-    if "NewFields" in node:
-        node_fields = node["NewFields"]
-        new_fields = node["NewFields"]
-    if "PreviousFields" in node:
-        node_fields = node["PreviousFields"]
-        prev_fields = node["PreviousFields"]
-    if "FinalFields" in node:
-        node_fields = node["FinalFields"]
-        final_fields = node["FinalFields"]
+def describe_node(node, ctx=None):
+    """
+    Describe an affected node, given its node_record.
+    """
+    nodetype = node["type"]
 
     if nodetype == "Offer":
-        #prefer Prev fields if possible, since that better indicates the status of consumed offers
-        if "TakerPays" in prev_fields and "TakerGets" in prev_fields:
-            taker_pays = prev_fields["TakerPays"]
-            taker_gets = prev_fields["TakerGets"]
-        elif "TakerPays" in new_fields and "TakerGets" in new_fields:
-            taker_pays = new_fields["TakerPays"]
-            taker_gets = new_fields["TakerGets"]
-        elif "TakerPays" in final_fields and "TakerGets" in final_fields:
-            taker_pays = final_fields["TakerPays"]
-            taker_gets = final_fields["TakerGets"]
-        else:
+        if "taker_pays" not in node:
             #probably shouldn't get here, but handle it gracefully
-            return "%s's Offer" % lookup_rippleid(node_fields["Account"])
+            return "%s's Offer" % lookup_rippleid(node["account"], ctx=ctx)
 
         return "%s's Offer (seq#%s) to buy %s for %s" % (
-                    lookup_rippleid(node_fields["Account"]),
-                    node_fields["Sequence"],
-                    amount_to_string(taker_pays), amount_to_string(taker_gets))
+                    lookup_rippleid(node["account"], ctx=ctx),
+                    node["sequence"],
+                    amount_to_string(node["taker_pays"], ctx=ctx), amount_to_string(node["taker_gets"], ctx=ctx))
 
 
     if nodetype == "RippleState":
         return "the trust line between %s and %s" % (
-                lookup_rippleid(node_fields["HighLimit"]["issuer"]),
-                lookup_rippleid(node_fields["LowLimit"]["issuer"]))
+                lookup_rippleid(node["high"], ctx=ctx),
+                lookup_rippleid(node["low"], ctx=ctx))
 
     if nodetype == "DirectoryNode":
-        if "Owner" in node_fields:
-            return "a Directory owned by %s" % lookup_rippleid(node_fields["Owner"])
-        elif "TakerPaysCurrency" in node_fields:
+        if node["owner"]:
+            return "a Directory owned by %s" % lookup_rippleid(node["owner"], ctx=ctx)
+        elif node["offer_directory"]:
             return "an offer Directory"
         else:
             return "a Directory node"
 
     if nodetype == "AccountRoot":
-        if "Account" in node_fields:
-            return "the account %s" % lookup_rippleid(node_fields["Account"])
+        if node["account"]:
+            return "the account %s" % lookup_rippleid(node["account"], ctx=ctx)
         else:
             # Strangely, sometimes you get a ModifiedNode with no such field
-            return "the account with ledger node index %s" % node["LedgerIndex"]
+            return "the account with ledger node index %s" % node["ledger_index"]
 
     #fallback, hopefully shouldn't reach here
     return "a %s node" % nodetype
 
 
-def describe_node_changes(node):
+def node_balance_changes(node):
+    """
+    Work out how a ModifiedNode changed anyone's balance. Returns a list of
+    (holder, delta, currency, issuer) tuples, where delta is how much the
+    holder's balance went up (negative if it went down) and issuer is None
+    for XRP. XRP deltas are ints in drops; issued currency deltas are exact
+    Decimals.
+    """
     changes = []
     nodetype = node["LedgerEntryType"]
     if nodetype == "AccountRoot" and "PreviousFields" in node and "FinalFields" in node:
         if "Balance" in node["FinalFields"] and "Balance" in node["PreviousFields"]:
-            prev_balance = drops_to_xrp(node["PreviousFields"]["Balance"])
-            final_balance = drops_to_xrp(node["FinalFields"]["Balance"])
-            diff = final_balance - prev_balance
-            if diff > 0:
-                changes.append("increasing its XRP balance by %f" % diff)
-            else:
-                changes.append("decreasing its XRP balance by %f" % -diff)
+            prev_balance = int(node["PreviousFields"]["Balance"])
+            final_balance = int(node["FinalFields"]["Balance"])
+            changes.append( (node["FinalFields"]["Account"],
+                             final_balance - prev_balance, "XRP", None) )
     if nodetype == "RippleState" and "PreviousFields" in node and "FinalFields" in node:
         ffields = node["FinalFields"]
         pfields = node["PreviousFields"]
         if "Balance" in ffields and "Balance" in pfields:
-            prev_amount = pfields["Balance"]
-            if is_string(prev_amount):
-                prev_balance = drops_to_xrp(prev_amount)
-                currency = "XRP"
-            else:
-                prev_balance = float(prev_amount["value"])
-                currency = prev_amount["currency"]
-            final_amount = ffields["Balance"]
-
-            if is_string(prev_amount):
-                final_balance = drops_to_xrp(prev_amount)
-            else:
-                final_balance = float(final_amount["value"])
-
-            diff = final_balance - prev_balance
+            currency = pfields["Balance"]["currency"]
+            prev_balance = Decimal(pfields["Balance"]["value"])
+            final_balance = Decimal(ffields["Balance"]["value"])
+            diff = AMOUNT_CONTEXT.subtract(final_balance, prev_balance)
 
             # Each node holds funds issued by the other
             low_node = ffields["LowLimit"]["issuer"]
             high_node = ffields["HighLimit"]["issuer"]
 
             #perspective from the non-gateway account generally makes more sense
-            if ffields["LowLimit"]["value"] > ffields["HighLimit"]["value"]:
+            if Decimal(ffields["LowLimit"]["value"]) > Decimal(ffields["HighLimit"]["value"]):
                 perspective_low = True
             elif final_balance > 0 or prev_balance > 0:
                 perspective_low = True
@@ -607,19 +1885,35 @@ def describe_node_changes(node):
                 perspective_low = False
 
             if perspective_low:
-                if diff > 0:
-                    changes.append("increasing the amount %s holds by %f %s" %
-                        (lookup_rippleid(low_node), diff, currency))
-                else:
-                    changes.append("decreasing the amount %s holds by %f %s" %
-                        (lookup_rippleid(low_node), -diff, currency))
+                changes.append( (low_node, diff, currency, high_node) )
             else:
-                if diff > 0:
-                    changes.append("decreasing the amount %s holds by %f %s" %
-                        (lookup_rippleid(high_node), diff, currency))
-                else:
-                    changes.append("increasing the amount %s holds by %f %s" %
-                        (lookup_rippleid(high_node), -diff, currency))
+                changes.append( (high_node, -diff, currency, low_node) )
+    return changes
+
+def balance_change_delta(change):
+    """
+    The exact delta of a balance change from a node_record: an int number
+    of drops for XRP, or a Decimal.
+    """
+    if change["issuer"] is None:
+        return int(change["drops"])
+    return Decimal(change["delta"])
+
+def describe_node_changes(node, ctx=None):
+    changes = []
+    for change in node.get("balance_changes", ()):
+        delta = balance_change_delta(change)
+        if change["issuer"] is None:
+            if delta > 0:
+                changes.append("increasing its XRP balance by %s" % format_drops(delta))
+            else:
+                changes.append("decreasing its XRP balance by %s" % format_drops(-delta))
+        elif delta > 0:
+            changes.append("increasing the amount %s holds by %s %s" %
+                (lookup_rippleid(change["account"], ctx=ctx), format_value(delta), change["currency"]))
+        else:
+            changes.append("decreasing the amount %s holds by %s %s" %
+                (lookup_rippleid(change["account"], ctx=ctx), format_value(-delta), change["currency"]))
 
     if not changes:
         return ""
@@ -630,62 +1924,158 @@ def describe_node_changes(node):
     else:
         return ", "+changes[0]
 
+def node_action(wrapper):
+    """
+    Unwrap an entry of AffectedNodes. Returns (action, node), where action
+    is "created", "modified", "deleted", or "consumed" (for Offers that were
+    taken, as opposed to canceled or removed for being unfunded).
+    """
+    if "DeletedNode" in wrapper:
+        node = wrapper["DeletedNode"]
+        if node["LedgerEntryType"] == "Offer" and "PreviousFields" in node:
+            #If the offer is deleted for being unfunded or canceled, there are no PreviousFields
+            return "consumed", node
+        return "deleted", node
+    elif "CreatedNode" in wrapper:
+        return "created", wrapper["CreatedNode"]
+    else:
+        return "modified", wrapper["ModifiedNode"]
+
+def node_owner(node):
+    """
+    The account that owns an Offer or owner Directory, for grouping similar
+    nodes together. None for other node types.
+    """
+    fields = node.get("FinalFields", node.get("NewFields", {}))
+    if node["LedgerEntryType"] == "Offer":
+        return fields.get("Account")
+    if node["LedgerEntryType"] == "DirectoryNode":
+        return fields.get("Owner")
+    return None
+
+def plural(count, singular, plural):
+    if count == 1:
+        return "1 %s" % singular
+    return "%d %s" % (count, plural)
+
+def describe_node_group(nodetype, owner, count, ctx=None):
+    if nodetype == "Offer":
+        return "%s owned by %s" % (plural(count, "Offer", "Offers"),
+                                   lookup_rippleid(owner, ctx=ctx))
+    if nodetype == "DirectoryNode":
+        if owner:
+            return "%s owned by %s" % (plural(count, "Directory", "Directories"),
+                                       lookup_rippleid(owner, ctx=ctx))
+        return plural(count, "offer Directory", "offer Directories")
+    if nodetype == "AccountRoot":
+        return plural(count, "account", "accounts")
+    if nodetype == "RippleState":
+        return plural(count, "trust line", "trust lines")
+    return plural(count, "%s node" % nodetype, "%s nodes" % nodetype)
+
+def summarize_nodes(nodes, ctx=None):
+    """
+    Describe affected nodes (node_records) in aggregate, in one pass: how
+    many nodes of each kind (and owner) were created, modified, deleted, or
+    consumed, followed by the net balance change for each account and
+    trust line.
+    """
+    groups = OrderedDict() # (action, type, owner) -> count
+    balances = OrderedDict() # (holder, currency, issuer) -> net change
+    for node in nodes:
+        key = (node["action"], node["type"], node["owner"])
+        groups[key] = groups.get(key, 0) + 1
+        if node["action"] == "modified":
+            for change in node["balance_changes"]:
+                delta = balance_change_delta(change)
+                issuer = change["issuer"]
+                key = (change["account"], change["currency"], issuer)
+                if key not in balances:
+                    balances[key] = delta
+                elif issuer is None:
+                    balances[key] += delta
+                else:
+                    balances[key] = AMOUNT_CONTEXT.add(balances[key], delta)
+
+    # the parties the summary names, looked up together
+    addresses = set(owner for (action, nodetype, owner) in groups
+                    if owner and nodetype in ("Offer", "DirectoryNode"))
+    for (holder, currency, issuer), delta in balances.items():
+        if delta != 0:
+            addresses.add(holder)
+            if issuer is not None:
+                addresses.add(issuer)
+    if ctx is not None:
+        prefetch_rippleids(addresses, names=ctx.names, due=ctx.names_due())
+    else:
+        prefetch_rippleids(addresses, due=names_due())
+
+    for (action, nodetype, owner), count in groups.items():
+        yield "..  It %s %s.\n" % (action, describe_node_group(nodetype, owner,
+                                                               count, ctx=ctx))
+    for (holder, currency, issuer), delta in balances.items():
+        if delta == 0:
+            continue
+        if issuer is None:
+            amount_desc = "%s XRP" % format_drops(abs(delta))
+        else:
+            amount_desc = "%s %s issued by %s" % (format_value(abs(delta)), currency,
+                                                  lookup_rippleid(issuer, ctx=ctx))
+        yield "..  In total, %s %s %s.\n" % (lookup_rippleid(holder, ctx=ctx),
+                                             "gained" if delta > 0 else "lost",
+                                             amount_desc)
+
 
 # account splaining -------------------------
 
-def splain_account(account):
-    address = account["Account"]
+def splain_account(account, ctx=None):
+    if ctx is None:
+        ctx = SplainContext()
+    record = account_record(account, ctx=ctx, parties=False)
+    address = record["account"]
     s = "This is account %s" % address
-    name = lookup_rippleid(address)
-    if "~" not in known_acts[address]:
+    name = lookup_rippleid(address, ctx=ctx)
+    if "~" not in name:
         s += ", which has no Ripple Name.\n"
     else:
         s += ", which has Ripple Name %s.\n" % name
 
-    s += "It has %f XRP.\n" % drops_to_xrp(account["Balance"])
+    s += "It has %s XRP.\n" % record["balance"]["value"]
     s += "It owns %d objects in the ledger, which means its reserve is %d XRP.\n" % \
-            (account["OwnerCount"], calculate_reserve(account["OwnerCount"]))
+            (record["owner_count"], record["reserve"])
 
-    flags = account["Flags"]
-    enabled_flags = []
-    if not flags:
+    if not record["flags"]:
         s += "It has no flags enabled.\n"
     else:
-        for flag_bit,flag_name in LEDGER_FLAGS["AccountRoot"].items():
-            if flags & flag_bit:
-                enabled_flags.append(flag_name)
         s += "It has the following flags enabled: %s.\n" % \
-                ", ".join(enabled_flags)
+                ", ".join(record["flags"])
 
-    if "PreviousTxnLgrSeq" in account and "PreviousTxnID" in account:
-        s += "This node was last modified by Transaction %s" % account["PreviousTxnID"]
-        try:
-            previoustxn_ledger = lookup_ledger(account["PreviousTxnLgrSeq"])
-            s += " in ledger %d, on %s.\n" % (account["PreviousTxnLgrSeq"],
-                    previoustxn_ledger["close_time_human"])
-        except KeyError:
-            s += " in ledger %d.\n" % account["PreviousTxnLgrSeq"]
+    if "PreviousTxnLgrSeq" in record and "PreviousTxnID" in record:
+        s += "This node was last modified by Transaction %s" % record["PreviousTxnID"]
+        if "previous_txn_close_time_human" in record:
+            s += " in ledger %d, on %s.\n" % (record["PreviousTxnLgrSeq"],
+                    record["previous_txn_close_time_human"])
+        else:
+            s += " in ledger %d.\n" % record["PreviousTxnLgrSeq"]
         s += "(Its trust lines might have been modified more recently.)\n"
 
-    if "AccountTxnID" in account:
+    if "AccountTxnID" in record:
         s += "It has AccountTxnID enabled. "
-        s += "Its most recently sent transaction is %s.\n" % account["AccountTxnID"]
+        s += "Its most recently sent transaction is %s.\n" % record["AccountTxnID"]
 
-    if "Domain" in account:
-        s += "It refers the following domain: %s\n" % decode_hex(account["Domain"])
+    if "domain" in record:
+        s += "It refers the following domain: %s\n" % record["domain"]
 
-    if "urlgravatar" in account:
-        s += "Avatar: %s\n" % account["urlgravatar"]
+    if "urlgravatar" in record:
+        s += "Avatar: %s\n" % record["urlgravatar"]
 
-    if "TransferRate" in account and account["TransferRate"] != 0 and \
-            account["TransferRate"] != 1000000000:
-        s += "It has a transfer fee of %f%%.\n" % \
-                calculate_transfer_fee(account["TransferRate"])
+    if "transfer_fee" in record:
+        s += "It has a transfer fee of %f%%.\n" % record["transfer_fee"]
 
-    if "MessageKey" in account:
-        s += "To send an encrypted message to this account, you should encode it with public key %s.\n" % account["MessageKey"]
+    if "MessageKey" in record:
+        s += "To send an encrypted message to this account, you should encode it with public key %s.\n" % record["MessageKey"]
 
-    s = parties() + s
+    s = parties(ctx) + s
 
     return s
 
@@ -698,22 +2088,25 @@ def calculate_reserve(owner_count):
 
 # trust line splaining----------------------------------------
 
-def splain_trust_line(trustline):
-    currency = trustline["Balance"]["currency"]
-    balance = trustline["Balance"]["value"]
-    lownode = trustline["LowLimit"]["issuer"]
-    highnode = trustline["HighLimit"]["issuer"]
-    lowlimit = trustline["LowLimit"]["value"]
-    highlimit = trustline["HighLimit"]["value"]
-    lowname = lookup_rippleid(lownode)
-    highname = lookup_rippleid(highnode)
+def splain_trust_line(trustline, ctx=None):
+    if ctx is None:
+        ctx = SplainContext()
+    record = trust_line_record(trustline, ctx=ctx, parties=False)
+    currency = record["currency"]
+    balance = record["balance"]
+    lowlimit = record["low_limit"]
+    highlimit = record["high_limit"]
+    prefetch_rippleids([record["low"], record["high"]], names=ctx.names,
+                       due=ctx.names_due())
+    lowname = lookup_rippleid(record["low"], ctx=ctx)
+    highname = lookup_rippleid(record["high"], ctx=ctx)
 
     s = "This is a %s trust line between %s and %s.\n" % (currency, lowname, highname)
     s += "%s is considered the low node, and %s is considered the high node.\n" % (lowname, highname)
-    if float(balance) < 0:
+    if Decimal(balance) < 0:
         #the low node owes money to the high node
-        s += "%s currently possesses %f %s issued by %s, out of a limit of %s %s.\n" % (highname,
-                -float(balance), currency, lowname, highlimit, currency)
+        s += "%s currently possesses %s %s issued by %s, out of a limit of %s %s.\n" % (highname,
+                format_value(-Decimal(balance)), currency, lowname, highlimit, currency)
         s += "%s is willing to hold up to %s %s on this trust line.\n" % (lowname,
             lowlimit, currency)
     else:
@@ -723,256 +2116,1506 @@ def splain_trust_line(trustline):
             highlimit, currency)
 
 
-    flags = trustline["Flags"]
-    low_enabled_flags = []
-    high_enabled_flags = []
-    for flag_bit,flag_name in LEDGER_FLAGS["RippleState"].items():
-        if flags & flag_bit:
-            if "Low" in flag_name:
-                low_enabled_flags.append(flag_name)
-            elif "High" in flag_name:
-                high_enabled_flags.append(flag_name)
-            else:
-                warn("Unrecognized flag: %s" % flag_name)
-    if low_enabled_flags:
+    if record["low_flags"]:
         s += "%s has enabled the following flags: %s.\n" % ( lowname,
-                ", ".join(low_enabled_flags) )
+                ", ".join(record["low_flags"]) )
     else:
         s += "%s has not enabled any flags for this trust line.\n" % lowname
-    if high_enabled_flags:
+    if record["high_flags"]:
         s += "%s has enabled following flags: %s.\n" % ( highname,
-                ", ".join(high_enabled_flags) )
+                ", ".join(record["high_flags"]) )
     else:
         s += "%s has not enabled any flags for this trust line.\n" % highname
+    if record["unknown_flags"]:
+        s += "It also has unknown flags enabled: 0x%08X.\n" % record["unknown_flags"]
 
-    lsfLowReserve = 0x00010000
-    lsfHighReserve = 0x00020000
-    if flags & lsfLowReserve:
+    if record["low_reserve"]:
         s += "This trust line contributes to %s's owner reserve.\n" % lowname
-    if flags & lsfHighReserve:
+    if record["high_reserve"]:
         s += "This trust line contributes to %s's owner reserve.\n" % highname
 
-    if "LowQualityIn" in trustline:
+    if "LowQualityIn" in record:
         s += "%s values incoming amounts on this trust line at %f%% of face value.\n" % (
-                lowname, quality_to_percent(trustline["LowQualityIn"]) )
-    if "LowQualityOut" in trustline:
+                lowname, quality_to_percent(record["LowQualityIn"]) )
+    if "LowQualityOut" in record:
         s += "%s values outgoing amounts on this trust line at %f%% of face value.\n" % (
-                lowname, quality_to_percent(trustline["LowQualityOut"]) )
-    if "HighQualityIn" in trustline:
+                lowname, quality_to_percent(record["LowQualityOut"]) )
+    if "HighQualityIn" in record:
         s += "%s values incoming amounts on this trust line at %f%% of face value.\n" % (
-                highname, quality_to_percent(trustline["HighQualityIn"]) )
-    if "HighQualityOut" in trustline:
+                highname, quality_to_percent(record["HighQualityIn"]) )
+    if "HighQualityOut" in record:
         s += "%s values outgoing amounts on this trust line at %f%% of face value.\n" % (
-                highname, quality_to_percent(trustline["HighQualityOut"]) )
+                highname, quality_to_percent(record["HighQualityOut"]) )
 
-    if "LowNode" in trustline and is_uint(trustline["LowNode"]):
+    if "LowNode" in record and is_uint(record["LowNode"]):
         s += "This node is listed in page %d of %s's owner directory.\n" % (
-                int(trustline["LowNode"]),
+                int(record["LowNode"]),
                 lowname)
-    if "HighNode" in trustline and is_uint(trustline["HighNode"]):
+    if "HighNode" in record and is_uint(record["HighNode"]):
         s += "This node is listed in page %d of %s's owner directory.\n" % (
-                int(trustline["HighNode"]),
+                int(record["HighNode"]),
                 highname)
 
-    s = parties() + s
+    s = parties(ctx) + s
     return s
 
 # offer splaining ---------------------------
 
-def splain_offer(offer):
-    owner = lookup_rippleid(offer["Account"])
+def splain_offer(offer, ctx=None):
+    if ctx is None:
+        ctx = SplainContext()
+    record = offer_record(offer, ctx=ctx, parties=False)
+    owner = lookup_rippleid(record["account"], ctx=ctx)
 
-    enabled_flags = []
-    for flag_bit,flag_name in LEDGER_FLAGS["Offer"].items():
-        if offer["Flags"] & flag_bit:
-            enabled_flags.append(flag_name)
+    enabled_flags = record["flags"]
     if "lsfSell" in enabled_flags:
         s = "This is an Offer (#%d) from %s to pay %s in order to receive at least %s.\n" % (
-                    offer["Sequence"],
+                    record["sequence"],
                     owner,
-                    amount_to_string(offer["TakerGets"]),
-                    amount_to_string(offer["TakerPays"]) )
+                    amount_to_string(record["taker_gets"], ctx=ctx),
+                    amount_to_string(record["taker_pays"], ctx=ctx) )
     else:
         s = "This is an Offer (#%d) from %s to pay up to %s in order to receive %s.\n" % (
-                    offer["Sequence"],
+                    record["sequence"],
                     owner,
-                    amount_to_string(offer["TakerGets"]),
-                    amount_to_string(offer["TakerPays"]) )
+                    amount_to_string(record["taker_gets"], ctx=ctx),
+                    amount_to_string(record["taker_pays"], ctx=ctx) )
     if enabled_flags:
         s += "It has the following flags enabled: %s.\n" % \
                 ", ".join(enabled_flags)
     else:
         s += "It has no flags enabled.\n"
 
-    if "OwnerNode" in offer and is_uint(offer["OwnerNode"]):
+    if "OwnerNode" in record and is_uint(record["OwnerNode"]):
         s += "This offer is listed in page %d of %s's owner directory.\n" % (
-                int(offer["OwnerNode"]),
+                int(record["OwnerNode"]),
                 owner)
-    if "BookDirectory" in offer:
-        if "BookNode" in offer and is_uint(offer["BookNode"]):
+    if "BookDirectory" in record:
+        if "BookNode" in record and is_uint(record["BookNode"]):
             s += "This offer is listed in page %d of Offer Directory %s.\n" % (
-                    int(offer["BookNode"]), offer["BookDirectory"])
+                    int(record["BookNode"]), record["BookDirectory"])
         else:
-            s += "This offer is listed in Offer Directory %s.\n" % offer["BookDirectory"]
+            s += "This offer is listed in Offer Directory %s.\n" % record["BookDirectory"]
 
-    validated_ledger = lookup_ledger(ledger_index="validated")
-    if "Expiration" in offer:
-        if validated_ledger["close_time"] > offer["Expiration"]:
-            s += "This offer has passed its expiration time of %s.\n" % ripple_time_to_human(offer["Expiration"])
+    if "Expiration" in record:
+        if record["expired"]:
+            s += "This offer has passed its expiration time of %s.\n" % ripple_time_to_human(record["Expiration"])
         else:
-            s += "This offer will expire if not claimed before a ledger closes with time > %s.\n" % ripple_time_to_human(offer["Expiration"])
+            s += "This offer will expire if not claimed before a ledger closes with time > %s.\n" % ripple_time_to_human(record["Expiration"])
 
-    s = parties() + s
+    s = parties(ctx) + s
     return s
 
-# rippleid utils ----------------------------
-known_acts = {}
-def lookup_rippleid(address, tilde=True):
-    global known_acts, tx_parties
+# structured output ---------------------------------
+# Machine-readable versions of the explanations above, as plain dicts that
+# can be serialized with render_json (or render_msgpack). The prose is
+# rendered from these same records, so they carry everything it reports,
+# plus the Ripple Names of the parties. Amounts keep their exact decimal
+# values, as strings.
 
-    if address in known_acts:
-        if "~" not in known_acts[address]:
-            tx_parties[address] = "Unknown Account"
-        else:
-            tx_parties[address] = known_acts[address]
+def amount_record(amount):
+    if is_string(amount):
+        return {"currency": "XRP", "value": format_drops(amount),
+                "drops": amount}
+    return {"currency": amount["currency"], "issuer": amount["issuer"],
+            "value": amount["value"]}
 
-        # only return a tilde if requested AND a name
-        if not tilde:
-            return known_acts[address].replace("~","")
-        else:
-            return known_acts[address]
+def parties_record(addresses, ctx):
+    """
+    Map of each address to its Ripple Name (with tilde), or None if it has
+    no name.
+    """
+    prefetch_rippleids(addresses, names=ctx.names,
+                       due=ctx.names_due())
+    record = OrderedDict()
+    for address in sorted(addresses):
+        name = lookup_rippleid(address, ctx=ctx)
+        record[address] = name if "~" in name else None
+    return record
+
+def node_record(wrapper):
+    action, node = node_action(wrapper)
+    nodetype = node["LedgerEntryType"]
+    record = {
+        "action": action,
+        "type": nodetype,
+        "ledger_index": node.get("LedgerIndex"),
+        "owner": node_owner(node)
+    }
+    # DeletedNode/ModifiedNode have FinalFields; CreateNode has NewFields
+    new_fields = node.get("NewFields", {})
+    prev_fields = node.get("PreviousFields", {})
+    final_fields = node.get("FinalFields", {})
+    node_fields = node.get("FinalFields", node.get("PreviousFields", new_fields))
+    if "Flags" in node_fields:
+        record["flags"] = LEDGER_FLAG_TABLES.get(nodetype,
+                                                 LEDGER_NO_FLAGS).decode(node_fields["Flags"])
 
-    #print("looking up %s" % address)
-    url = "/v1/user/%s" % address
-    conn = httplib.HTTPSConnection(RIPPLE_ID_HOST, RIPPLE_ID_PORT)
-    conn.request("GET", url)
-    response = conn.getresponse()
+    if nodetype == "Offer":
+        record["account"] = node_fields["Account"]
+        record["sequence"] = node_fields.get("Sequence")
+        #prefer Prev fields if possible, since that better indicates the status of consumed offers
+        for fields in (prev_fields, new_fields, final_fields):
+            if "TakerPays" in fields and "TakerGets" in fields:
+                record["taker_pays"] = amount_record(fields["TakerPays"])
+                record["taker_gets"] = amount_record(fields["TakerGets"])
+                break
+    elif nodetype == "RippleState":
+        record["low"] = node_fields["LowLimit"]["issuer"]
+        record["high"] = node_fields["HighLimit"]["issuer"]
+    elif nodetype == "DirectoryNode":
+        record["offer_directory"] = "TakerPaysCurrency" in node_fields
+    elif nodetype == "AccountRoot":
+        # Strangely, sometimes you get a ModifiedNode with no Account
+        record["account"] = node_fields.get("Account")
+
+    if action == "modified":
+        changes = []
+        for holder, delta, currency, issuer in node_balance_changes(node):
+            change = {"account": holder, "currency": currency, "issuer": issuer}
+            if issuer is None:
+                change["delta"] = format_drops(delta)
+                change["drops"] = str(delta)
+            else:
+                change["delta"] = format_value(delta)
+            changes.append(change)
+        record["balance_changes"] = changes
+    return record
 
-    s = response.read()
-    response_json = json.loads(s.decode("utf-8"))
+def memo_record(wrapper):
+    """
+    A memo's raw hex fields, plus their text ("type", "format", "data"),
+    or None where a field is missing or isn't UTF-8 text.
+    """
+    memo = wrapper["Memo"]
+    fields = (("MemoType", "type"), ("MemoFormat", "format"),
+              ("MemoData", "data"))
+    record = OrderedDict((key, None) for field, key in fields)
+    for field, key in fields:
+        if field in memo:
+            record[field] = memo[field]
+            try:
+                record[key] = decode_hex(memo[field])
+            except (TypeError, ValueError):
+                pass
+    return record
 
-    if "exists" in response_json and response_json["exists"]:
-        username = "~"+response_json["username"]
-        tx_parties[address] = "~"+username
-        has_name = True
+def tx_record(tx_json, ctx=None, ledger=None, parties=True):
+    """
+    Structured explanation of a transaction, in the format returned by the
+    tx command. If you already have the header of the ledger it's in (with
+    a transaction_count), pass it as ledger to skip looking it up. Leave
+    out the parties (and their name lookups) with parties=False.
+    """
+    if ctx is None:
+        ctx = SplainContext()
+    if ledger is None:
+        try:
+            ledger = lookup_ledger_header(tx_json["ledger_index"], tx_count=True)
+        except KeyError:
+            ledger = None
+    tx_type = tx_json["TransactionType"]
+    tx_meta = tx_json["meta"]
+    record = OrderedDict([
+        ("kind", "transaction"),
+        ("hash", tx_json.get("hash")),
+        ("transaction_type", tx_type),
+        ("account", tx_json["Account"]),
+        ("flags", TX_FLAG_TABLES.get(tx_type, TX_COMMON_FLAGS).decode(
+                      tx_json.get("Flags", 0))),
+        ("fee", amount_record(tx_json["Fee"])),
+        ("result", tx_meta["TransactionResult"]),
+        ("validated", tx_json.get("validated", False)),
+        ("ledger_index", tx_json["ledger_index"]),
+        ("transaction_index", tx_meta.get("TransactionIndex")),
+    ])
+    if ledger:
+        record["close_time"] = ledger["close_time"]
+        record["close_time_human"] = ledger["close_time_human"]
+        if "transaction_count" in ledger:
+            record["ledger_transaction_count"] = ledger["transaction_count"]
+    for field in ("Destination", "DestinationTag", "SourceTag",
+                  "OfferSequence", "Owner", "SettleDelay", "CancelAfter",
+                  "FinishAfter", "Condition", "Fulfillment", "Amendment",
+                  "BaseFee", "ReferenceFeeUnits", "ReserveBase",
+                  "ReserveIncrement"):
+        if field in tx_json:
+            record[field] = tx_json[field]
+    if "Amendment" in tx_json:
+        record["amendment_name"] = AMENDMENTS.get(tx_json["Amendment"])
+    for field in ("Amount", "SendMax", "DeliverMin", "TakerGets", "TakerPays"):
+        if field in tx_json:
+            record[field] = amount_record(tx_json[field])
+    if "delivered_amount" in tx_meta and tx_meta["delivered_amount"] != "unavailable":
+        record["delivered_amount"] = amount_record(tx_meta["delivered_amount"])
+    if "Memos" in tx_json:
+        record["memos"] = [memo_record(wrapper) for wrapper in tx_json["Memos"]]
+    if "Paths" in tx_json:
+        record["paths"] = [[dict((key, value) for key, value in step.items()
+                                 if key != "type_hex")
+                            for step in path]
+                           for path in tx_json["Paths"]]
+    if "AffectedNodes" in tx_meta:
+        record["nodes"] = [node_record(wrapper)
+                           for wrapper in tx_meta["AffectedNodes"]]
+    if parties:
+        record["parties"] = parties_record(tx_addresses(tx_json), ctx)
+    return record
+
+def account_record(account, ctx=None, parties=True):
+    if ctx is None:
+        ctx = SplainContext()
+    record = OrderedDict([
+        ("kind", "account"),
+        ("account", account["Account"]),
+        ("balance", amount_record(account["Balance"])),
+        ("owner_count", account["OwnerCount"]),
+        ("reserve", calculate_reserve(account["OwnerCount"])),
+        ("flags", LEDGER_FLAG_TABLES["AccountRoot"].decode(account["Flags"])),
+    ])
+    for field in ("PreviousTxnID", "PreviousTxnLgrSeq", "AccountTxnID",
+                  "TransferRate", "MessageKey", "urlgravatar"):
+        if field in account:
+            record[field] = account[field]
+    if "PreviousTxnLgrSeq" in account and "PreviousTxnID" in account:
+        try:
+            previoustxn_ledger = lookup_ledger_header(account["PreviousTxnLgrSeq"])
+            record["previous_txn_close_time_human"] = previoustxn_ledger["close_time_human"]
+        except KeyError:
+            pass
+    if "TransferRate" in account and account["TransferRate"] != 0 and \
+            account["TransferRate"] != 1000000000:
+        record["transfer_fee"] = calculate_transfer_fee(account["TransferRate"])
+    if "Domain" in account:
+        record["domain"] = decode_hex(account["Domain"])
+    if parties:
+        record["parties"] = parties_record([account["Account"]], ctx)
+    return record
+
+def trust_line_record(trustline, ctx=None, parties=True):
+    if ctx is None:
+        ctx = SplainContext()
+    lownode = trustline["LowLimit"]["issuer"]
+    highnode = trustline["HighLimit"]["issuer"]
+    flags = trustline["Flags"]
+    record = OrderedDict([
+        ("kind", "trust_line"),
+        ("currency", trustline["Balance"]["currency"]),
+        ("low", lownode),
+        ("high", highnode),
+        ("balance", trustline["Balance"]["value"]), # positive: low holds high's issuances
+        ("low_limit", trustline["LowLimit"]["value"]),
+        ("high_limit", trustline["HighLimit"]["value"]),
+        ("flags", LEDGER_FLAG_TABLES["RippleState"].decode(flags)),
+        ("low_flags", RIPPLE_STATE_LOW_FLAGS.names(flags)),
+        ("high_flags", RIPPLE_STATE_HIGH_FLAGS.names(flags)),
+        ("unknown_flags", LEDGER_FLAG_TABLES["RippleState"].unknown(flags)),
+        ("low_reserve", bool(flags & lsfLowReserve)),
+        ("high_reserve", bool(flags & lsfHighReserve)),
+    ])
+    for field in ("LowQualityIn", "LowQualityOut", "HighQualityIn",
+                  "HighQualityOut", "LowNode", "HighNode"):
+        if field in trustline:
+            record[field] = trustline[field]
+    if parties:
+        record["parties"] = parties_record([lownode, highnode], ctx)
+    return record
+
+def offer_record(offer, ctx=None, parties=True):
+    if ctx is None:
+        ctx = SplainContext()
+    record = OrderedDict([
+        ("kind", "offer"),
+        ("account", offer["Account"]),
+        ("sequence", offer["Sequence"]),
+        ("taker_gets", amount_record(offer["TakerGets"])),
+        ("taker_pays", amount_record(offer["TakerPays"])),
+        ("flags", LEDGER_FLAG_TABLES["Offer"].decode(offer["Flags"])),
+    ])
+    for field in ("Expiration", "OwnerNode", "BookDirectory", "BookNode"):
+        if field in offer:
+            record[field] = offer[field]
+    if "Expiration" in offer:
+        validated_ledger = lookup_ledger_header("validated")
+        record["expired"] = validated_ledger["close_time"] > offer["Expiration"]
+    if parties:
+        record["parties"] = parties_record([offer["Account"]], ctx)
+    return record
+
+def render_json(record):
+    """
+    Compact, single-line JSON for a record.
+    """
+    return json.dumps(record, separators=(",", ":"))
+
+def render_msgpack(record):
+    if msgpack is None:
+        raise ImportError("msgpack isn't installed")
+    return msgpack.packb(record)
+
+# id.ripple.com client ----------------------
+class NameServiceUnavailable(Exception):
+    """
+    id.ripple.com couldn't answer in time (or at all).
+    """
+    pass
+
+class NameLookupTimeout(NameServiceUnavailable):
+    """
+    A lookup ran out of the caller's time (due) before id.ripple.com could
+    answer. That says nothing about the service, so it doesn't count
+    against the circuit breaker.
+    """
+    def __init__(self, message, due):
+        NameServiceUnavailable.__init__(self, message)
+        self.due = due
+
+class TokenBucket(object):
+    """
+    Thread-safe rate limiter that allows rate calls per second on average,
+    and bursts of up to burst calls at once.
+    """
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self, due=None):
+        """
+        Take a token, waiting for one if necessary. Returns False (without
+        taking one) if that would mean waiting past the time due.
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.burst,
+                                   self._tokens + (now - self._updated)*self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if due is not None and now + wait > due:
+                return False
+            time.sleep(wait)
+
+class CircuitBreaker(object):
+    """
+    Stops calls to a service that keeps failing. After max_failures failed
+    calls in a row it opens, and allow() says no for cooldown seconds.
+    Then it lets one call through to try the service again, and closes if
+    that one succeeds or stays open for another cooldown if not.
+    """
+    def __init__(self, name, max_failures, cooldown):
+        self.name = name
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None # when it last opened, or None if it's closed
+        self._trying = False
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        """
+        True if calls are being stopped right now.
+        """
+        with self._lock:
+            return self.opened is not None and \
+                    (self._trying or time.time() - self.opened < self.cooldown)
+
+    def allow(self):
+        with self._lock:
+            if self.opened is None:
+                return True
+            if not self._trying and time.time() - self.opened >= self.cooldown:
+                self._trying = True
+                return True
+            return False
+
+    def abandoned(self):
+        """
+        A call that allow() let through gave up without an answer either
+        way, so let another one try.
+        """
+        with self._lock:
+            self._trying = False
+
+    def succeeded(self):
+        with self._lock:
+            if self.opened is not None:
+                warn("%s is back" % self.name)
+            self.failures = 0
+            self.opened = None
+            self._trying = False
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+            if self._trying or self.failures >= self.max_failures:
+                if self.opened is None:
+                    warn("%s isn't responding; not asking it again for %d seconds" %
+                         (self.name, self.cooldown))
+                self.opened = time.time()
+                self._trying = False
+
+class NameServiceClient(object):
+    """
+    Client for id.ripple.com's user API that can't hold up an explanation
+    for long: requests go over a pooled connection with a socket timeout,
+    are rate limited with a TokenBucket, and are retried with exponential
+    backoff. If the service keeps failing, a CircuitBreaker stops asking it
+    for a while, and get_user raises NameServiceUnavailable right away, so
+    callers can show addresses instead of names. The server is
+    RIPPLE_ID_HOST:RIPPLE_ID_PORT.
+    """
+    def __init__(self, timeout=RIPPLE_ID_TIMEOUT, rate=RIPPLE_ID_RATE,
+                 burst=RIPPLE_ID_BURST, retries=RIPPLE_ID_RETRIES,
+                 backoff=RIPPLE_ID_BACKOFF, max_failures=RIPPLE_ID_MAX_FAILURES,
+                 cooldown=RIPPLE_ID_COOLDOWN):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker("The Ripple Name service", max_failures,
+                                      cooldown)
+
+    def get_user(self, name_or_address, due=None):
+        """
+        Look up a Ripple Name (without tilde) or an address, and return the
+        response, which has "exists" and, if it's true, "username" and
+        "address". Gives up at the time due, if given (not counting a
+        request that's already been sent, which can take up to timeout),
+        with NameLookupTimeout. Raises NameServiceUnavailable if the
+        service is failing; only those failures count against the breaker.
+        """
+        unavailable = NameServiceUnavailable("The Ripple Name service is unavailable")
+        if self.breaker.is_open():
+            tracer.count("names.unavailable")
+            raise unavailable
+        if not self.bucket.acquire(due):
+            tracer.count("names.rate_limited")
+            raise NameLookupTimeout("Too many Ripple Name lookups", due)
+        if not self.breaker.allow():
+            tracer.count("names.unavailable")
+            raise unavailable
+
+        pool = get_connection_pool(RIPPLE_ID_HOST, RIPPLE_ID_PORT,
+                                   https=RIPPLE_ID_HTTPS, timeout=self.timeout)
+        url = "/v1/user/%s" % name_or_address
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.backoff * 2**(attempt-1) * random.uniform(0.5, 1.5)
+                if due is not None and time.time() + delay > due:
+                    raise self._out_of_time(name_or_address, due)
+                tracer.count("names.retries")
+                time.sleep(delay)
+                if not self.bucket.acquire(due):
+                    raise self._out_of_time(name_or_address, due)
+            try:
+                status, s = pool.request("GET", url)
+                tracer.count("names.bytes_received", len(s))
+                if status == 429 or status >= 500:
+                    error = "HTTP %d" % status
+                    continue
+                response_json = json.loads(s.decode("utf-8"))
+            except (httplib.HTTPException, socket.error, ValueError) as e:
+                error = e
+                continue
+            self.breaker.succeeded()
+            return response_json
+        # only failures that are the service's fault get here
+        self.breaker.failed()
+        tracer.count("names.errors")
+        raise NameServiceUnavailable("Couldn't look up %s: %s" % (name_or_address, error))
+
+    def _out_of_time(self, name_or_address, due):
+        self.breaker.abandoned()
+        tracer.count("names.past_deadline")
+        return NameLookupTimeout("Out of time to look up %s" % name_or_address, due)
+
+name_service = NameServiceClient()
+
+# rippleid utils ----------------------------
+class NameCache(object):
+    """
+    In-memory cache of Ripple Names that keeps address->name and name->address
+    maps in sync, so lookups in either direction take constant time. Names
+    are stored without the tilde; None means the address has no Ripple Name.
+    Like NameStore, entries expire ttl seconds (unknown_ttl for addresses
+    with no name) after they were fetched, so long-running processes pick
+    up changed names. Safe to share between threads.
+    """
+    def __init__(self, ttl=NAME_TTL, unknown_ttl=UNKNOWN_NAME_TTL):
+        self.ttl = ttl
+        self.unknown_ttl = unknown_ttl
+        self._names = {} # address -> (name, expires)
+        self._addresses = {} # keyed by lowercase name
+        self._lock = threading.Lock()
+
+    def _name(self, address):
+        """
+        (True, name) if the address has an unexpired entry, else (False, None).
+        """
+        entry = self._names.get(address)
+        if entry is None or entry[1] <= time.time():
+            return False, None
+        return True, entry[0]
+
+    def __contains__(self, address):
+        return self._name(address)[0]
+
+    def __len__(self):
+        return len(self._names)
+
+    def set(self, address, username, fetched=None):
+        """
+        Record an address's name. username can be "~name", "name", or
+        the address itself / None if it has no name. fetched is when it
+        was looked up (default: now).
+        """
+        if username and username != address:
+            name = username.lstrip("~")
+            ttl = self.ttl
+        else:
+            name = None
+            ttl = self.unknown_ttl
+        if fetched is None:
+            fetched = time.time()
+        with self._lock:
+            old_name = self._names.get(address, (None,))[0]
+            if old_name is not None and self._addresses.get(old_name.lower()) == address:
+                del self._addresses[old_name.lower()]
+            self._names[address] = (name, fetched + ttl)
+            if name is not None:
+                self._addresses[name.lower()] = address
+
+    def username(self, address):
+        """
+        Returns "~name", the address itself if it has no name, or None if
+        the address isn't cached or its entry has expired.
+        """
+        found, name = self._name(address)
+        if not found:
+            return None
+        if name is None:
+            return address
+        return "~"+name
+
+    def address(self, name):
+        """
+        Returns the address with the given Ripple Name (tilde optional), or
+        None if it isn't cached or its entry has expired.
+        """
+        address = self._addresses.get(name.lstrip("~").lower())
+        if address is None or not self._name(address)[0]:
+            return None
+        return address
+
+    def clear(self):
+        with self._lock:
+            self._names.clear()
+            self._addresses.clear()
+
+known_acts = NameCache()
+def lookup_rippleid(address, tilde=True, ctx=None):
+    """
+    Get the Ripple Name for an address, or the address itself if it has
+    none. If a SplainContext is given, the address is recorded as one of
+    its parties and looked up in its name cache.
+    """
+    if ctx is None:
+        names = known_acts
     else:
-        tx_parties[address] = "Unknown Account"
+        names = ctx.names
+
+    username = names.username(address)
+    if username is None and name_store:
+        username, fetched = name_store.entry(address)
+        if username:
+            tracer.count("cache.name_store.hit")
+            names.set(address, username, fetched)
+        else:
+            tracer.count("cache.name_store.miss")
+    if username is None:
+        tracer.count("cache.names.miss")
+    else:
+        tracer.count("cache.names.hit")
+    if username is None and not NAME_LOOKUPS:
         username = address
-        has_name = False
+    elif username is None:
+        due = ctx.names_due() if ctx is not None else None
+        try:
+            if due is not None and time.time() >= due:
+                tracer.count("names.past_deadline")
+                raise NameLookupTimeout("Out of time for name lookups", due)
+            username = shared_fetch_rippleid(address, due)
+        except NameServiceUnavailable:
+            # show the address this time, and try again next time
+            username = address
+            if ctx is not None:
+                ctx.names_missing = True
+        else:
+            # Add it to the cache so we don't have to http again
+            remember_rippleid(address, username, names)
 
-    # Add it to known_acts so we don't have to http again
-    known_acts[address] = username
+    if ctx is not None:
+        ctx.add_party(address, username)
 
+    # only return a tilde if requested AND a name
     if not tilde:
         return username.replace("~","")
     else:
         return username
 
+def fetch_rippleid(address, due=None):
+    """
+    Ask id.ripple.com for an address's Ripple Name. Returns the name with a
+    tilde, or the address itself if it has no name. Raises
+    NameLookupTimeout if it can't tell by the time due, or
+    NameServiceUnavailable if the service is down.
+    """
+    with tracer.span("names.fetch"):
+        response_json = name_service.get_user(address, due)
+
+    if "exists" in response_json and response_json["exists"]:
+        return "~"+response_json["username"]
+    else:
+        return address
+
+def shared_fetch_rippleid(address, due=None):
+    """
+    fetch_rippleid, but if another thread is already looking the address
+    up, wait for its answer instead, until the time due. If that lookup ran
+    out of the other thread's time and there's more of ours left, try
+    again with ours.
+    """
+    while True:
+        try:
+            return inflight.do_by(due, ("rippleid", address), fetch_rippleid,
+                                  address, due)
+        except InFlightTimeout:
+            tracer.count("names.past_deadline")
+            raise NameLookupTimeout("Out of time for name lookups", due)
+        except NameLookupTimeout as e:
+            if due is not None and due <= e.due:
+                raise
+
+def prefetch_rippleids(addresses, workers=NAME_LOOKUP_WORKERS, names=None,
+                       due=None):
+    """
+    Look up Ripple Names for all the given addresses that aren't in the
+    name cache (known_acts by default) yet, using a pool of worker threads.
+    Failed lookups are left out of the cache so lookup_rippleid can try
+    again later. If due is given, this returns by that time (time.time())
+    even if some lookups haven't finished; they finish in the background.
+    """
+    if names is None:
+        names = known_acts
+    addresses = set(addresses)
+    pending = Queue()
+    for address in addresses:
+        if address in names:
+            continue
+        username, fetched = name_store.entry(address) if name_store else (None, None)
+        if username:
+            names.set(address, username, fetched)
+        else:
+            pending.put(address)
+    tracer.count("cache.prefetched_names.hit", len(addresses) - pending.qsize())
+    tracer.count("cache.prefetched_names.miss", pending.qsize())
+    if not NAME_LOOKUPS or pending.empty():
+        return
+
+    def worker(span):
+        with tracer.continued(span):
+            while due is None or time.time() < due:
+                try:
+                    address = pending.get_nowait()
+                except Empty:
+                    return
+                try:
+                    remember_rippleid(address,
+                                      shared_fetch_rippleid(address, due), names)
+                except NameServiceUnavailable:
+                    pass # lookup_rippleid will show the address
+                except Exception as e:
+                    warn("Couldn't look up %s: %s" % (address, e))
+
+    with tracer.span("names.prefetch", lookups=pending.qsize()) as span:
+        threads = [threading.Thread(target=worker, args=(span,))
+                   for i in range(min(workers, pending.qsize()))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join(None if due is None else max(due - time.time(), 0))
+        if any(t.is_alive() for t in threads):
+            tracer.count("names.prefetch_timeouts")
+
+def names_due():
+    """
+    time.time() NAME_DEADLINE seconds from now, or None if there's no limit.
+    """
+    if NAME_DEADLINE is None:
+        return None
+    return time.time() + NAME_DEADLINE
+
+ADDRESS_FIELDS = set(["Account", "Destination", "Owner", "Issuer",
+                      "RegularKey", "account", "issuer"])
+ACCOUNT_ONE = "rrrrrrrrrrrrrrrrrrrrBZbvji" # placeholder issuer in RippleState balances
+def tx_addresses(tx_json, paths=True, meta=True, max_nodes=None):
+    """
+    Collect every address that appears in a transaction, including its
+    Paths (unless paths is False) and its metadata (unless meta is False;
+    if max_nodes is set, only the first max_nodes AffectedNodes).
+    """
+    found = set()
+    def walk(obj):
+        if type(obj) == dict:
+            for key,value in obj.items():
+                if key in ADDRESS_FIELDS and is_string(value):
+                    found.add(value)
+                else:
+                    walk(value)
+        elif type(obj) == list:
+            for item in obj:
+                walk(item)
+    for key,value in tx_json.items():
+        if key in ("meta", "metaData"):
+            if meta:
+                for meta_key,meta_value in value.items():
+                    if meta_key == "AffectedNodes" and max_nodes is not None:
+                        meta_value = meta_value[:max_nodes]
+                    walk(meta_value)
+        elif key == "Paths":
+            if paths:
+                walk(value)
+        elif key in ADDRESS_FIELDS and is_string(value):
+            found.add(value)
+        else:
+            walk(value)
+    found.discard(ACCOUNT_ONE)
+    return found
+
 def lookup_ripple_address(name):
     global known_acts
     #strip leading tilde
     if name[0] == "~":
         name = name[1:]
 
-    def inverse_lookup(needle, haystack):
-        for key,value in haystack.items():
-            if value == needle:
-                return key
+    address = known_acts.address(name)
+    if address:
+        return address
 
+    if name_store:
+        address = name_store.find_address(name)
+        username, fetched = name_store.entry(address) if address else (None, None)
+        if username:
+            # cache the name as stored, not as the user capitalized it
+            known_acts.set(address, username, fetched)
+            return address
+    if not NAME_LOOKUPS:
         raise KeyError
 
     try:
-        address = inverse_lookup(name, known_acts)
-        return address
-    except KeyError:
-        pass #gonna have to look it up below
-
-
-    #print("looking up %s" % name)
-    url = "/v1/user/%s" % name
-    conn = httplib.HTTPSConnection(RIPPLE_ID_HOST, RIPPLE_ID_PORT)
-    conn.request("GET", url)
-    response = conn.getresponse()
-
-    s = response.read()
-    response_json = json.loads(s.decode("utf-8"))
-
+        response_json = inflight.do(("ripple_address", name.lower()),
+                                    fetch_ripple_address, name)
+    except NameServiceUnavailable as e:
+        raise KeyError(str(e))
     if "address" in response_json:
         address = response_json["address"]
-        known_acts[address] = name
+        remember_rippleid(address, response_json.get("username", name))
         return address
     else:
         raise KeyError
 
+def fetch_ripple_address(name):
+    """
+    Ask id.ripple.com about a Ripple Name (without tilde). Returns its
+    response, which has an "address" if the name exists.
+    """
+    with tracer.span("names.resolve"):
+        return name_service.get_user(name)
+
+def remember_rippleid(address, username, names=None):
+    """
+    Record a lookup result in the name cache (known_acts by default) and, if
+    one is open, the name store.
+    """
+    if names is None:
+        names = known_acts
+    names.set(address, username)
+    if name_store:
+        name_store.put(address, username)
+
 # Looking up all the ripple names takes a long time. Save that shit!
-def load_known_names(fname = PICKLE_FILE):
-    global known_acts
+class NameStore(SQLiteStore):
+    """
+    SQLite-backed cache of Ripple Name lookups, keyed by address and indexed
+    by name. Each result is written as soon as it's known, and entries
+    expire after NAME_TTL (or UNKNOWN_NAME_TTL for addresses with no name)
+    so they get refreshed.
+    """
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS names (
+            address TEXT PRIMARY KEY,
+            name TEXT,
+            fetched REAL NOT NULL)""",
+        # older stores have a case-sensitive index, which NOCASE lookups can't use
+        "DROP INDEX IF EXISTS names_by_name",
+        "CREATE INDEX IF NOT EXISTS names_by_name_nocase ON names (name COLLATE NOCASE)"
+    ]
+
+    def __init__(self, fname=NAMES_DB_FILE, ttl=NAME_TTL,
+                 unknown_ttl=UNKNOWN_NAME_TTL):
+        SQLiteStore.__init__(self, fname)
+        self.ttl = ttl
+        self.unknown_ttl = unknown_ttl
+
+    def get(self, address):
+        """
+        Returns the cached username (with tilde) or the address itself if it
+        is cached as having no name. Returns None if it isn't cached or the
+        entry has expired.
+        """
+        return self.entry(address)[0]
+
+    def entry(self, address):
+        """
+        Like get, but returns (username, time it was fetched), or
+        (None, None).
+        """
+        row = self._db().execute("SELECT name, fetched FROM names WHERE address = ?",
+                                 (address,)).fetchone()
+        if not row:
+            return None, None
+        name, fetched = row
+        if name is None:
+            if time.time() - fetched > self.unknown_ttl:
+                return None, None
+            return address, fetched
+        if time.time() - fetched > self.ttl:
+            return None, None
+        return "~"+name, fetched
+
+    def find_address(self, name):
+        """
+        Returns the address for a (tilde-less) Ripple Name, or None if no
+        unexpired entry has that name. Names are case-insensitive.
+        """
+        row = self._db().execute("SELECT address FROM names WHERE name = ? COLLATE NOCASE AND fetched > ?",
+                                 (name, time.time() - self.ttl)).fetchone()
+        if row:
+            return row[0]
+        return None
+
+    def put(self, address, username):
+        if username and username != address:
+            name = username.lstrip("~")
+        else:
+            name = None
+        db = self._db()
+        db.execute("INSERT OR REPLACE INTO names (address, name, fetched) VALUES (?, ?, ?)",
+                   (address, name, time.time()))
+        db.commit()
+
+    def is_empty(self):
+        return not self._db().execute("SELECT 1 FROM names LIMIT 1").fetchone()
+
+    def import_names(self, names):
+        """
+        Bulk-load an {address: username} dict, e.g. from the old pickle cache.
+        """
+        now = time.time()
+        rows = []
+        for address,username in names.items():
+            if username and username != address:
+                # lookup_ripple_address used to store names without the tilde
+                rows.append( (address, username.lstrip("~"), now) )
+            else:
+                rows.append( (address, None, now) )
+        db = self._db()
+        db.executemany("INSERT OR REPLACE INTO names (address, name, fetched) VALUES (?, ?, ?)",
+                       rows)
+        db.commit()
+
+name_store = None
+def load_known_names(fname = NAMES_DB_FILE):
+    """
+    Open the on-disk name store. Names are read from it as they're needed,
+    not all up front. If there's an old pickle cache and the store is new,
+    its contents are imported.
+    """
+    global name_store
     try:
-        with open(fname, "rb") as f:
-            known_acts = pickle.load(f)
-    except:
-        print("Info: Couldn't load names dictionary. This might be normal.")
+        name_store = NameStore(fname)
+    except sqlite3.Error as e:
+        print("Info: Couldn't open names database (%s). This might be normal." % e)
+        return
 
+    if name_store.is_empty() and os.path.exists(PICKLE_FILE):
+        try:
+            with open(PICKLE_FILE, "rb") as f:
+                name_store.import_names(pickle.load(f))
+        except:
+            print("Info: Couldn't import names from %s." % PICKLE_FILE)
 
-def save_known_names(fname = PICKLE_FILE):
-    global known_acts
-    with open(fname, "wb") as f:
-        pickle.dump(known_acts, f)
 
+def save_known_names():
+    """
+    Names are written to the store as they're looked up, so this only
+    closes this thread's connection to it.
+    """
+    if name_store:
+        name_store.close()
 
-# commandline operation ------------------------------
-if __name__ == "__main__":
-    USAGE_MESSAGE = "Proper usage:\nGet transaction:\n  %s tx_hash\nGet account:\n  %s account_address\nGet trust line:\n  %s address1 address2 currency\nGet order:\n  %s account_address order_sequence" % ((sys.argv[0],)*4)
 
-    if len(sys.argv) <2 or len(sys.argv)>4:
-        exit(USAGE_MESSAGE)
+# explanation caching -------------------------------
+# Once a transaction is validated, it and its explanation never change
+# (apart from Ripple Names), so there's no need to look it up twice.
+
+class ExplanationStore(SQLiteStore):
+    """
+    On-disk cache of validated transactions and their explanations, keyed
+    by transaction hash (and, for explanations, the options passed to
+    splain, as a string).
+    """
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS transactions (
+            tx_hash TEXT PRIMARY KEY,
+            tx_json TEXT NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS explanations (
+            tx_hash TEXT NOT NULL,
+            options TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created REAL NOT NULL,
+            PRIMARY KEY (tx_hash, options))"""
+    ]
+
+    def get_tx(self, tx_hash):
+        row = self._db().execute("SELECT tx_json FROM transactions WHERE tx_hash = ?",
+                                 (tx_hash,)).fetchone()
+        if row:
+            return json.loads(row[0])
+        return None
+
+    def put_tx(self, tx_hash, tx_json):
+        db = self._db()
+        db.execute("INSERT OR REPLACE INTO transactions (tx_hash, tx_json) VALUES (?, ?)",
+                   (tx_hash, json.dumps(tx_json)))
+        db.commit()
+
+    def get_explanation(self, tx_hash, options):
+        """
+        Returns (text, time created), or None if it isn't cached.
+        """
+        return self._db().execute("SELECT text, created FROM explanations WHERE tx_hash = ? AND options = ?",
+                                  (tx_hash, options)).fetchone()
+
+    def put_explanation(self, tx_hash, options, text, created):
+        db = self._db()
+        db.execute("INSERT OR REPLACE INTO explanations (tx_hash, options, text, created) VALUES (?, ?, ?, ?)",
+                   (tx_hash, options, text, created))
+        db.commit()
+
+tx_cache = LRUCache(EXPLANATION_CACHE_SIZE)
+explanation_cache = LRUCache(EXPLANATION_CACHE_SIZE)
+explanation_store = None
+def open_explanation_store(fname=EXPLANATION_CACHE_FILE):
+    global explanation_store
+    if fname:
+        explanation_store = ExplanationStore(fname)
+
+def cached_tx(tx_hash):
+    """
+    Like tx(), but validated transactions are served from the cache.
+    """
+    tx_hash = tx_hash.upper()
+    tx_json = tx_cache.get(tx_hash)
+    if tx_json is None and explanation_store:
+        tx_json = explanation_store.get_tx(tx_hash)
+        if tx_json is not None:
+            tx_cache.put(tx_hash, tx_json)
+    if tx_json is not None:
+        tracer.count("cache.tx.hit")
+        return tx_json
+
+    tracer.count("cache.tx.miss")
+    tx_json = tx(tx_hash)
+    if tx_json.get("validated"):
+        tx_cache.put(tx_hash, tx_json)
+        if explanation_store:
+            explanation_store.put_tx(tx_hash, tx_json)
+    return tx_json
+
+def explain_tx(tx_hash, verbose=True, ctx=None, max_nodes=None, summarize=False,
+               summarize_over=None):
+    """
+    Look up and explain a transaction by its hash. If summarize_over is
+    set, AffectedNodes are summarized when there are more than that many,
+    as if summarize were True. Explanations of validated transactions are
+    cached for EXPLANATION_TTL seconds; results that aren't validated yet
+    are never cached.
+    """
+    tx_hash = tx_hash.upper()
+    options = "verbose=%d max_nodes=%s summarize=%d" % (bool(verbose),
+                                                         max_nodes, summarize)
+    if summarize_over is not None:
+        options += " summarize_over=%d" % summarize_over
+    key = (tx_hash, options)
+    cached = explanation_cache.get(key)
+    if cached is None and explanation_store:
+        cached = explanation_store.get_explanation(tx_hash, options)
+        if cached is not None:
+            explanation_cache.put(key, cached)
+    if cached is not None:
+        text, created = cached
+        if time.time() - created < EXPLANATION_TTL:
+            tracer.count("cache.explanations.hit")
+            return text
+
+    tracer.count("cache.explanations.miss")
+    if ctx is None:
+        ctx = SplainContext()
+    tx_json = cached_tx(tx_hash)
+    if summarize_over is not None and \
+            len(tx_json.get("meta", {}).get("AffectedNodes", [])) > summarize_over:
+        summarize = True
+    text = splain(tx_json, verbose=verbose, ctx=ctx, dump_json=False,
+                  max_nodes=max_nodes, summarize=summarize)
+    # addresses standing in for names would stick around too long
+    if tx_json.get("validated") and not ctx.names_missing:
+        created = time.time()
+        explanation_cache.put(key, (text, created))
+        if explanation_store:
+            explanation_store.put_explanation(tx_hash, options, text, created)
+    return text
+
+# ledger splaining ----------------------------------
+
+def splain_ledger(ledger_index, verbose=True, max_nodes=None, summarize=False,
+                  as_json=False):
+    """
+    Explain every transaction in a ledger. The ledger is fetched once with
+    all its transactions, and the names of everyone involved are looked up
+    together before any text is built. Returns a list of (tx hash, text),
+    where text is a JSON record (see tx_record) instead of prose if as_json.
+    """
+    with tracer.span("splain.ledger", ledger=ledger_index):
+        header, transactions = lookup_ledger_transactions(ledger_index)
+
+        addresses = set()
+        for tx_json in transactions:
+            addresses.update(tx_addresses(tx_json, paths=verbose or as_json,
+                                          meta=(verbose and not summarize) or as_json,
+                                          max_nodes=None if as_json else max_nodes))
+        prefetch_rippleids(addresses, due=names_due())
+
+        if as_json:
+            return [(tx_json["hash"], render_json(tx_record(tx_json, ledger=header)))
+                    for tx_json in transactions]
+        return [(tx_json["hash"], splain(tx_json, verbose=verbose,
+                                         ctx=SplainContext(), dump_json=False,
+                                         ledger=header, max_nodes=max_nodes,
+                                         summarize=summarize))
+                for tx_json in transactions]
+
+def splain_ledgers(first, last, verbose=True, workers=BATCH_WORKERS,
+                   max_nodes=None, summarize=False, as_json=False):
+    """
+    Explain every transaction in ledgers first through last, working on
+    several ledgers at once. Yields (ledger index, tx hash, text) in order.
+    """
+    def explain(ledger_index):
+        return splain_ledger(ledger_index, verbose=verbose,
+                             max_nodes=max_nodes, summarize=summarize,
+                             as_json=as_json)
+
+    for ledger_index, explanations, error in imap_threaded(explain,
+                                range(first, last+1), workers=workers):
+        if error is not None:
+            warn("Couldn't explain ledger %d: %s" % (ledger_index, error))
+            continue
+        for tx_hash, text in explanations:
+            yield ledger_index, tx_hash, text
+
+# account history splaining -------------------------
+
+def splain_account_history(address, verbose=True, workers=BATCH_WORKERS,
+                           max_nodes=None, summarize=False, as_json=False,
+                           forward=False, ledger_index_min=-1,
+                           ledger_index_max=-1):
+    """
+    Explain every transaction that affected an account, newest first (or
+    oldest first if forward), streaming its history with account_tx_pages.
+    The names of everyone in a page are looked up together before it's
+    explained, and several transactions are explained at once, sharing the
+    name and ledger header caches. Yields (ledger index, tx hash, text) in
+    order; memory use stays bounded however long the history is.
+    """
+    def transactions():
+        for page in account_tx_pages(address, ledger_index_min,
+                                     ledger_index_max, forward=forward):
+            addresses = set()
+            for tx_json in page:
+                addresses.update(tx_addresses(tx_json, paths=verbose or as_json,
+                                              meta=(verbose and not summarize) or as_json,
+                                              max_nodes=None if as_json else max_nodes))
+            prefetch_rippleids(addresses, due=names_due())
+            for tx_json in page:
+                yield tx_json
+
+    def explain(tx_json):
+        if as_json:
+            return render_json(tx_record(tx_json))
+        return splain(tx_json, verbose=verbose, ctx=SplainContext(),
+                      dump_json=False, max_nodes=max_nodes,
+                      summarize=summarize)
+
+    for tx_json, text, error in imap_threaded(explain, transactions(),
+                                              workers=workers):
+        if tx_json is None:
+            raise error # couldn't get (more of) the history
+        if error is not None:
+            if as_json:
+                text = render_json({"hash": tx_json["hash"], "error": str(error)})
+            else:
+                text = "Couldn't explain %s: %s\n" % (tx_json["hash"], error)
+        yield tx_json.get("ledger_index"), tx_json["hash"], text
 
-    if len(sys.argv) == 2:
-        #either a tx hash or an account address
+# batch operation ------------------------------------
+def spec_kind(args):
+    """
+    What the commandline arguments args describe, without looking it up:
+    - [tx_hash] : "transaction"
+    - [address] or [~name] : "account"
+    - [address, sequence] : "offer"
+    - [address1, address2, currency] : "trust_line"
+    Returns None if args don't match any of those.
+    """
+    if len(args) == 1:
+        if is_account_address(args[0]) or is_ripple_name(args[0]):
+            return "account"
+        elif is_hash256(args[0]):
+            return "transaction"
 
-        load_known_names()
+    elif len(args) == 2:
+        #address + seq = offer
+        if is_account_address(args[0]) and is_uint(args[1]):
+            return "offer"
 
-        arg1 = sys.argv[1]
-        if is_account_address(arg1):
-            acct_json = account_info(arg1)
-            print(splain_account(acct_json))
-        elif is_hash256(arg1):
-            tx_json = tx(arg1)
-            print(splain(tx_json))
-        elif is_ripple_name(arg1):
+    elif len(args) == 3:
+        # address1 + address2 + currency = trust line
+        if is_account_address(args[0]) and is_account_address(args[1]) and is_currency_code(args[2]):
+            return "trust_line"
+
+    return None
+
+def lookup_spec(args):
+    """
+    Look up whatever the commandline arguments args describe (see
+    spec_kind). Returns a (kind, thing) pair. Transactions are returned as
+    just their hash, so callers can use the explanation cache. Raises
+    ValueError if args don't match any of the forms, or KeyError if the
+    thing can't be found.
+    """
+    kind = spec_kind(args)
+    if kind is None:
+        raise ValueError("Can't explain %s" % " ".join(args))
+
+    if kind == "transaction":
+        return kind, args[0]
+    elif kind == "account":
+        address = args[0]
+        if is_ripple_name(address):
             try:
-                address = lookup_ripple_address(arg1)
-            except KeyError:
-                print("Ripple Name %s not found." % arg1)
-                exit()
+                address = lookup_ripple_address(address)
+            except KeyError as e:
+                # not found, unless it says otherwise
+                raise KeyError(e.args[0] if e.args else
+                               "Ripple Name %s not found." % args[0])
+        return kind, account_info(address)
+    elif kind == "offer":
+        return kind, lookup_offer(args[0], int(args[1]))
+    else:
+        return kind, lookup_trustline(args[0], args[1], args[2])
 
-            acct_json = account_info(address)
-            print(splain_account(acct_json))
-        else:
-            exit(USAGE_MESSAGE)
+def explain_spec(args, ctx=None, dump_json=False, max_nodes=None,
+                 summarize=False):
+    """
+    Explain whatever the commandline arguments args describe (see
+    lookup_spec). max_nodes and summarize apply to transactions, as in
+    splain.
+    """
+    with tracer.span("explain", spec=" ".join(args)):
+        kind, thing = lookup_spec(args)
+        if kind == "transaction":
+            if dump_json:
+                return splain(cached_tx(thing), ctx=ctx, dump_json=True,
+                              max_nodes=max_nodes, summarize=summarize)
+            return explain_tx(thing, ctx=ctx, max_nodes=max_nodes,
+                              summarize=summarize)
+        with tracer.span("splain." + kind):
+            if kind == "account":
+                return splain_account(thing, ctx=ctx)
+            elif kind == "offer":
+                return splain_offer(thing, ctx=ctx)
+            else:
+                return splain_trust_line(thing, ctx=ctx)
 
-        save_known_names()
+def record_spec(args, ctx=None):
+    """
+    Like explain_spec, but returns a structured record instead of prose.
+    """
+    with tracer.span("explain", spec=" ".join(args)):
+        kind, thing = lookup_spec(args)
+        with tracer.span("record." + kind):
+            if kind == "transaction":
+                return tx_record(cached_tx(thing), ctx=ctx)
+            elif kind == "account":
+                return account_record(thing, ctx=ctx)
+            elif kind == "offer":
+                return offer_record(thing, ctx=ctx)
+            else:
+                return trust_line_record(thing, ctx=ctx)
 
-    if len(sys.argv) == 3:
-        #address + seq = offer
+def imap_threaded(func, items, workers=BATCH_WORKERS, ordered=True):
+    """
+    Like map(), but calls func on a pool of worker threads. Yields
+    (item, result, error) tuples, where error is the exception func raised
+    (if any), either in input order or as soon as each one finishes.
+    items is consumed lazily, a few at a time, so it can be a stream. If
+    iterating over items raises an exception, it's yielded last, as
+    (None, None, error).
+    """
+    todo = Queue(maxsize=workers*2)
+    done = Queue()
+
+    def worker():
+        while True:
+            job = todo.get()
+            if job is None:
+                return
+            i, item = job
+            try:
+                done.put( (i, item, func(item), None) )
+            except Exception as e:
+                done.put( (i, item, None, e) )
 
-        load_known_names()
+    def feed():
+        count = 0
+        try:
+            for item in items:
+                todo.put( (count, item) )
+                count += 1
+        except Exception as e:
+            done.put( (count, None, None, e) )
+            count += 1
+        for t in threads:
+            todo.put(None)
+        done.put( (None, count, None, None) ) # tells the consumer how many to expect
+
+    threads = [threading.Thread(target=worker) for i in range(workers)]
+    threads.append(threading.Thread(target=feed))
+    for t in threads:
+        t.daemon = True
+        t.start()
+    threads.pop() # don't send the feeder a stop signal
+
+    total = None
+    yielded = 0
+    waiting = {} # finished out of order, by index
+    while total is None or yielded < total:
+        i, item, result, error = done.get()
+        if i is None:
+            total = item
+            continue
+        if not ordered:
+            yield item, result, error
+            yielded += 1
+            continue
+        waiting[i] = (item, result, error)
+        while yielded in waiting:
+            yield waiting.pop(yielded)
+            yielded += 1
+
+def read_specs(lines):
+    """
+    Parse batch input: one explain_spec per line, with arguments separated by
+    whitespace. Blank lines and lines starting with # are skipped.
+    """
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line.split()
 
-        if is_account_address(sys.argv[1]) and is_uint(sys.argv[2]):
-            offer = lookup_offer(sys.argv[1], int(sys.argv[2]))
-            print(splain_offer(offer))
-        else:
-            exit(USAGE_MESSAGE)
+def splain_batch(lines, workers=BATCH_WORKERS, ordered=True, max_nodes=None,
+                 summarize=False, as_json=False):
+    """
+    Explain each spec in lines (see read_specs) on a pool of worker threads
+    that share the name, ledger and connection caches. Yields (spec, text)
+    pairs, where text is an error message if the spec couldn't be explained.
+    If as_json, text is a one-line JSON record instead (with an "error" key
+    if the spec couldn't be explained).
+    """
+    def explain(args):
+        if as_json:
+            return render_json(record_spec(args, ctx=SplainContext()))
+        return explain_spec(args, ctx=SplainContext(), max_nodes=max_nodes,
+                            summarize=summarize)
+
+    for args, text, error in imap_threaded(explain, read_specs(lines),
+                                           workers=workers, ordered=ordered):
+        if args is None:
+            raise error # couldn't read lines
+        spec = " ".join(args)
+        if error is not None:
+            if as_json:
+                text = render_json({"spec": spec, "error": str(error)})
+            else:
+                text = "Couldn't explain %s: %s\n" % (spec, error)
+        yield spec, text
 
-    if len(sys.argv) == 4:
-        # address1 + address2 + currency = trust line
+# commandline operation ------------------------------
+if __name__ == "__main__":
+    USAGE_MESSAGE = "Proper usage:\nGet transaction:\n  %s tx_hash\nGet account:\n  %s account_address\nGet trust line:\n  %s address1 address2 currency\nGet order:\n  %s account_address order_sequence\nExplain one of the above per line of a file (or - for stdin):\n  %s --batch file [--workers N] [--unordered]\nExplain all transactions in a ledger or range of ledgers:\n  %s --ledger first[-last] [--workers N]\nExplain an account's transactions, newest first:\n  %s --history account_address [--oldest-first] [--workers N]\nAdd --json to any of these for machine-readable output." % ((sys.argv[0],)*7)
+
+    parser = argparse.ArgumentParser(usage=USAGE_MESSAGE)
+    parser.add_argument("spec", nargs="*")
+    parser.add_argument("--batch", metavar="FILE")
+    parser.add_argument("--ledger", metavar="FIRST[-LAST]")
+    parser.add_argument("--history", metavar="ACCOUNT")
+    parser.add_argument("--oldest-first", action="store_true",
+                        help="with --history, start from the account's first transaction")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--unordered", action="store_true",
+                        help="print batch results as they finish")
+    parser.add_argument("--max-nodes", type=int,
+                        help="describe at most this many affected nodes per transaction")
+    parser.add_argument("--summary", action="store_true",
+                        help="summarize affected nodes instead of listing each one")
+    parser.add_argument("--cache-file", default=EXPLANATION_CACHE_FILE,
+                        help="keep validated transactions and explanations in this file")
+    parser.add_argument("--binary", action="store_true",
+                        help="fetch transactions in binary and decode them locally")
+    parser.add_argument("--offline", metavar="DUMPFILE", action="append",
+                        help="answer rippled commands from this dump file (can be repeated) instead of the network, and don't look up new Ripple Names")
+    parser.add_argument("--json", action="store_true",
+                        help="print structured records (one JSON object per line) instead of prose")
+    parser.add_argument("--trace", action="store_true",
+                        help="log where each explanation's time went to stderr")
+    cli_args = parser.parse_args()
+    if cli_args.trace:
+        set_tracer(Tracer(callback=span_logger()))
+    FETCH_BINARY = cli_args.binary
+    if cli_args.offline:
+        try:
+            set_data_source(DumpFileSource(cli_args.offline))
+        except (IOError, ValueError) as e:
+            exit("Couldn't read dump files: %s" % e)
+        NAME_LOOKUPS = False
+    open_explanation_store(cli_args.cache_file)
 
+    if cli_args.batch:
         load_known_names()
-
-        if is_account_address(sys.argv[1]) and is_account_address(sys.argv[2]) and is_currency_code(sys.argv[3]):
-            trustline = lookup_trustline(sys.argv[1], sys.argv[2], sys.argv[3])
-            print(splain_trust_line(trustline))
+        if cli_args.batch == "-":
+            infile = sys.stdin
         else:
+            infile = open(cli_args.batch)
+        for spec, text in splain_batch(infile, workers=cli_args.workers,
+                                       ordered=not cli_args.unordered,
+                                       max_nodes=cli_args.max_nodes,
+                                       summarize=cli_args.summary,
+                                       as_json=cli_args.json):
+            if cli_args.json:
+                print(text)
+                sys.stdout.flush()
+                continue
+            print("=== %s ===" % spec)
+            print(text)
+            sys.stdout.flush()
+        save_known_names()
+        exit()
+
+    if cli_args.ledger:
+        bounds = cli_args.ledger.split("-")
+        if len(bounds) > 2 or not all(is_uint(b) for b in bounds):
             exit(USAGE_MESSAGE)
+        first, last = int(bounds[0]), int(bounds[-1])
+        load_known_names()
+        for ledger_index, tx_hash, text in splain_ledgers(first, last,
+                                            workers=cli_args.workers,
+                                            max_nodes=cli_args.max_nodes,
+                                            summarize=cli_args.summary,
+                                            as_json=cli_args.json):
+            if cli_args.json:
+                print(text)
+                sys.stdout.flush()
+                continue
+            print("=== %s (ledger %d) ===" % (tx_hash, ledger_index))
+            print(text)
+            sys.stdout.flush()
+        save_known_names()
+        exit()
 
+    if cli_args.history:
+        load_known_names()
+        address = cli_args.history
+        try:
+            if is_ripple_name(address):
+                address = lookup_ripple_address(address)
+            elif not is_account_address(address):
+                exit(USAGE_MESSAGE)
+            for ledger_index, tx_hash, text in splain_account_history(address,
+                                            workers=cli_args.workers,
+                                            max_nodes=cli_args.max_nodes,
+                                            summarize=cli_args.summary,
+                                            as_json=cli_args.json,
+                                            forward=cli_args.oldest_first):
+                if cli_args.json:
+                    print(text)
+                    sys.stdout.flush()
+                    continue
+                print("=== %s (ledger %s) ===" % (tx_hash, ledger_index))
+                print(text)
+                sys.stdout.flush()
+        except KeyError as e:
+            print(e.args[0] if e.args else "Couldn't find %s" % cli_args.history)
         save_known_names()
+        exit()
+
+    if spec_kind(cli_args.spec) is None:
+        exit(USAGE_MESSAGE)
+
+    load_known_names()
+    try:
+        if cli_args.json:
+            print(render_json(record_spec(cli_args.spec)))
+        elif len(cli_args.spec) == 1 and is_hash256(cli_args.spec[0]):
+            # print transactions as they're explained, with the list of
+            # parties at the end once it's complete
+            with tracer.span("explain", spec=cli_args.spec[0]):
+                tx_json = cached_tx(cli_args.spec[0])
+                print(dumpjson(tx_json))
+                print()
+                ctx = SplainContext()
+                with tracer.span("splain.transaction"):
+                    for sentence in splain_iter(tx_json, ctx=ctx,
+                                                max_nodes=cli_args.max_nodes,
+                                                summarize=cli_args.summary):
+                        sys.stdout.write(sentence)
+                        sys.stdout.flush()
+                print(parties(ctx))
+        else:
+            print(explain_spec(cli_args.spec, dump_json=True,
+                               max_nodes=cli_args.max_nodes,
+                               summarize=cli_args.summary))
+    except KeyError as e:
+        print(e.args[0])
+        exit()
+    except ValueError as e:
+        # bad data from rippled or a dump file; the spec itself was fine
+        exit("Couldn't explain %s: %s" % (" ".join(cli_args.spec), e))
+    save_known_names()